@@ -0,0 +1,73 @@
+"""Times ImportTree.cohesion() and the wide get_packages_df() on synthetic trees of increasing size and checks
+them against the previous row-by-row implementation.
+
+Usage: python benchmarks/bench_cohesion.py [--sizes 10 100 1000] [--skip-reference]
+"""
+import argparse
+import time
+import tracemalloc
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from py_import_tree.cohesion import compute_weight, get_dependency
+from synthetic import make_import_tree
+
+
+def reference_packages_df(tree, resolver_func):
+    full = tree.get_full_df()
+    dct, package_weight = resolver_func()
+    full['dependency'] = full['path'].astype(object).map(partial(get_dependency,
+                                                                 absolute_path_to_package_and_version_dict=dct))
+    res = pd.DataFrame({
+        'path': full['filename_path'],
+        'dependency': full['dependency'],
+        'full_definition': full['filename_path'] + ':' + full['type'] + ':' + full['name'],
+        'definition': full['type'] + ':' + full['name'],
+    })
+    res['dependency_weight'] = res['dependency'].map(package_weight)
+    ideal_weight_dict = res.groupby('full_definition').apply(compute_weight)
+    res['definition_ideal_weight'] = res['full_definition'].map(ideal_weight_dict)
+    actual_weight_dict = res.groupby('path').apply(compute_weight).to_dict()
+    res['definition_actual_weight'] = res['path'].map(actual_weight_dict)
+    res['cohesion_score'] = res['definition_ideal_weight'] / res['definition_actual_weight']
+    res.loc[res['definition_actual_weight'] < 1e-4, 'cohesion_score'] = 1.
+    res['neg_definition_actual_weight'] = -res['definition_actual_weight']
+    return res.sort_values(by=['cohesion_score', 'neg_definition_actual_weight'])
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    res = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return res, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--skip-reference', action='store_true')
+    args = parser.parse_args()
+    for files in args.sizes:
+        tree, resolver_func = make_import_tree(files)
+        cohesion, seconds, peak = measure(lambda: tree.cohesion(resolver_func))
+        _, wide_seconds, wide_peak = measure(lambda: tree.get_packages_df(resolver_func))
+        line = (f'{files:>6} files, {len(tree.definitions):>7} definitions: score {seconds:.3f}s '
+                f'{peak / 2 ** 20:.1f} MiB, wide DataFrame {wide_seconds:.3f}s {wide_peak / 2 ** 20:.1f} MiB')
+        if not args.skip_reference:
+            start = time.perf_counter()
+            reference = reference_packages_df(tree, resolver_func)
+            reference_seconds = time.perf_counter() - start
+            reference_score = reference.drop_duplicates(subset='definition')['cohesion_score'].mean()
+            assert np.isclose(cohesion.score, reference_score, rtol=0, atol=0), (cohesion.score, reference_score)
+            assert (cohesion.definitions['cohesion_score'].to_numpy() == reference['cohesion_score'].to_numpy()).all()
+            line += f' (reference {reference_seconds:.3f}s)'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
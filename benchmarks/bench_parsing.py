@@ -0,0 +1,36 @@
+"""Compares reading, parsing and visiting files in the current process with the parsing pool.
+
+Usage: python benchmarks/bench_parsing.py [--files 2000] [--definitions-per-file 50] [--processes 8]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from py_import_tree.import_tracker import ParsingPool
+from synthetic import write_source_files
+
+
+def run(filenames, processes):
+    start = time.perf_counter()
+    with ParsingPool(processes) as parsing_pool:
+        definitions = sum(len(analysis.definitions) for analysis in parsing_pool.analyze(filenames))
+    return definitions, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--definitions-per-file', type=int, default=50)
+    parser.add_argument('--processes', type=int, default=8)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as project_dir:
+        filenames = [str(f) for f in write_source_files(Path(project_dir), args.files, args.definitions_per_file)]
+        for processes in [1, args.processes]:
+            definitions, seconds = run(filenames, processes)
+            print(f'{processes:>3} processes: {len(filenames)} files, {definitions} definitions in {seconds:.2f}s '
+                  f'({len(filenames) / seconds:.0f} files/s)')
+
+
+if __name__ == '__main__':
+    main()
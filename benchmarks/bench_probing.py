@@ -0,0 +1,40 @@
+"""Compares the per-statement Process prober with the worker pool, fork server and static probers.
+
+Usage: python benchmarks/bench_probing.py [--statements 600] [--processes 8]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from py_import_tree.import_tracker import ImportTracker
+
+
+def write_project(directory: Path, statements: int, statements_per_file: int = 20):
+    for file_idx in range(0, statements, statements_per_file):
+        lines = [f'import json as json_{i}' for i in range(file_idx, min(file_idx + statements_per_file, statements))]
+        (directory / f'module_{file_idx}.py').write_text('\n'.join(lines) + '\n')
+
+
+def run(engine, project_dir, processes):
+    with tempfile.TemporaryDirectory() as output_dir:
+        tracker = ImportTracker(output_dir, probe_engine=engine)
+        start = time.perf_counter()
+        tracker.dump_for_directory(project_dir, max_concurrent_processes=processes)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--statements', type=int, default=600)
+    parser.add_argument('--processes', type=int, default=8)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as project_dir:
+        write_project(Path(project_dir), args.statements)
+        timings = {engine: run(engine, project_dir, args.processes) for engine in ['process', 'pool', 'forkserver', 'static']}
+    for engine, seconds in timings.items():
+        print(f'{engine:>8}: {seconds:.2f}s ({args.statements / seconds:.1f} probes/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Measures cold vs. warm site-packages indexing on a fake environment.
+
+Every index is checked against the original `get_dict_for_package_*` and `get_package_weight` helpers.
+
+Usage: python benchmarks/bench_site_index.py [--packages 300] [--files-per-package 50] [--workers 16]
+"""
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+from pathlib import Path
+
+from py_import_tree import site_index
+from synthetic import touch, write_fake_site_packages
+
+
+def write_edge_cases(site_packages: Path):
+    """Adds an `.egg-info` distribution, a symbolic link and a RECORD entry of a missing file."""
+    package_dir = site_packages / 'fake_egg'
+    package_dir.mkdir()
+    (package_dir / '__init__.py').write_text('#' * 100)
+    (package_dir / 'linked.py').symlink_to(package_dir / '__init__.py')
+    egg_info = site_packages / 'fake_egg-0.1.egg-info'
+    egg_info.mkdir()
+    (egg_info / 'installed-files.txt').write_text('../fake_egg/__init__.py\n../fake_egg/missing.py\n')
+    dist_info = next(site_packages.glob('*.dist-info'))
+    with open(dist_info / 'RECORD', 'a') as record_file:
+        record_file.write('missing/module.py,,\n')
+
+
+def reference_index(site_packages: Path):
+    resolver = {}
+    weights = {}
+    for child in site_index.get_distribution_dirs(site_packages):
+        if child.suffix == '.dist-info':
+            dct = site_index.get_dict_for_package_dist_info(child)
+        else:
+            dct = site_index.get_dict_for_package_egg_info(child)
+        resolver.update(dct)
+        package_name, version = child.stem.split('-', 1)
+        weights[f'{package_name}=={version}'] = site_index.get_package_weight(dct)
+    return resolver, weights
+
+
+def timed(site_packages, cache_dir, clear_memo, workers=None):
+    if clear_memo:
+        site_index._memo.clear()
+        site_index._merged_memo.clear()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        resolver, weights = site_index.get_absolute_path_to_package_and_version_dict([site_packages], cache_dir,
+                                                                                      workers)
+    seconds = time.perf_counter() - start
+    assert (resolver, dict(weights)) == reference_index(site_packages), 'index differs from the reference'
+    return seconds, len(resolver)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=int, default=300)
+    parser.add_argument('--files-per-package', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        site_packages = write_fake_site_packages(Path(tmp_dir) / 'site-packages', args.packages,
+                                                 args.files_per_package)
+        write_edge_cases(site_packages)
+        for workers in [1, args.workers]:
+            seconds, files = timed(site_packages, None, True, workers)
+            print(f'{f"cold, {workers} worker(s)":>22}: {seconds:.3f}s ({files} files)')
+        cache_dir = Path(tmp_dir) / 'cache'
+        runs = [('cold', True), ('warm (disk cache)', True), ('warm (in-process)', False)]
+        for name, clear_memo in runs:
+            seconds, files = timed(site_packages, cache_dir, clear_memo)
+            print(f'{name:>22}: {seconds:.3f}s ({files} files)')
+        touch(next(site_packages.glob('*.dist-info')))
+        seconds, files = timed(site_packages, cache_dir, False)
+        print(f'{"one package changed":>22}: {seconds:.3f}s ({files} files)')
+
+
+if __name__ == '__main__':
+    main()
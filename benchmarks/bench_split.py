@@ -0,0 +1,29 @@
+"""Times SplitRecommender on a synthetic tree.
+
+Usage: python benchmarks/bench_split.py [--files 1000] [--new-files 200] [--objective weight]
+"""
+import argparse
+import time
+
+from py_import_tree.split import recommend_splits
+from synthetic import make_import_tree
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--new-files', type=int, default=200)
+    parser.add_argument('--objective', choices=['score', 'weight'], default='weight')
+    args = parser.parse_args()
+    tree, resolver_func = make_import_tree(args.files)
+    engine = tree.get_what_if_engine(resolver_func)
+    score, weight = engine.score, engine.weight
+    start = time.perf_counter()
+    moves = recommend_splits(engine, new_files=args.new_files, objective=args.objective)
+    seconds = time.perf_counter() - start
+    print(f'{len(engine.definition_ids)} definitions, {len(moves)} moves in {seconds:.3f}s')
+    print(f'score {score:.4f} -> {engine.score:.4f}, weight {weight:.0f} -> {engine.weight:.0f}')
+
+
+if __name__ == '__main__':
+    main()
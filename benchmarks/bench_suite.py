@@ -0,0 +1,162 @@
+"""End to end benchmark of scanning a synthetic project and analyzing its dump, to track across versions.
+
+The project imports the distributions of a generated site-packages, so results do not depend on what is installed.
+Every phase runs in a forked process to measure its own peak memory. Each run appends one JSON line, with the
+version of the code (`git describe`), to `--history`; `--compare` prints the runs recorded there.
+
+Usage: python benchmarks/bench_suite.py [--files 200] [--definitions 50] [--imports 20] [--packages 100]
+                                        [--engine pool] [--processes 8] [--history bench_history.jsonl] [--compare]
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import subprocess
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+from synthetic import write_importable_site_packages, write_source_files
+
+
+def get_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _run_and_send(func, args, sender):
+    try:
+        res = func(*args)
+        # ru_maxrss is in kilobytes on Linux.
+        res['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        res['workers_peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+        sender.send(res)
+    except BaseException as e:
+        sender.send(e)
+        raise
+
+
+def run_isolated(func, *args):
+    """Runs `func` in a forked process, so that the peak RSS measured is only its own."""
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_and_send, args=(func, args, sender))
+    process.start()
+    sender.close()
+    res = receiver.recv()
+    process.join()
+    if isinstance(res, BaseException):
+        raise res
+    return res
+
+
+def scan(project_dir, site_packages, output_dir, engine, processes):
+    import sys
+
+    from py_import_tree import profiling
+    from py_import_tree.import_tracker import ImportTracker
+
+    # Probes are forked from this process, so they find the generated distributions too.
+    sys.path.insert(0, str(site_packages))
+    with profiling.profile() as profiler:
+        tracker = ImportTracker(output_dir, probe_engine=engine, verbose=False)
+        start = time.perf_counter()
+        tracker.dump_for_directory(project_dir, max_concurrent_processes=processes)
+        tracker.close()
+        seconds = time.perf_counter() - start
+    files = profiler.counters['files_analyzed']
+    return {'seconds': seconds, 'files': files, 'files_per_second': files / seconds, 'profile': profiler.to_dict()}
+
+
+def analyze(output_dir, site_packages):
+    from py_import_tree import profiling
+    from py_import_tree.cohesion import ImportTree
+    from py_import_tree.dump_query import DumpQuery
+    from py_import_tree.site_index import get_absolute_path_to_package_and_version_dict
+
+    resolver_func = partial(get_absolute_path_to_package_and_version_dict, [site_packages], cache_dir=None)
+    res = {}
+    with profiling.profile() as profiler:
+        start = time.perf_counter()
+        tree = ImportTree.from_dump(output_dir)
+        res['load_seconds'] = time.perf_counter() - start
+        # The site-packages index is memoized, so the cohesion latency below does not include indexing.
+        resolver_func()
+        start = time.perf_counter()
+        cohesion = tree.cohesion(resolver_func)
+        res['cohesion_seconds'] = time.perf_counter() - start
+        start = time.perf_counter()
+        res['packages_df_rows'] = len(cohesion.definitions)
+        res['packages_df_seconds'] = time.perf_counter() - start
+        start = time.perf_counter()
+        with DumpQuery(output_dir) as query:
+            query_score = query.get_score(resolver_func)
+        res['query_score_seconds'] = time.perf_counter() - start
+    res['score'] = cohesion.score
+    res['query_score'] = query_score
+    res['definitions'] = len(tree.definitions)
+    res['profile'] = profiler.to_dict()
+    return res
+
+
+def print_history(history: Path):
+    if not history.exists():
+        print(f'No runs recorded in {history}')
+        return
+    columns = ['version', 'files', 'engine', 'scan s', 'files/s', 'scan MB', 'cohesion s', 'packages_df s',
+               'analysis MB']
+    print(' '.join(f'{column:>14}' for column in columns))
+    with open(history) as in_file:
+        for line in in_file:
+            run = json.loads(line)
+            values = [run['version'], run['params']['files'], run['params']['engine'],
+                      f"{run['scan']['seconds']:.2f}", f"{run['scan']['files_per_second']:.1f}",
+                      f"{run['scan']['peak_rss_bytes'] / 2 ** 20:.0f}", f"{run['analysis']['cohesion_seconds']:.3f}",
+                      f"{run['analysis']['packages_df_seconds']:.3f}",
+                      f"{run['analysis']['peak_rss_bytes'] / 2 ** 20:.0f}"]
+            print(' '.join(f'{value:>14}' for value in values))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--definitions', type=int, default=50)
+    parser.add_argument('--imports', type=int, default=20)
+    parser.add_argument('--packages', type=int, default=100)
+    parser.add_argument('--engine', default='pool')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--history', type=Path, default=Path('bench_history.jsonl'))
+    parser.add_argument('--compare', action='store_true', help='only print the recorded runs')
+    args = parser.parse_args()
+    if args.compare:
+        print_history(args.history)
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        site_packages = write_importable_site_packages(tmp_dir / 'site-packages', args.packages)
+        write_source_files(tmp_dir / 'project', args.files, args.definitions, args.imports, packages=args.packages)
+        output_dir = tmp_dir / 'output'
+        run = {
+            'version': get_version(),
+            'time': time.time(),
+            'params': {'files': args.files, 'definitions': args.definitions, 'imports': args.imports,
+                       'packages': args.packages, 'engine': args.engine, 'processes': args.processes},
+            'scan': run_isolated(scan, tmp_dir / 'project', site_packages, output_dir, args.engine, args.processes),
+            'analysis': run_isolated(analyze, output_dir, site_packages),
+        }
+    with open(args.history, 'a') as out_file:
+        out_file.write(json.dumps(run) + '\n')
+    print(f"scan: {run['scan']['files']} files in {run['scan']['seconds']:.2f}s "
+          f"({run['scan']['files_per_second']:.1f} files/s), peak RSS {run['scan']['peak_rss_bytes'] / 2 ** 20:.0f}MB")
+    print(f"cohesion: {run['analysis']['cohesion_seconds']:.3f}s, "
+          f"packages_df: {run['analysis']['packages_df_seconds']:.3f}s, "
+          f"peak RSS {run['analysis']['peak_rss_bytes'] / 2 ** 20:.0f}MB")
+    print_history(args.history)
+
+
+if __name__ == '__main__':
+    main()
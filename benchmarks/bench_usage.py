@@ -0,0 +1,87 @@
+"""Compares re-visiting every definition with one visitor per definition against the single pass UsageVisitor.
+
+Usage: python benchmarks/bench_usage.py [--files 20] [--definitions-per-file 2000] [--imports-per-file 50]
+"""
+import argparse
+import ast
+import tempfile
+import time
+from copy import copy
+from pathlib import Path
+
+from py_import_tree.import_tracker import UsageVisitor
+from synthetic import write_source_files
+
+
+class PerDefinitionVisitor(ast.NodeVisitor):
+    """The previous approach: the module level visitor collects definitions without entering them."""
+
+    def __init__(self):
+        self.import_statements = {}
+        self.definitions = []
+
+    def store_import(self, node):
+        for i, alias in enumerate(node.names):
+            self.import_statements[alias.asname or alias.name] = node, i
+        self.generic_visit(node)
+
+    visit_Import = visit_ImportFrom = store_import
+
+    def visit_FunctionDef(self, node):
+        self.definitions.append(node)
+
+    visit_ClassDef = visit_FunctionDef
+
+
+class RejectingVisitor(ast.NodeVisitor):
+
+    def __init__(self, import_statements):
+        self.import_statements = import_statements
+        self.used = []
+
+    def visit_Name(self, name):
+        if name.id not in self.import_statements:
+            return
+        node, i = self.import_statements[name.id]
+        statement = copy(node)
+        statement.names = [node.names[i]]
+        if name.lineno >= statement.lineno:
+            self.used.append(name.id)
+
+
+def per_definition(module):
+    visitor = PerDefinitionVisitor()
+    visitor.visit(module)
+    arcs = 0
+    for definition in visitor.definitions:
+        rejecting_visitor = RejectingVisitor(visitor.import_statements)
+        rejecting_visitor.visit(definition)
+        arcs += len(rejecting_visitor.used)
+    return arcs
+
+
+def single_pass(module):
+    visitor = UsageVisitor()
+    visitor.visit(module)
+    return sum(1 for definition_idx, _, _ in visitor.get_used_imports() if definition_idx is not None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--definitions-per-file', type=int, default=2000)
+    parser.add_argument('--imports-per-file', type=int, default=50)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as project_dir:
+        filenames = write_source_files(Path(project_dir), args.files, args.definitions_per_file, args.imports_per_file)
+        modules = [ast.parse(filename.read_text()) for filename in filenames]
+    for name, analyze in [('per-definition', per_definition), ('single pass', single_pass)]:
+        start = time.perf_counter()
+        arcs = sum(analyze(module) for module in modules)
+        seconds = time.perf_counter() - start
+        print(f'{name:>14}: {arcs} arcs in {seconds:.2f}s ({args.files * args.definitions_per_file / seconds:.0f} '
+              f'definitions/s)')
+
+
+if __name__ == '__main__':
+    main()
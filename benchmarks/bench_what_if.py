@@ -0,0 +1,46 @@
+"""Compares scoring candidate definition moves with WhatIfEngine against rebuilding the tree with
+ImportTree.what_if_definition_id_moves().cohesion().
+
+Usage: python benchmarks/bench_what_if.py [--files 300] [--moves 2000]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from synthetic import make_import_tree
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=300)
+    parser.add_argument('--moves', type=int, default=2000)
+    parser.add_argument('--reference-moves', type=int, default=20)
+    args = parser.parse_args()
+    tree, resolver_func = make_import_tree(args.files)
+    rng = random.Random(0)
+    definition_ids = tree.definitions['id'].tolist()
+    files = tree.filenames['path'].tolist()
+    moves = [(rng.choice(definition_ids), rng.choice(files)) for _ in range(args.moves)]
+
+    start = time.perf_counter()
+    engine = tree.get_what_if_engine(resolver_func)
+    print(f'Engine built in {time.perf_counter() - start:.3f}s')
+    start = time.perf_counter()
+    deltas = engine.score_moves(moves)
+    seconds = time.perf_counter() - start
+    print(f'{len(moves)} moves with WhatIfEngine: {seconds:.3f}s ({seconds / len(moves) * 1e6:.0f}us per move)')
+
+    start = time.perf_counter()
+    base_score = tree.cohesion(resolver_func).score
+    for (definition_id, to_file), delta in zip(moves[:args.reference_moves], deltas):
+        score = tree.what_if_definition_id_moves(definition_id, to_file).cohesion(resolver_func).score
+        assert np.isclose(score - base_score, delta, rtol=0, atol=1e-12), (score - base_score, delta)
+    seconds = time.perf_counter() - start
+    print(f'{args.reference_moves} moves with what_if_definition_id_moves: {seconds:.3f}s '
+          f'({seconds / args.reference_moves * 1e6:.0f}us per move)')
+
+
+if __name__ == '__main__':
+    main()
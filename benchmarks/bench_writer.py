@@ -0,0 +1,98 @@
+"""Compares per-row connect/commit inserts with the batched DumpWriter.
+
+Usage: python benchmarks/bench_writer.py [--files 2000] [--definitions-per-file 10] [--imports-per-file 10]
+"""
+import argparse
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from py_import_tree.storage import SCHEMA_PATH, DumpWriter
+
+
+def generate_rows(files, definitions_per_file, imports_per_file):
+    for file_idx in range(files):
+        filename = f'pkg/module_{file_idx}.py'
+        imports = [f'import dependency_{(file_idx + i) % 500}' for i in range(imports_per_file)]
+        definitions = [(f'function_{i}', imports[:i % imports_per_file + 1]) for i in range(definitions_per_file)]
+        yield filename, imports, definitions
+
+
+def connect_per_row(db_path):
+    """The connection of the writer before DumpWriter: the schema is created with the file, nothing else is run."""
+    should_init = not db_path.exists()
+    conn = sqlite3.connect(db_path)
+    if should_init:
+        with open(SCHEMA_PATH) as schema_file:
+            conn.executescript(schema_file.read())
+    return conn
+
+
+def write_per_row(db_path, rows):
+    count = 0
+    for filename, imports, definitions in rows:
+        with connect_per_row(db_path) as conn:
+            conn.execute('INSERT INTO FILENAMES(path) VALUES (?)', [filename])
+            conn.commit()
+        count += 1
+        for code_str in imports:
+            conn = connect_per_row(db_path)
+            conn.execute('INSERT INTO FILENAMES_TO_IMPORTS(filename_path, import_code_str) VALUES (?,?)',
+                         (filename, code_str))
+            conn.commit()
+            count += 1
+        for name, used in definitions:
+            with connect_per_row(db_path) as conn:
+                c = conn.execute('INSERT INTO DEFINITIONS(type, name, start_no, end_no, filename_path) '
+                                 'VALUES (?, ?, ?, ?, ?)', ['FunctionDef', name, 1, 2, filename])
+                conn.commit()
+                definition_id = c.lastrowid
+            count += 1
+            for code_str in used:
+                conn = connect_per_row(db_path)
+                conn.execute('INSERT INTO DEFINITIONS_TO_IMPORTS(definition_id, import_code_str) VALUES (?,?)',
+                             (definition_id, code_str))
+                conn.commit()
+                count += 1
+    return count
+
+
+def write_batched(db_path, rows):
+    count = 0
+    writer = DumpWriter(db_path)
+    for filename, imports, definitions in rows:
+        writer.insert_filename(filename)
+        count += 1
+        for code_str in imports:
+            writer.add('INSERT INTO FILENAMES_TO_IMPORTS(filename_path, import_code_str) VALUES (?,?)',
+                       (filename, code_str))
+            count += 1
+        for name, used in definitions:
+            definition_id = writer.insert_definition('FunctionDef', name, 1, 2, filename)
+            count += 1
+            for code_str in used:
+                writer.add('INSERT INTO DEFINITIONS_TO_IMPORTS(definition_id, import_code_str) VALUES (?,?)',
+                           (definition_id, code_str))
+                count += 1
+    writer.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--definitions-per-file', type=int, default=10)
+    parser.add_argument('--imports-per-file', type=int, default=10)
+    args = parser.parse_args()
+    for name, write in [('per-row', write_per_row), ('batched', write_batched)]:
+        with tempfile.TemporaryDirectory() as output_dir:
+            rows = generate_rows(args.files, args.definitions_per_file, args.imports_per_file)
+            start = time.perf_counter()
+            count = write(Path(output_dir) / 'modules.db', rows)
+            seconds = time.perf_counter() - start
+            print(f'{name:>8}: {count} rows in {seconds:.2f}s ({count / seconds:.0f} rows/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Generators of synthetic inputs shared by the benchmarks."""
+import os
+from pathlib import Path
+
+
+def write_fake_site_packages(directory: Path, packages: int = 300, files_per_package: int = 50,
+                             file_size: int = 2048):
+    directory.mkdir(parents=True, exist_ok=True)
+    content = b'#' * file_size
+    for package_idx in range(packages):
+        package_name = f'fake_package_{package_idx}'
+        version = f'1.{package_idx}.0'
+        package_dir = directory / package_name
+        package_dir.mkdir(exist_ok=True)
+        record_lines = []
+        for file_idx in range(files_per_package):
+            sub_dir = package_dir / f'sub_{file_idx % 5}'
+            sub_dir.mkdir(exist_ok=True)
+            file_path = sub_dir / f'module_{file_idx}.py'
+            file_path.write_bytes(content)
+            record_lines.append(f'{file_path.relative_to(directory)},sha256=,{file_size}')
+        dist_info = directory / f'{package_name}-{version}.dist-info'
+        dist_info.mkdir(exist_ok=True)
+        (dist_info / 'METADATA').write_text(f'Metadata-Version: 2.1\nName: {package_name}\nVersion: {version}\n')
+        record_lines += [f'{dist_info.name}/METADATA,,', f'{dist_info.name}/RECORD,,']
+        (dist_info / 'RECORD').write_text('\n'.join(record_lines) + '\n')
+    return directory
+
+
+def write_importable_site_packages(directory: Path, packages: int = 100, modules_per_package: int = 5,
+                                   dependencies_per_package: int = 2, module_size: int = 2048, seed: int = 0):
+    """Writes distributions `dependency_{i}`, with an `api.helper`, matching the imports of `write_source_files`.
+
+    Importing a package imports its modules and a few packages with higher indices, so statements bring in
+    dependency trees of different sizes, without cycles.
+    """
+    import random
+
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    padding = '#' * module_size
+    for package_idx in range(packages):
+        package_name = f'dependency_{package_idx}'
+        version = f'1.{package_idx}.0'
+        package_dir = directory / package_name
+        package_dir.mkdir(exist_ok=True)
+        later = list(range(package_idx + 1, packages))
+        dependencies = rng.sample(later, min(dependencies_per_package, len(later)))
+        modules = {'api.py': f'def helper(*args, **kwargs):\n    return args\n{padding}\n'}
+        for module_idx in range(modules_per_package):
+            modules[f'module_{module_idx}.py'] = f'VALUE = {module_idx}\n{padding}\n'
+        modules['__init__.py'] = '\n'.join([f'from . import module_{module_idx}' for module_idx in
+                                            range(modules_per_package)] +
+                                           [f'import dependency_{idx}' for idx in dependencies]) + '\n'
+        record_lines = []
+        for name, content in modules.items():
+            (package_dir / name).write_text(content)
+            record_lines.append(f'{package_name}/{name},sha256=,{len(content)}')
+        dist_info = directory / f'{package_name}-{version}.dist-info'
+        dist_info.mkdir(exist_ok=True)
+        (dist_info / 'METADATA').write_text(f'Metadata-Version: 2.1\nName: {package_name}\nVersion: {version}\n')
+        record_lines += [f'{dist_info.name}/METADATA,,', f'{dist_info.name}/RECORD,,']
+        (dist_info / 'RECORD').write_text('\n'.join(record_lines) + '\n')
+    return directory
+
+
+def write_source_files(directory: Path, files: int, definitions_per_file: int = 50, imports_per_file: int = 20,
+                       seed: int = 0, packages: int = 500):
+    """Writes a project of plain Python files whose functions and classes use some of the file's imports."""
+    import random
+
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    filenames = []
+    for file_idx in range(files):
+        names = [f'dependency_{(file_idx + i) % packages}' for i in range(imports_per_file)]
+        lines = [f'import {name}' if i % 2 == 0 else f'from {name}.api import helper as helper_{i}'
+                 for i, name in enumerate(names)]
+        bound = [name if i % 2 == 0 else f'helper_{i}' for i, name in enumerate(names)]
+        for def_idx in range(definitions_per_file):
+            used = rng.sample(bound, 3)
+            if def_idx % 5 == 0:
+                lines += ['', '', f'class Class{def_idx}:', f'    attribute = {used[0]}.default', '',
+                          '    def method(self, value):', f'        return {used[1]}.run(value, {used[2]})']
+            else:
+                lines += ['', '', f'def function_{def_idx}(value, *args, **kwargs):',
+                          f'    result = {used[0]}.transform(value, [item for item in args if item])',
+                          f'    if kwargs.get("check"):', f'        result = {used[1]}.check(result)',
+                          f'    return {used[2]}(result, **kwargs)']
+        filename = directory / f'module_{file_idx}.py'
+        filename.write_text('\n'.join(lines) + '\n')
+        filenames.append(filename)
+    return filenames
+
+
+def touch(path: Path):
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def make_import_tree(files: int, definitions_per_file: int = 20, imports_per_file: int = 10,
+                     modules_per_import: int = 20, packages: int = 300, seed: int = 0):
+    """Builds an in-memory ImportTree and a matching resolver without scanning or probing anything."""
+    import numpy as np
+    import pandas as pd
+
+    from py_import_tree.cohesion import ImportTree
+
+    rng = np.random.default_rng(seed)
+    code_strs = [f'import package_{i}' for i in range(packages)]
+    import_data = []
+    resolver = {}
+    for package_idx, code_str in enumerate(code_strs):
+        # Every import pulls in its own package plus a few others, like real dependency trees do.
+        pulled = {package_idx} | set(rng.choice(packages, size=3, replace=False).tolist())
+        for module_idx in range(modules_per_import):
+            dependency_idx = sorted(pulled)[module_idx % len(pulled)]
+            path = f'/site-packages/package_{dependency_idx}/module_{module_idx}.py'
+            resolver[path] = f'package_{dependency_idx}', '1.0'
+            import_data.append((f'package-{dependency_idx}', f'package_{dependency_idx}.module_{module_idx}', path,
+                                '1.0', code_str))
+    import_data = pd.DataFrame(import_data, columns=['root', 'module', 'path', 'version', 'code_str'])
+    import_data['id'] = np.arange(len(import_data)) + 1
+    filenames, definitions, definitions_to_imports, filenames_to_imports = [], [], [], []
+    for file_idx in range(files):
+        filename = f'project/module_{file_idx}.py'
+        filenames.append(filename)
+        file_imports = rng.choice(packages, size=imports_per_file, replace=False)
+        for import_idx in file_imports:
+            filenames_to_imports.append((filename, code_strs[import_idx]))
+        for def_idx in range(definitions_per_file):
+            definition_id = len(definitions) + 1
+            definitions.append((definition_id, 'FunctionDef', f'function_{def_idx}', 1, 2, filename))
+            used = rng.choice(file_imports, size=rng.integers(0, 3), replace=False)
+            for import_idx in used:
+                definitions_to_imports.append((definition_id, code_strs[import_idx]))
+    weights = {f'package_{i}==1.0': int(rng.integers(1, 10 ** 6)) for i in range(packages)}
+
+    def resolver_func():
+        return resolver, weights
+
+    tree = ImportTree(
+        imports=pd.DataFrame({'code_str': code_strs}),
+        import_data=import_data,
+        filenames=pd.DataFrame({'path': filenames}),
+        definitions=pd.DataFrame(definitions, columns=['id', 'type', 'name', 'start_no', 'end_no', 'filename_path']),
+        definitions_to_imports=pd.DataFrame([(i + 1,) + row for i, row in enumerate(definitions_to_imports)],
+                                            columns=['id', 'definition_id', 'import_code_str']),
+        filenames_to_imports=pd.DataFrame([(i + 1,) + row for i, row in enumerate(filenames_to_imports)],
+                                          columns=['id', 'filename_path', 'import_code_str']),
+    )
+    return tree, resolver_func
@@ -1,42 +1,22 @@
-import os
-import pickle
-import sqlite3
 from collections import defaultdict
-from copy import copy
-from dataclasses import dataclass
-from functools import partial
+from dataclasses import dataclass, field
+from functools import cached_property, partial
 from pathlib import Path
-from typing import Union
+from typing import Callable, List, Optional, Union
 
 import numpy as np
 import pandas as pd
-import site
-
-
-def get_package_dir_site_packages(path):
-    if path is None or pd.isna(path):
-        return Path('/')
-    path = Path(path)
-    tmp = copy(path)
-    while tmp.parent.stem != 'site-packages' and len(tmp.parts) > 1:
-        tmp = tmp.parent
-    return tmp
-
-
-def get_size_of_directory(start_path):
-    start_path = Path(start_path)
-    if start_path == Path('/'):
-        return 0
-    if os.path.isfile(start_path):
-        return os.path.getsize(start_path)
-    total_size = 0
-    for dirpath, dirnames, filenames in os.walk(start_path):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            # skip if it is symbolic link
-            if not os.path.islink(fp):
-                total_size += os.path.getsize(fp)
-    return total_size
+
+from py_import_tree import profiling
+from py_import_tree.cohesion_engine import CohesionEngine
+from py_import_tree.entry_point import EntryPointProfile, profile_entry_point
+from py_import_tree.import_cost import get_cost_column
+from py_import_tree.lazy_imports import find_lazy_import_candidates
+from py_import_tree.site_index import get_absolute_path_to_package_and_version_dict
+from py_import_tree.split import ProposedMove, recommend_splits
+from py_import_tree.static_resolver import DYNAMIC, STATIC
+from py_import_tree.what_if import WhatIfEngine
+from py_import_tree.storage import connect_read_only
 
 
 def compute_weight(sub_df):
@@ -45,95 +25,69 @@ def compute_weight(sub_df):
 
 @dataclass
 class Cohesion:
+    """The cohesion score, with the per-module `definitions` DataFrame built only when it is first accessed."""
     score: float
-    definitions: pd.DataFrame
+    definitions_factory: Callable[[], pd.DataFrame] = field(repr=False, compare=False)
 
+    @cached_property
+    def definitions(self) -> pd.DataFrame:
+        return self.definitions_factory()
 
-def load_transitive_imports(output_directory):
-    df_data = defaultdict(list)
-    for child in output_directory.iterdir():
-        code_str = child.stem
-        with open(child, 'rb') as in_file:
-            records = pickle.load(in_file)
-            for root, module, path, version, node_identifier in records:
-                df_data['root'].append(root)
-                df_data['module'].append(module)
-                df_data['path'].append(path)
-                df_data['version'].append(version)
-                df_data['code_str'].append(code_str)
-    df = pd.DataFrame(df_data)
-    df['id'] = np.arange(len(df)) + 1
-    return df
+
+IMPORT_DATA_CATEGORICAL_COLUMNS = ['root', 'module', 'path', 'version', 'code_str']
 
 
-def read_child_files_of_package(child, package_name, version):
-    return {str(module_path.resolve()): (package_name, version) for module_path in
-            (child.parent / package_name).glob('**/*')}
+def load_import_data(conn):
+    # A statement resolved statically and later executed keeps both results, the executed one is used.
+    df = pd.read_sql_query(f"""
+SELECT d.id, d.root, d.module, d.path, d.version, d.code_str, d.self_seconds, d.self_rss_bytes
+FROM IMPORT_DATA d LEFT JOIN IMPORTS i ON i.code_str = d.code_str
+WHERE COALESCE(d.method, '{DYNAMIC}') = COALESCE(i.method, '{DYNAMIC}')""", conn)
+    for col in IMPORT_DATA_CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype('category')
+    return df
 
 
-def read_installed_files(child, package_name, version):
-    res = {}
-    path = child / 'installed-files.txt'
-    if not path.exists():
-        return res
-    with open(path) as installed_file:
-        for file in installed_file:
-            file_path = str((child / file).resolve())
-            res[file_path] = package_name, version
-    return res
-
-
-def get_dict_for_package_dist_info(child):
-    res = {}
-    site_packages_path = child.parent
-    package_name, version = child.stem.split('-', 1)
-    records = pd.read_csv(child / 'RECORD', names=['filename', 'meta0', 'meta1'], header=None)
-    for filename in records['filename']:
-        file_path = str((site_packages_path / filename).resolve())
-        res[file_path] = package_name, version
-    res.update(read_child_files_of_package(child, package_name, version))
-    return res
-
-
-def get_dict_for_package_egg_info(child):
-    package_name, version = child.stem.split('-', 1)
-    res = read_installed_files(child, package_name, version)
-    res.update(read_child_files_of_package(child, package_name, version))
-    return res
-
-
-def get_package_weight(dct):
-    total = 0
-    for file in dct:
-        if os.path.exists(file):
-            total += os.path.getsize(file)
-    return total
-
-
-def get_absolute_path_to_package_and_version_dict():
-    print(f'Indexing site-packages files ...')
-    package_name_resolver = {}
-    package_weight_dict = defaultdict(lambda : 0)
-    site_packages = site.getsitepackages() + [site.getusersitepackages()]
-    for site_packages_path in site_packages:
-        site_packages_path = Path(site_packages_path)
-        if not site_packages_path.exists():
-            print(site_packages_path, 'does not exist')
+def compare_probe_methods(output_directory: Union[str, Path]):
+    """Compares the modules found statically and by executing, for every statement probed both ways.
+
+    Run a dump with `probe_engine='static'` first and then with a dynamic engine on the same output directory: the
+    dynamic run probes the statically resolved statements again and keeps both results. `missed` are the modules
+    only seen when executing, e.g. imported with `importlib`, and `extra` are those only found statically, e.g.
+    imported in a `try` block whose other branch ran.
+    """
+    conn = connect_read_only(Path(output_directory) / 'modules.db')
+    try:
+        df = pd.read_sql_query(f"SELECT code_str, module, COALESCE(method, '{DYNAMIC}') AS method FROM IMPORT_DATA",
+                               conn)
+    finally:
+        conn.close()
+    rows = []
+    for code_str, group in df.groupby('code_str', sort=True):
+        static = set(group.loc[group['method'] == STATIC, 'module'])
+        dynamic = set(group.loc[group['method'] == DYNAMIC, 'module'])
+        if not static or not dynamic:
             continue
-        for child in site_packages_path.iterdir():
-            if child.suffix not in {'.dist-info', '.egg-info'}:
-                continue
-            if child.suffix == '.dist-info':
-                dct = get_dict_for_package_dist_info(child)
-            elif child.suffix == '.egg-info':
-                dct = get_dict_for_package_egg_info(child)
-            else:
-                dct = {}
-            package_name_resolver.update(dct)
-            package_name, version = child.stem.split('-', 1)
-            package_weight_dict[f'{package_name}=={version}'] = get_package_weight(dct)
-    print(f'Done indexing site-packages files.')
-    return package_name_resolver, package_weight_dict
+        rows.append((code_str, len(static), len(dynamic), len(static & dynamic) / len(static | dynamic),
+                     sorted(dynamic - static), sorted(static - dynamic)))
+    res = pd.DataFrame(rows, columns=['code_str', 'static_modules', 'dynamic_modules', 'jaccard', 'missed', 'extra'])
+    return res.sort_values(by='jaccard', kind='stable').reset_index(drop=True)
+
+
+def map_unique(values: pd.Series, func):
+    """Applies `func` once per distinct value instead of once per row."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    mapped = np.array([func(value) for value in uniques], dtype=object)
+    return mapped[codes]
+
+
+def get_unique_weight_per_group(groups: pd.Series, dependency_codes, dependency_weight):
+    """Vectorized `groups.map(df.groupby(groups).apply(compute_weight))`."""
+    group_codes, _ = pd.factorize(groups, use_na_sentinel=False)
+    pairs = pd.DataFrame({'group': group_codes, 'dependency': dependency_codes, 'weight': dependency_weight})
+    pairs = pairs.drop_duplicates(subset=['group', 'dependency'])
+    weights = pairs.groupby('group')['weight'].sum()
+    return weights.to_numpy()[group_codes]
 
 
 def get_dependency(path, absolute_path_to_package_and_version_dict):
@@ -144,6 +98,27 @@ def get_dependency(path, absolute_path_to_package_and_version_dict):
     return np.nan
 
 
+def get_dependency_weights(import_data: pd.DataFrame, absolute_path_to_package_and_version_dict, package_weight,
+                           metric: Union[str, Callable] = 'bytes'):
+    """Weight of every dependency under `metric`.
+
+    `'bytes'` keeps `package_weight`, the on-disk size of each distribution. `'import_seconds'` and `'memory'` sum,
+    over the modules of a distribution seen by the probes, the median self time or self RSS growth of loading the
+    module. A callable receives `import_data` with an added `dependency` column and returns a mapping from
+    dependency to weight.
+    """
+    if isinstance(metric, str) and metric == 'bytes':
+        return package_weight
+    df = import_data.assign(dependency=map_unique(import_data['path'], partial(
+        get_dependency, absolute_path_to_package_and_version_dict=absolute_path_to_package_and_version_dict)))
+    if callable(metric):
+        return metric(df)
+    col = get_cost_column(df, metric)
+    df = df.dropna(subset=['dependency'])
+    per_module = df.groupby(['dependency', 'module'], observed=True)[col].median().clip(lower=0)
+    return defaultdict(lambda: 0, per_module.groupby(level='dependency').sum().to_dict())
+
+
 @dataclass
 class ImportTree:
     imports: pd.DataFrame
@@ -152,6 +127,7 @@ class ImportTree:
     definitions: pd.DataFrame
     definitions_to_imports: pd.DataFrame
     filenames_to_imports: pd.DataFrame
+    probe_failures: Optional[pd.DataFrame] = None  # statements whose last probe failed, and why
 
     def what_if_import_moves(self, from_file: str, import_code_str: str, to_file: str):
         fi = self.filenames_to_imports.copy()
@@ -163,7 +139,8 @@ class ImportTree:
             filenames=self.filenames,
             filenames_to_imports=fi,
             definitions=self.definitions,
-            definitions_to_imports=self.definitions_to_imports
+            definitions_to_imports=self.definitions_to_imports,
+            probe_failures=self.probe_failures
         )
 
     def what_if_function_moves(self, from_file: str, function_name: str, to_file: str):
@@ -189,13 +166,59 @@ class ImportTree:
             filenames=self.filenames,
             filenames_to_imports=self.filenames_to_imports,
             definitions=definitions,
-            definitions_to_imports=self.definitions_to_imports
+            definitions_to_imports=self.definitions_to_imports,
+            probe_failures=self.probe_failures
         )
 
-    def cohesion(self, resolver_func=get_absolute_path_to_package_and_version_dict):
-        df = self.get_packages_df(resolver_func)
-        return Cohesion(score=df.drop_duplicates(subset='definition')['cohesion_score'].mean(),
-                        definitions=df)
+    def cohesion(self, resolver_func=get_absolute_path_to_package_and_version_dict,
+                 weight: Union[str, Callable] = 'bytes'):
+        with profiling.timer('tree.cohesion'):
+            dct, package_weight = self._resolve(resolver_func, weight)
+            with profiling.timer('tree.engine'):
+                engine = CohesionEngine.from_tree(self, dct, package_weight)
+            with profiling.timer('tree.score'):
+                score = engine.get_score()
+        return Cohesion(score=score, definitions_factory=partial(self._get_packages_df, dct, package_weight))
+
+    def get_cohesion_engine(self, resolver_func=get_absolute_path_to_package_and_version_dict,
+                            weight: Union[str, Callable] = 'bytes'):
+        dct, package_weight = self._resolve(resolver_func, weight)
+        with profiling.timer('tree.engine'):
+            return CohesionEngine.from_tree(self, dct, package_weight)
+
+    def get_what_if_engine(self, resolver_func=get_absolute_path_to_package_and_version_dict,
+                           weight: Union[str, Callable] = 'bytes'):
+        return WhatIfEngine(self.get_cohesion_engine(resolver_func, weight))
+
+    def recommend_splits(self, files: Optional[List[str]] = None, new_files: int = 1, objective: str = 'score',
+                         max_moves: Optional[int] = None,
+                         resolver_func=get_absolute_path_to_package_and_version_dict,
+                         weight: Union[str, Callable] = 'bytes') -> List[ProposedMove]:
+        """Moves of definitions into at most `new_files` new files, maximizing the score or minimizing the weight."""
+        return recommend_splits(self.get_what_if_engine(resolver_func, weight), files=files, new_files=new_files,
+                                objective=objective, max_moves=max_moves)
+
+    def get_import_weights(self, resolver_func=get_absolute_path_to_package_and_version_dict,
+                           weight: Union[str, Callable] = 'bytes') -> pd.Series:
+        """Total weight of the distinct dependencies every import statement brings in, indexed by statement."""
+        dct, package_weight = self._resolve(resolver_func, weight)
+        df = pd.DataFrame({
+            'code_str': self.import_data['code_str'].astype(object),
+            'dependency': map_unique(self.import_data['path'], partial(get_dependency,
+                                                                         absolute_path_to_package_and_version_dict=dct)),
+        }).dropna().drop_duplicates()
+        df['weight'] = df['dependency'].map(package_weight).fillna(0)
+        return df.groupby('code_str')['weight'].sum()
+
+    def find_lazy_imports(self, max_definitions: Optional[int] = None, files: Optional[List[str]] = None,
+                          resolver_func=get_absolute_path_to_package_and_version_dict,
+                          weight: Union[str, Callable] = 'bytes') -> pd.DataFrame:
+        """Module level imports that could be deferred, ranked by the weight of what they bring in."""
+        return find_lazy_import_candidates(self, self.get_import_weights(resolver_func, weight), max_definitions, files)
+
+    def profile_entry_point(self, entry: str, metric: str = 'import_seconds') -> EntryPointProfile:
+        """Cost of importing `entry` (a tracked file or `package.module[:function]`) and which imports cause it."""
+        return profile_entry_point(self, entry, metric)
 
     def get_full_df(self):
         def_with_imports = self.definitions.merge(self.definitions_to_imports,
@@ -206,25 +229,42 @@ class ImportTree:
         df = def_with_imports.merge(self.import_data, left_on='import_code_str', right_on='code_str', how='left')
         return df
 
-    def get_packages_df(self, resolver_func=get_absolute_path_to_package_and_version_dict):
-        full = self.get_full_df()
-        dct, package_weight = resolver_func()
-        full['dependency'] = full['path'].map(partial(get_dependency,
-                                                      absolute_path_to_package_and_version_dict=dct))
+    def get_packages_df(self, resolver_func=get_absolute_path_to_package_and_version_dict,
+                        weight: Union[str, Callable] = 'bytes'):
+        dct, package_weight = self._resolve(resolver_func, weight)
+        return self._get_packages_df(dct, package_weight)
+
+    def _resolve(self, resolver_func, weight):
+        with profiling.timer('tree.site_index'):
+            dct, package_weight = resolver_func()
+        with profiling.timer('tree.dependency_weights'):
+            return dct, get_dependency_weights(self.import_data, dct, package_weight, weight)
+
+    def _get_packages_df(self, dct, package_weight):
+        with profiling.timer('tree.packages_df'):
+            return self._build_packages_df(dct, package_weight)
+
+    def _build_packages_df(self, dct, package_weight):
+        with profiling.timer('tree.full_df'):
+            full = self.get_full_df()
+        full_definition, definition = self._get_definition_labels(full['id_definition'])
         res = pd.DataFrame({
             'path': full['filename_path'],
             'name': full['name'],
             'import': full['import_code_str'],
-            'dependency': full['dependency'],
-            'full_definition': full['filename_path'] + ':' + full['type'] + ':' + full['name'],
-            'definition': full['type'] + ':' + full['name'],
+            'dependency': map_unique(full['path'], partial(get_dependency,
+                                                            absolute_path_to_package_and_version_dict=dct)),
+            'full_definition': full_definition,
+            'definition': definition,
             'transitive_import_filename': full['path']
         })
-        res['dependency_weight'] = res['dependency'].map(package_weight)
-        ideal_weight_dict = res.groupby('full_definition').apply(compute_weight)
-        res['definition_ideal_weight'] = res['full_definition'].map(ideal_weight_dict)
-        actual_weight_dict = res.groupby('path').apply(compute_weight).to_dict()
-        res['definition_actual_weight'] = res['path'].map(actual_weight_dict)
+        dependency_codes, dependencies = pd.factorize(res['dependency'], use_na_sentinel=False)
+        dependency_weight = pd.Series(dependencies).map(package_weight).to_numpy()[dependency_codes]
+        res['dependency_weight'] = dependency_weight
+        res['definition_ideal_weight'] = get_unique_weight_per_group(res['full_definition'], dependency_codes,
+                                                                     dependency_weight)
+        res['definition_actual_weight'] = get_unique_weight_per_group(res['path'], dependency_codes,
+                                                                      dependency_weight)
         ideal = res['definition_ideal_weight']
         actual = res['definition_actual_weight']
         res['cohesion_score'] = ideal / actual
@@ -233,15 +273,29 @@ class ImportTree:
         res = res.sort_values(by=['cohesion_score', 'neg_definition_actual_weight'])
         return res
 
+    def _get_definition_labels(self, definition_ids):
+        definitions = self.definitions
+        type_and_name = definitions['type'] + ':' + definitions['name']
+        full_definition = definitions['filename_path'] + ':' + type_and_name
+        positions = pd.Index(definitions['id']).get_indexer(definition_ids)
+        return full_definition.to_numpy()[positions], type_and_name.to_numpy()[positions]
+
     @classmethod
     def from_dump(cls, output_directory: Union[str, Path]):
-        output_directory = Path(output_directory)
+        """Loads a dump without changing it, except that a dump written by an older version is upgraded first."""
+        with profiling.timer('tree.load'):
+            return cls._load_dump(Path(output_directory))
 
-        with sqlite3.connect(output_directory / 'modules.db') as conn:
+    @classmethod
+    def _load_dump(cls, output_directory: Path):
+        conn = connect_read_only(output_directory / 'modules.db')
+        try:
             table_names = ['IMPORTS', 'FILENAMES', 'DEFINITIONS',
-                           'DEFINITIONS_TO_IMPORTS', 'FILENAMES_TO_IMPORTS']
+                           'DEFINITIONS_TO_IMPORTS', 'FILENAMES_TO_IMPORTS', 'PROBE_FAILURES']
             res = {}
             for table_name in table_names:
                 res[table_name.lower()] = pd.read_sql_query(f'SELECT * FROM {table_name}', conn)
-            res['import_data'] = load_transitive_imports(output_directory / 'transitive_imports')
+            res['import_data'] = load_import_data(conn)
             return cls(**res)
+        finally:
+            conn.close()
@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+def unique_pairs(left: np.ndarray, right: np.ndarray, right_count: int):
+    """Deduplicates integer pairs by packing them into a single int64 key."""
+    keys = np.unique(left.astype(np.int64) * max(right_count, 1) + right.astype(np.int64))
+    return keys // max(right_count, 1), keys % max(right_count, 1)
+
+
+def join_pairs(left: np.ndarray, middle: np.ndarray, middle_to_right: np.ndarray, middle_count: int):
+    """Joins `(left, middle)` pairs with `(middle, right)` pairs, where `middle_to_right` is sorted by middle."""
+    middle_ids, right = middle_to_right
+    starts = np.searchsorted(middle_ids, np.arange(middle_count), side='left')
+    ends = np.searchsorted(middle_ids, np.arange(middle_count), side='right')
+    counts = (ends - starts)[middle]
+    repeated_left = np.repeat(left, counts)
+    # Position of every joined row inside the `(middle, right)` pairs of its middle.
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return repeated_left, right[np.repeat(starts[middle], counts) + offsets]
+
+
+@dataclass
+class CohesionEngine:
+    """Integer encoded view of an `ImportTree`, enough to compute cohesion without the wide per-module join.
+
+    Definitions, files, labels (`type:name`), imports and dependencies are numbered by their position.
+    Each import keeps only its distinct dependencies, so memory grows with definitions x dependencies instead of
+    definitions x transitive modules.
+    """
+    definition_ids: np.ndarray
+    definition_files: np.ndarray
+    definition_labels: np.ndarray
+    files: pd.Index
+    labels: pd.Index
+    imports: pd.Index
+    dependencies: pd.Index
+    dependency_weights: np.ndarray
+    # (definition, import) and (import, dependency) pairs, deduplicated and sorted by their first element.
+    definition_imports: tuple
+    import_dependencies: tuple
+
+    @classmethod
+    def from_tree(cls, tree, absolute_path_to_package_and_version_dict, package_weight):
+        definitions = tree.definitions
+        definition_files, files = pd.factorize(definitions['filename_path'])
+        definition_labels, labels = pd.factorize(definitions['type'] + ':' + definitions['name'])
+        definition_positions = pd.Index(definitions['id']).get_indexer(tree.definitions_to_imports['definition_id'])
+
+        import_data = tree.import_data
+        import_codes, imports = pd.factorize(tree.definitions_to_imports['import_code_str'])
+        data_imports = imports.get_indexer(import_data['code_str'])
+
+        path_codes, paths = pd.factorize(import_data['path'])
+        resolved = [absolute_path_to_package_and_version_dict.get(path) for path in paths]
+        path_dependencies = pd.Series([None if res is None else f'{res[0]}=={res[1]}' for res in resolved],
+                                      dtype=object)
+        dependency_of_path, dependencies = pd.factorize(path_dependencies)
+        dependency_weights = pd.Series(dependencies).map(package_weight).fillna(0).to_numpy(dtype=np.float64)
+
+        # Rows without a known definition, import or dependency weigh nothing, so they are dropped here.
+        data_dependencies = np.where(path_codes >= 0, dependency_of_path[np.maximum(path_codes, 0)], -1)
+        mask = (data_imports >= 0) & (data_dependencies >= 0)
+        import_dependencies = unique_pairs(data_imports[mask], data_dependencies[mask], len(dependencies))
+        mask = (definition_positions >= 0) & (import_codes >= 0)
+        definition_imports = unique_pairs(definition_positions[mask], import_codes[mask], len(imports))
+        return cls(
+            definition_ids=definitions['id'].to_numpy(),
+            definition_files=definition_files,
+            definition_labels=definition_labels,
+            files=files,
+            labels=labels,
+            imports=imports,
+            dependencies=dependencies,
+            dependency_weights=dependency_weights,
+            definition_imports=definition_imports,
+            import_dependencies=import_dependencies,
+        )
+
+    def get_definition_dependencies(self):
+        definitions, imports = self.definition_imports
+        definitions, dependencies = join_pairs(definitions, imports, self.import_dependencies, len(self.imports))
+        return unique_pairs(definitions, dependencies, len(self.dependencies))
+
+    def get_file_dependencies(self):
+        definitions, imports = self.definition_imports
+        files, imports = unique_pairs(self.definition_files[definitions], imports, len(self.imports))
+        files, dependencies = join_pairs(files, imports, self.import_dependencies, len(self.imports))
+        return unique_pairs(files, dependencies, len(self.dependencies))
+
+    def get_ideal_weights(self):
+        definitions, dependencies = self.get_definition_dependencies()
+        return np.bincount(definitions, weights=self.dependency_weights[dependencies],
+                           minlength=len(self.definition_ids))
+
+    def get_actual_weights(self):
+        files, dependencies = self.get_file_dependencies()
+        file_weights = np.bincount(files, weights=self.dependency_weights[dependencies], minlength=len(self.files))
+        return file_weights[self.definition_files]
+
+    def get_definition_scores(self, ideal_weights=None, actual_weights=None):
+        ideal_weights = self.get_ideal_weights() if ideal_weights is None else ideal_weights
+        actual_weights = self.get_actual_weights() if actual_weights is None else actual_weights
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = ideal_weights / actual_weights
+        scores[actual_weights < 1e-4] = 1.
+        return scores
+
+    def get_score(self, definition_scores=None):
+        """Mean over `type:name` labels of the lowest score among the definitions sharing the label."""
+        definition_scores = self.get_definition_scores() if definition_scores is None else definition_scores
+        if len(definition_scores) == 0:
+            return np.nan
+        label_scores = np.full(len(self.labels), np.inf)
+        np.minimum.at(label_scores, self.definition_labels, definition_scores)
+        return label_scores.mean()
+
+    def get_definitions_df(self):
+        """One row per definition, unlike the one row per transitive module of `ImportTree.get_packages_df`."""
+        ideal_weights = self.get_ideal_weights()
+        actual_weights = self.get_actual_weights()
+        return pd.DataFrame({
+            'id': self.definition_ids,
+            'path': self.files[self.definition_files],
+            'definition': self.labels[self.definition_labels],
+            'definition_ideal_weight': ideal_weights,
+            'definition_actual_weight': actual_weights,
+            'cohesion_score': self.get_definition_scores(ideal_weights, actual_weights),
+        })
@@ -0,0 +1,242 @@
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from py_import_tree.cohesion import IMPORT_DATA_CATEGORICAL_COLUMNS, ImportTree, get_dependency_weights
+from py_import_tree.site_index import get_absolute_path_to_package_and_version_dict
+from py_import_tree.static_resolver import DYNAMIC
+from py_import_tree.storage import connect_read_only
+
+# Upper bound of every string starting with a given prefix, under SQLite's default BINARY collation.
+MAX_CHAR = '\U0010ffff'
+
+# The rows of IMPORT_DATA the analysis uses: those of the method IMPORTS keeps for the statement.
+IMPORT_DATA_METHOD_FILTER = f"COALESCE(d.method, '{DYNAMIC}') = COALESCE(i.method, '{DYNAMIC}')"
+
+
+class DumpQuery:
+    """Query-backed view of a dump, for dumps too large to load with `ImportTree.from_dump`.
+
+    The selection is the files under any of `path_prefixes` (e.g. the checkout of a repo) and their definitions of
+    `definition_types` (e.g. `['FunctionDef']`); None selects everything. It is materialized once in temporary
+    tables, cohesion is aggregated by SQLite, and DataFrames are read `chunksize` rows at a time. The dump itself is
+    not changed, unless it was written by an older version and has to be upgraded first.
+
+    Definitions of other types are left out of the analysis entirely, as if their files did not have them: the
+    actual weight of a selected definition only counts the selected definitions of its file, like the tree of
+    `load_tree()`, so that `get_score()` equals `load_tree().cohesion().score`.
+    """
+
+    def __init__(self, output_directory: Union[str, Path], path_prefixes: Optional[List[str]] = None,
+                 definition_types: Optional[List[str]] = None, chunksize: int = 100000):
+        if isinstance(path_prefixes, str):
+            path_prefixes = [path_prefixes]
+        self.output_directory = Path(output_directory)
+        self.path_prefixes = path_prefixes
+        self.definition_types = definition_types
+        self.chunksize = chunksize
+        self.conn = connect_read_only(self.output_directory / 'modules.db')
+        self.resolved = None
+        self._select()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _select(self):
+        conn = self.conn
+        conn.executescript("""
+CREATE TEMP TABLE SELECTED_FILES (path TEXT PRIMARY KEY);
+CREATE TEMP TABLE FILE_DEFINITIONS (id INTEGER PRIMARY KEY, filename_path TEXT NOT NULL);
+CREATE TEMP TABLE SELECTED_IMPORTS (code_str TEXT PRIMARY KEY);
+""")
+        if self.path_prefixes is None:
+            conn.execute('INSERT INTO temp.SELECTED_FILES SELECT path FROM FILENAMES')
+        for prefix in self.path_prefixes or []:
+            # A range on the primary key instead of LIKE, which SQLite cannot answer from the index.
+            conn.execute('INSERT OR IGNORE INTO temp.SELECTED_FILES SELECT path FROM FILENAMES '
+                         'WHERE path >= ? AND path < ?', (prefix, prefix + MAX_CHAR))
+        type_filter, params = '', []
+        if self.definition_types is not None:
+            type_filter = f"WHERE d.type IN ({', '.join('?' * len(self.definition_types))})"
+            params = self.definition_types
+        conn.execute(f"""
+INSERT INTO temp.FILE_DEFINITIONS
+SELECT d.id, d.filename_path FROM temp.SELECTED_FILES f JOIN DEFINITIONS d ON d.filename_path = f.path
+{type_filter}""", params)
+        conn.execute("""
+INSERT OR IGNORE INTO temp.SELECTED_IMPORTS
+SELECT dti.import_code_str FROM temp.FILE_DEFINITIONS d
+JOIN DEFINITIONS_TO_IMPORTS dti ON dti.definition_id = d.id
+UNION
+SELECT fti.import_code_str FROM temp.SELECTED_FILES f JOIN FILENAMES_TO_IMPORTS fti ON fti.filename_path = f.path
+""")
+        conn.execute('CREATE INDEX temp.FILE_DEFINITIONS_FILENAME_PATH ON FILE_DEFINITIONS(filename_path)')
+        conn.commit()
+
+    def read_chunks(self, query: str, params=()) -> Iterator[pd.DataFrame]:
+        return pd.read_sql_query(query, self.conn, params=params, chunksize=self.chunksize)
+
+    def read(self, query: str, params=(), categorical_columns=()) -> pd.DataFrame:
+        """Reads `query` chunk by chunk, turning `categorical_columns` into categories before concatenating."""
+        chunks = []
+        for chunk in self.read_chunks(query, params):
+            for col in categorical_columns:
+                chunk[col] = chunk[col].astype('category')
+            chunks.append(chunk)
+        if len(chunks) == 0:
+            return pd.read_sql_query(query, self.conn, params=params)
+        res = pd.concat(chunks, ignore_index=True)
+        for col in categorical_columns:
+            res[col] = union_categoricals([chunk[col] for chunk in chunks]).astype('category')
+        return res
+
+    def get_filenames(self) -> pd.DataFrame:
+        return self.read('SELECT n.* FROM temp.SELECTED_FILES f JOIN FILENAMES n ON n.path = f.path')
+
+    def get_definitions(self) -> pd.DataFrame:
+        return self.read('SELECT d.* FROM temp.FILE_DEFINITIONS s JOIN DEFINITIONS d ON d.id = s.id ORDER BY d.id')
+
+    def get_definitions_to_imports(self) -> pd.DataFrame:
+        return self.read("""
+SELECT dti.* FROM temp.FILE_DEFINITIONS s JOIN DEFINITIONS_TO_IMPORTS dti ON dti.definition_id = s.id
+ORDER BY dti.id""")
+
+    def get_filenames_to_imports(self) -> pd.DataFrame:
+        return self.read("""
+SELECT fti.* FROM temp.SELECTED_FILES f JOIN FILENAMES_TO_IMPORTS fti ON fti.filename_path = f.path
+ORDER BY fti.id""")
+
+    def get_imports(self) -> pd.DataFrame:
+        return self.read('SELECT i.* FROM temp.SELECTED_IMPORTS s JOIN IMPORTS i ON i.code_str = s.code_str')
+
+    def get_probe_failures(self) -> pd.DataFrame:
+        return self.read('SELECT p.* FROM temp.SELECTED_IMPORTS s JOIN PROBE_FAILURES p ON p.code_str = s.code_str')
+
+    def get_import_data(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """IMPORT_DATA of the selected statements, with only `columns` (by default those of `load_import_data`)."""
+        columns = columns or ['id', 'root', 'module', 'path', 'version', 'code_str', 'self_seconds', 'self_rss_bytes']
+        return self.read(f"""
+SELECT {', '.join(f'd.{col}' for col in columns)}
+FROM temp.SELECTED_IMPORTS s
+JOIN IMPORT_DATA d ON d.code_str = s.code_str LEFT JOIN IMPORTS i ON i.code_str = s.code_str
+WHERE {IMPORT_DATA_METHOD_FILTER} ORDER BY d.id""",
+                         categorical_columns=[col for col in columns if col in IMPORT_DATA_CATEGORICAL_COLUMNS])
+
+    def load_tree(self) -> ImportTree:
+        """The selection as an in-memory `ImportTree`, for the analyses that need one."""
+        return ImportTree(
+            imports=self.get_imports(),
+            import_data=self.get_import_data(),
+            filenames=self.get_filenames(),
+            definitions=self.get_definitions(),
+            definitions_to_imports=self.get_definitions_to_imports(),
+            filenames_to_imports=self.get_filenames_to_imports(),
+            probe_failures=self.get_probe_failures(),
+        )
+
+    def resolve(self, resolver_func=get_absolute_path_to_package_and_version_dict,
+                weight: Union[str, Callable] = 'bytes'):
+        """Stores the dependency of every module path of the selection, and the weight of every dependency.
+
+        Only the distinct paths are read. The runtime metrics also read the module and cost columns of IMPORT_DATA.
+        """
+        if self.resolved == (resolver_func, weight):
+            return
+        dct, package_weight = resolver_func()
+        if not (isinstance(weight, str) and weight == 'bytes'):
+            package_weight = get_dependency_weights(self.get_import_data(
+                ['module', 'path', 'code_str', 'self_seconds', 'self_rss_bytes']), dct, package_weight, weight)
+        conn = self.conn
+        conn.executescript("""
+DROP TABLE IF EXISTS temp.PATH_DEPENDENCIES;
+DROP TABLE IF EXISTS temp.DEPENDENCY_WEIGHTS;
+DROP TABLE IF EXISTS temp.IMPORT_DEPENDENCIES;
+CREATE TEMP TABLE PATH_DEPENDENCIES (path TEXT PRIMARY KEY, dependency TEXT NOT NULL);
+CREATE TEMP TABLE DEPENDENCY_WEIGHTS (dependency TEXT PRIMARY KEY, weight REAL NOT NULL);
+CREATE TEMP TABLE IMPORT_DEPENDENCIES (code_str TEXT, dependency TEXT, PRIMARY KEY (code_str, dependency));
+""")
+        dependencies = set()
+        cursor = conn.execute(f"""
+SELECT DISTINCT d.path FROM temp.SELECTED_IMPORTS s
+JOIN IMPORT_DATA d ON d.code_str = s.code_str LEFT JOIN IMPORTS i ON i.code_str = s.code_str
+WHERE d.path IS NOT NULL AND {IMPORT_DATA_METHOD_FILTER}""")
+        while True:
+            paths = cursor.fetchmany(self.chunksize)
+            if not paths:
+                break
+            resolved = [(path, dct.get(path)) for path, in paths]
+            rows = [(path, f'{res[0]}=={res[1]}') for path, res in resolved if res is not None]
+            dependencies.update(dependency for _, dependency in rows)
+            conn.executemany('INSERT INTO temp.PATH_DEPENDENCIES VALUES (?, ?)', rows)
+        conn.executemany('INSERT INTO temp.DEPENDENCY_WEIGHTS VALUES (?, ?)',
+                         [(dependency, float(package_weight.get(dependency, 0) or 0)) for dependency in dependencies])
+        conn.execute(f"""
+INSERT OR IGNORE INTO temp.IMPORT_DEPENDENCIES
+SELECT d.code_str, p.dependency FROM temp.SELECTED_IMPORTS s
+JOIN IMPORT_DATA d ON d.code_str = s.code_str LEFT JOIN IMPORTS i ON i.code_str = s.code_str
+JOIN temp.PATH_DEPENDENCIES p ON p.path = d.path
+WHERE {IMPORT_DATA_METHOD_FILTER}""")
+        conn.commit()
+        self.resolved = resolver_func, weight
+
+    def iter_definition_weights(self, resolver_func=get_absolute_path_to_package_and_version_dict,
+                                weight: Union[str, Callable] = 'bytes') -> Iterator[pd.DataFrame]:
+        """Chunks of one row per selected definition, with the columns of `CohesionEngine.get_definitions_df`."""
+        self.resolve(resolver_func, weight)
+        query = """
+WITH definition_weights AS (
+    SELECT definition_id, SUM(w.weight) AS weight FROM (
+        SELECT DISTINCT s.id AS definition_id, p.dependency FROM temp.FILE_DEFINITIONS s
+        JOIN DEFINITIONS_TO_IMPORTS dti ON dti.definition_id = s.id
+        JOIN temp.IMPORT_DEPENDENCIES p ON p.code_str = dti.import_code_str
+    ) JOIN temp.DEPENDENCY_WEIGHTS w USING (dependency) GROUP BY definition_id
+), file_weights AS (
+    SELECT filename_path, SUM(w.weight) AS weight FROM (
+        SELECT DISTINCT s.filename_path, p.dependency FROM temp.FILE_DEFINITIONS s
+        JOIN DEFINITIONS_TO_IMPORTS dti ON dti.definition_id = s.id
+        JOIN temp.IMPORT_DEPENDENCIES p ON p.code_str = dti.import_code_str
+    ) JOIN temp.DEPENDENCY_WEIGHTS w USING (dependency) GROUP BY filename_path
+)
+SELECT d.id, d.filename_path AS path, d.type || ':' || d.name AS definition,
+       COALESCE(dw.weight, 0.) AS definition_ideal_weight, COALESCE(fw.weight, 0.) AS definition_actual_weight
+FROM temp.FILE_DEFINITIONS s JOIN DEFINITIONS d ON d.id = s.id
+LEFT JOIN definition_weights dw ON dw.definition_id = d.id
+LEFT JOIN file_weights fw ON fw.filename_path = d.filename_path
+ORDER BY d.id"""
+        for chunk in self.read_chunks(query):
+            ideal = chunk['definition_ideal_weight'].to_numpy(dtype=np.float64)
+            actual = chunk['definition_actual_weight'].to_numpy(dtype=np.float64)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                scores = ideal / actual
+            scores[actual < 1e-4] = 1.
+            chunk['cohesion_score'] = scores
+            yield chunk
+
+    def get_definitions_df(self, resolver_func=get_absolute_path_to_package_and_version_dict,
+                           weight: Union[str, Callable] = 'bytes') -> pd.DataFrame:
+        chunks = list(self.iter_definition_weights(resolver_func, weight))
+        if len(chunks) == 0:
+            return pd.DataFrame(columns=['id', 'path', 'definition', 'definition_ideal_weight',
+                                         'definition_actual_weight', 'cohesion_score'])
+        return pd.concat(chunks, ignore_index=True)
+
+    def get_score(self, resolver_func=get_absolute_path_to_package_and_version_dict,
+                  weight: Union[str, Callable] = 'bytes') -> float:
+        """Same as `ImportTree.cohesion().score` of the selection, keeping only the lowest score of every label."""
+        label_scores = {}
+        for chunk in self.iter_definition_weights(resolver_func, weight):
+            lowest = chunk.groupby('definition', sort=False)['cohesion_score'].min()
+            for label, score in lowest.items():
+                label_scores[label] = min(score, label_scores.get(label, np.inf))
+        if len(label_scores) == 0:
+            return np.nan
+        return float(np.mean(list(label_scores.values())))
@@ -0,0 +1,257 @@
+import ast
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from py_import_tree.import_cost import get_cost_column
+
+# Collapsed stacks need integer sample counts, so costs are written in these units.
+COLLAPSED_STACK_SCALE = {'import_seconds': 1e6, 'memory': 1}
+
+
+def get_module_file_candidates(directory: Path, module: str):
+    base = directory.joinpath(*module.split('.')) if module else directory
+    return [base.with_suffix('.py') if module else None, base / '__init__.py']
+
+
+def resolve_entry(entry: str, filenames: List[str]):
+    """Finds the file of `entry`, either a path or a dotted module name optionally followed by `:attribute`."""
+    if entry in filenames:
+        return entry
+    by_real_path = {os.path.realpath(filename): filename for filename in filenames}
+    if os.path.realpath(entry) in by_real_path:
+        return by_real_path[os.path.realpath(entry)]
+    module = entry.split(':')[0]
+    parts = module.split('.')
+    suffixes = [os.path.join(*parts) + '.py', os.path.join(*parts, '__init__.py')]
+    matches = [filename for filename in filenames
+               if any(filename == suffix or filename.endswith(os.sep + suffix) for suffix in suffixes)]
+    if len(matches) != 1:
+        raise ValueError(f'Entry point {entry} matches {len(matches)} tracked files: {matches}')
+    return matches[0]
+
+
+class FirstPartyResolver:
+    """Statically maps an import statement of a first-party file to the first-party files it loads.
+
+    Used for statements that could not be probed, typically relative imports.
+    """
+
+    def __init__(self, filenames: List[str]):
+        self.by_real_path = {os.path.realpath(filename): filename for filename in filenames}
+        self.filenames = filenames
+
+    def get_file(self, path: Union[str, Path, None]):
+        if path is None:
+            return None
+        return self.by_real_path.get(os.path.realpath(path))
+
+    def find_absolute(self, module: str):
+        parts = module.split('.')
+        suffixes = [os.path.join(*parts) + '.py', os.path.join(*parts, '__init__.py')]
+        for filename in self.filenames:
+            if any(filename.endswith(os.sep + suffix) or filename == suffix for suffix in suffixes):
+                return filename
+        return None
+
+    def find_relative(self, directory: Path, module: str):
+        for candidate in get_module_file_candidates(directory, module):
+            res = self.get_file(candidate)
+            if res is not None:
+                return res
+        return None
+
+    def resolve(self, code_str: str, filename: str):
+        try:
+            stmt = ast.parse(code_str).body[0]
+        except (SyntaxError, IndexError):
+            return []
+        res = []
+        if isinstance(stmt, ast.Import):
+            res = [self.find_absolute(alias.name) for alias in stmt.names]
+        elif isinstance(stmt, ast.ImportFrom) and stmt.level == 0:
+            res = [self.find_absolute(stmt.module)]
+            res += [self.find_absolute(f'{stmt.module}.{alias.name}') for alias in stmt.names]
+        elif isinstance(stmt, ast.ImportFrom):
+            directory = Path(filename).parent
+            for _ in range(stmt.level - 1):
+                directory = directory.parent
+            module = stmt.module or ''
+            res = [self.find_relative(directory, module)]
+            res += [self.find_relative(directory, f'{module}.{alias.name}'.lstrip('.')) for alias in stmt.names]
+        return list(dict.fromkeys(filename for filename in res if filename is not None))
+
+
+@dataclass
+class EntryPointProfile:
+    """What importing an entry point costs, and through which import statements.
+
+    `modules` has one row per module loaded, with the first import statement (`filename`, `import`) that loads it.
+    `edges` has one row per import statement of a first-party file reached from the entry point: `cumulative_cost`
+    is the cost of everything it loads first, in execution order, and `removable_cost` is what importing the entry
+    point would save if that statement was not executed (e.g. made lazy), since modules also loaded elsewhere stay.
+    """
+    entry: str
+    metric: str
+    total_cost: float
+    modules: pd.DataFrame
+    edges: pd.DataFrame
+    stacks: List[Tuple[Tuple[str, ...], float]] = field(repr=False)
+
+    def get_lazy_candidates(self, top: Optional[int] = 10):
+        res = self.edges[self.edges['removable_cost'] > 0].sort_values(by='removable_cost', ascending=False)
+        return res if top is None else res.head(top)
+
+    def get_collapsed_stacks(self):
+        scale = COLLAPSED_STACK_SCALE[self.metric]
+        lines = []
+        for frames, cost in self.stacks:
+            value = int(round(cost * scale))
+            if value > 0:
+                lines.append(';'.join(frame.replace(';', ',') for frame in frames) + f' {value}')
+        return lines
+
+    def write_collapsed_stacks(self, path: Union[str, Path]):
+        """Writes the stacks in the collapsed format read by flamegraph.pl, speedscope and inferno."""
+        with open(path, 'w') as out_file:
+            for line in self.get_collapsed_stacks():
+                out_file.write(line + '\n')
+
+
+class EntryPointProfiler:
+
+    def __init__(self, tree, metric: str = 'import_seconds'):
+        self.metric = metric
+        import_data = tree.import_data
+        col = get_cost_column(import_data, metric)
+        self.filenames = tree.filenames['path'].tolist()
+        self.resolver = FirstPartyResolver(self.filenames)
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in self.filenames]) \
+            if self.filenames else ''
+        self.display_names = {f: os.path.relpath(os.path.abspath(f), root) for f in self.filenames}
+
+        costs = import_data.groupby('module', observed=True)[col].median().clip(lower=0).fillna(0)
+        self.module_costs: Dict[str, float] = costs.to_dict()
+        fti = tree.filenames_to_imports
+        if 'id' in fti.columns:
+            fti = fti.sort_values(by='id')
+        self.file_imports: Dict[str, List[str]] = fti.groupby('filename_path', sort=False)['import_code_str'] \
+            .agg(list).to_dict()
+        self.statement_modules: Dict[str, List[Tuple[str, Optional[str]]]] = {}
+        import_data = import_data.sort_values(by='id') if 'id' in import_data.columns else import_data
+        for code_str, module, path in zip(import_data['code_str'], import_data['module'], import_data['path']):
+            path = None if pd.isna(path) else path
+            self.statement_modules.setdefault(code_str, []).append((module, path))
+        self.file_modules = {}
+        for modules in self.statement_modules.values():
+            for module, path in modules:
+                filename = self.resolver.get_file(path)
+                if filename is not None:
+                    self.file_modules.setdefault(filename, module)
+        self.targets = {}
+
+    def get_targets(self, filename, code_str):
+        """First-party files loaded by a statement, and the other modules it loads that those files do not."""
+        key = filename, code_str
+        if key not in self.targets:
+            files, modules = self._split_statement(filename, code_str)
+            # The probe of a statement also saw what its first-party files import. Those modules are charged to the
+            # statements of those files, so that making one of them lazy shows up as removable.
+            through_files = set()
+            for target in files:
+                through_files |= self._get_file_closure(target)
+            self.targets[key] = files, [(module, path) for module, path in modules if module not in through_files]
+        return self.targets[key]
+
+    def _split_statement(self, filename, code_str):
+        if code_str not in self.statement_modules:
+            return self.resolver.resolve(code_str, filename), []
+        files, modules = [], []
+        for module, path in self.statement_modules[code_str]:
+            target = self.resolver.get_file(path)
+            if target is not None:
+                files.append(target)
+            else:
+                modules.append((module, path))
+        return files, modules
+
+    def _get_file_closure(self, filename):
+        """Names of the non first-party modules loaded by the statements of `filename`, recursively."""
+        res = set()
+        visited = {filename}
+        stack = [filename]
+        while stack:
+            current = stack.pop()
+            for code_str in self.file_imports.get(current, []):
+                files, modules = self._split_statement(current, code_str)
+                res.update(module for module, _ in modules)
+                stack.extend(target for target in files if target not in visited)
+                visited.update(files)
+        return res
+
+    def profile(self, entry: str):
+        entry = resolve_entry(entry, self.filenames)
+        total, modules, edges, stacks = self._run(entry)
+        removable = {}
+        for edge in edges:
+            removable[edge] = total - self._run(entry, skip=edge)[0]
+        edges_df = pd.DataFrame([(filename, code_str, depth, cost, removable[filename, code_str], count)
+                                 for (filename, code_str), (depth, cost, count) in edges.items()],
+                                columns=['filename', 'import', 'depth', 'cumulative_cost', 'removable_cost',
+                                         'modules'])
+        modules_df = pd.DataFrame(modules, columns=['module', 'path', 'first_party', 'cost', 'filename', 'import'])
+        return EntryPointProfile(entry=entry, metric=self.metric, total_cost=total, modules=modules_df,
+                                 edges=edges_df, stacks=stacks)
+
+    def _run(self, entry, skip=None):
+        """Replays the imports of `entry` in source order, charging every module to the first statement loading it."""
+        loaded = set()
+        modules = []
+        edges = {}
+        stacks = []
+        total = [0.]
+
+        def charge(frames, module, path, first_party, filename, code_str):
+            cost = self.module_costs.get(module, 0.)
+            total[0] += cost
+            modules.append((module, path, first_party, cost, filename, code_str))
+            stacks.append((frames, cost))
+
+        def visit(filename, frames, via):
+            loaded.add(filename)
+            frames = frames + (self.display_names[filename],)
+            module = self.file_modules.get(filename)
+            if module is not None:
+                loaded.add(module)
+                charge(frames, module, filename, True, *via)
+            for code_str in self.file_imports.get(filename, []):
+                if (filename, code_str) == skip or (filename, code_str) in edges:
+                    continue
+                before, count = total[0], len(modules)
+                edges[filename, code_str] = None
+                statement_frames = frames + (code_str,)
+                files, others = self.get_targets(filename, code_str)
+                for target in files:
+                    if target not in loaded:
+                        visit(target, statement_frames, (filename, code_str))
+                for module, path in others:
+                    if module not in loaded:
+                        loaded.add(module)
+                        charge(statement_frames + tuple(get_frames(module)), module, path, False, filename, code_str)
+                edges[filename, code_str] = (len(frames) - 1) // 2, total[0] - before, len(modules) - count
+
+        visit(entry, (), (None, None))
+        return total[0], modules, edges, stacks
+
+
+def get_frames(module: str):
+    """`a.b.c` -> `a`, `a.b.c`: the top-level package groups its modules in the flame graph."""
+    root = module.split('.')[0]
+    return [root] if root == module else [root, module]
+
+
+def profile_entry_point(tree, entry: str, metric: str = 'import_seconds'):
+    return EntryPointProfiler(tree, metric).profile(entry)
@@ -0,0 +1,79 @@
+import importlib._bootstrap as _bootstrap
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Import data columns holding the per-module cost of each runtime metric.
+COST_COLUMNS = {'import_seconds': 'self_seconds', 'memory': 'self_rss_bytes'}
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else None
+
+
+def get_rss_bytes() -> Optional[int]:
+    """Current resident set size. Falls back to the peak RSS where /proc is not available, and None if neither is."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError, TypeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def subtract(value, other):
+    return None if value is None or other is None else value - other
+
+
+class ImportTimer:
+    """Measures the self time and self RSS growth of every module loaded while active, like `python -X importtime`.
+
+    It wraps importlib's `_find_and_load`, which runs once per module that is not in `sys.modules` yet, whether the
+    import comes from an import statement or `importlib.import_module`. The cost of nested imports is subtracted
+    from the module that triggered them.
+    """
+
+    def __init__(self):
+        self.costs: Dict[str, Tuple[float, Optional[int]]] = {}
+        self.stack = []
+        self.original_find_and_load = None
+
+    def __enter__(self):
+        self.original_find_and_load = _bootstrap._find_and_load
+        _bootstrap._find_and_load = self._find_and_load
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _bootstrap._find_and_load = self.original_find_and_load
+
+    def _find_and_load(self, name, *args, **kwargs):
+        children = [0., 0]
+        self.stack.append(children)
+        rss_before = get_rss_bytes()
+        start = time.perf_counter()
+        try:
+            return self.original_find_and_load(name, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            rss = subtract(get_rss_bytes(), rss_before)
+            self.stack.pop()
+            self.costs[name] = seconds - children[0], subtract(rss, children[1])
+            if self.stack:
+                self.stack[-1][0] += seconds
+                self.stack[-1][1] += rss or 0
+
+
+def get_cost_column(import_data, metric: str):
+    if metric not in COST_COLUMNS:
+        raise ValueError(f'Unknown cost metric {metric}, expected one of {sorted(COST_COLUMNS)}')
+    col = COST_COLUMNS[metric]
+    if col not in import_data.columns or import_data[col].isna().all():
+        raise ValueError(f'The dump has no {col} measurements, re-scan it to record import costs')
+    return col
@@ -0,0 +1,55 @@
+import ast
+import sys
+from functools import lru_cache
+from typing import NamedTuple, Optional, Union
+
+
+class ImportKey(NamedTuple):
+    """One imported name of an import statement, e.g. `from ..a import b as c` -> `ImportKey('a', 2, 'b', 'c')`.
+
+    Plain `import x` statements have no module and level 0. `code_str` is the statement importing only this name,
+    written the way astunparse writes it, which is how import statements are keyed in the dump. It does not depend
+    on the Python version and is also the statement the probes execute.
+    """
+    module: Optional[str]
+    level: int
+    name: str
+    asname: Optional[str] = None
+
+    @classmethod
+    def from_alias(cls, stmt: Union[ast.Import, ast.ImportFrom], alias: ast.alias):
+        if isinstance(stmt, ast.Import):
+            return cls(None, 0, alias.name, alias.asname)
+        return cls(stmt.module, stmt.level, alias.name, alias.asname)
+
+    @classmethod
+    def from_code_str(cls, code_str: str):
+        """Parses a single name import statement."""
+        stmt = ast.parse(code_str).body[0]
+        if not isinstance(stmt, (ast.Import, ast.ImportFrom)) or len(stmt.names) != 1:
+            raise ValueError(f'Expected an import statement of a single name, got "{code_str}"')
+        return cls.from_alias(stmt, stmt.names[0])
+
+    @property
+    def is_from_import(self):
+        return self.module is not None or self.level > 0
+
+    @property
+    def bound_name(self):
+        """The name the statement binds in the importing module."""
+        if self.asname is not None:
+            return self.asname
+        return self.name if self.is_from_import else self.name.split('.')[0]
+
+    @property
+    def code_str(self):
+        return get_code_str(self)
+
+
+@lru_cache(maxsize=None)
+def get_code_str(key: ImportKey):
+    """Formats `key`, interning the result so that every file importing the same name shares one string."""
+    name = key.name if key.asname is None else f'{key.name} as {key.asname}'
+    if not key.is_from_import:
+        return sys.intern(f'import {name}')
+    return sys.intern(f"from {'.' * key.level}{key.module or ''} import {name}")
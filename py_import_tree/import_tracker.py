@@ -1,104 +1,139 @@
 import ast
-import pickle
-import sqlite3
+import hashlib
+import heapq
+import json
+import os
 import sys
+import time
 import traceback
-from copy import copy
-from multiprocessing import Process
+from dataclasses import dataclass
+from multiprocessing import Pool
 from pathlib import Path
-from sqlite3 import IntegrityError
-from typing import Union
+from typing import Iterable, List, Optional, Union
 
-import astunparse
 from stdlib_list import stdlib_list
 
+from py_import_tree import profiling
+from py_import_tree.import_cost import ImportTimer, get_rss_bytes, subtract
+from py_import_tree.import_key import ImportKey
+from py_import_tree.preload import ImportRecorder
+from py_import_tree.probe_cache import ProbeCache, get_callable_fingerprint
+from py_import_tree.probing import ProbeResult, failure, get_system_exit_code, make_prober
+from py_import_tree.sharding import get_shard
+from py_import_tree.static_resolver import DYNAMIC, STATIC, StaticResolver
+from py_import_tree.storage import DumpWriter, lock_dump
+
+# Failures that may not happen again, e.g. when the machine was busy, so the probe is retried.
+RETRIED_STATUSES = {'timeout', 'crashed'}
+
 
 def get_root_module(key):
     res = key.split('.')[0]
     return '-'.join(res.split('_'))
 
 
-class Wrapper:
-
-    def get_statement(self):
-        raise NotImplementedError()
-
-
-class ImportWrapper(Wrapper):
-
-    def __init__(self, import_stmt: ast.Import, name_idx: int):
-        self.import_stmt = import_stmt
-        self.name_idx = name_idx
-
-    def get_statement(self):
-        res = copy(self.import_stmt)
-        res.names = [self.import_stmt.names[self.name_idx]]
-        return res
+def get_eff_name(alias):
+    return alias.asname if alias.asname is not None else alias.name
 
 
-class ImportFromWrapper(Wrapper):
+def get_dotted_name(node: ast.Attribute):
+    """`np.linalg.norm` -> the `np` Name node and `'np.linalg.norm'`, or None if the chain does not start at a name."""
+    attributes = []
+    while isinstance(node, ast.Attribute):
+        attributes.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    return node, '.'.join([node.id] + attributes[::-1])
 
-    def __init__(self, import_from_stmt: ast.ImportFrom, name_idx: int):
-        self.import_from_stmt = import_from_stmt
-        self.name_idx = name_idx
 
-    def get_statement(self):
-        res = copy(self.import_from_stmt)
-        res.names = [self.import_from_stmt.names[self.name_idx]]
-        return res
+DEFINITION_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
 
 
-def get_eff_name(alias):
-    return alias.asname if alias.asname is not None else alias.name
+class UsageVisitor:
+    """Collects the module level imports and definitions of a file, and the imported names they use, in one pass.
 
+    Definitions nested in functions and classes are part of their outermost definition, and so are their uses.
+    Uses outside any definition are module level uses. Since imports may come after their uses in the file, uses
+    are kept as dotted names (`np.linalg.norm`) and matched against the imports by `get_used_imports`.
 
-class ImportsAndDefinitionsVisitor(ast.NodeVisitor):
+    The tree is walked with an explicit stack rather than `ast.NodeVisitor`, whose per node dispatch dominates the
+    cost on large files.
+    """
 
     def __init__(self):
-        self.import_wrappers = {}
+        self.import_keys = {}
+        self.import_linenos = {}
         self.definitions = []
-
-    def store_import(self, node, cls):
-        for i, alias in enumerate(node.names):
+        # (index of the outermost definition or None at module level, dotted name) -> [last line used, uses]
+        self.uses = {}
+
+    def visit(self, root: ast.AST, definition_idx=None):
+        stack = [root]
+        pop, push, push_all = stack.pop, stack.append, stack.extend
+        while stack:
+            node = pop()
+            node_type = type(node)
+            if node_type is ast.Name:
+                if type(node.ctx) is ast.Load:
+                    self.use(definition_idx, node, node.id)
+                continue
+            if node_type is ast.Attribute:
+                res = get_dotted_name(node)
+                if res is not None and type(res[0].ctx) is ast.Load:
+                    self.use(definition_idx, *res)
+                    continue
+            elif definition_idx is None and node is not root:
+                if node_type in DEFINITION_TYPES:
+                    self.definitions.append(node)
+                    self.visit(node, len(self.definitions) - 1)
+                    continue
+                if node_type is ast.Import or node_type is ast.ImportFrom:
+                    self.store_import(node)
+            # Children are pushed in reverse, so nodes are visited in source order. Lists may also hold identifiers
+            # (`global` names) or None (`**` in dict displays), which have no fields.
+            for field in getattr(node_type, '_fields', ())[::-1]:
+                value = getattr(node, field, None)
+                if type(value) is list:
+                    push_all(value[::-1])
+                elif isinstance(value, ast.AST):
+                    push(value)
+
+    def store_import(self, node):
+        for alias in node.names:
             eff_name = get_eff_name(alias)
-            self.import_wrappers[eff_name] = (cls(node, i))
-        self.generic_visit(node)
-
-    def visit_Import(self, node: ast.Import):
-        self.store_import(node, ImportWrapper)
-
-    def visit_ImportFrom(self, node: ast.ImportFrom):
-        self.store_import(node, ImportFromWrapper)
-
-    def visit_FunctionDef(self, node):
-        self.definitions.append(node)
-
-    def visit_ClassDef(self, node):
-        self.definitions.append(node)
-
-
-class RejectingVisitor(ast.NodeVisitor):
-
-    def __init__(self, imported_names):
-        self.imported_names = imported_names
-        self.used = []
-
-    def visit_Name(self, name):
-        if name.id not in self.imported_names:
-            self.generic_visit(name)
-            return
-        if name.lineno < self.imported_names[name.id].get_statement().lineno:
-            self.generic_visit(name)
-            return
-        self.used.append(name)
-
-    def get_unused_import_names(self):
-        used_set = set(u.id for u in self.used)
-        imported_set = set(self.imported_names.keys())
-        return imported_set.difference(used_set)
-
-    def get_used_import_names(self):
-        return [self.imported_names[u.id] for u in self.used]
+            self.import_keys[eff_name] = ImportKey.from_alias(node, alias)
+            self.import_linenos[eff_name] = node.lineno
+
+    def use(self, definition_idx, name: ast.Name, dotted_name: str):
+        key = definition_idx, dotted_name
+        use = self.uses.get(key)
+        if use is None:
+            self.uses[key] = [name.lineno, 1]
+        else:
+            use[0] = max(use[0], name.lineno)
+            use[1] += 1
+
+    def get_used_imports(self):
+        """Yields `(definition index or None, import key, uses)`, in order of first use.
+
+        A dotted name is matched to the import with its longest prefix, e.g. `os.path.join` to `import os.path`
+        rather than `import os`. A name bound only by `import a.b` and `import a.c` uses both. Uses before the line
+        of the import are ignored.
+        """
+        by_root = {}
+        for key in self.import_keys:
+            by_root.setdefault(key.split('.')[0], []).append(key)
+        for (definition_idx, dotted_name), (lineno, count) in self.uses.items():
+            parts = dotted_name.split('.')
+            keys = by_root.get(parts[0], [])
+            if not keys:
+                continue
+            prefixes = ('.'.join(parts[:end]) for end in range(len(parts), 0, -1))
+            matched = next((prefix for prefix in prefixes if prefix in self.import_keys), None)
+            for key in ([matched] if matched is not None else keys):
+                if lineno >= self.import_linenos[key]:
+                    yield definition_idx, key, count
 
 
 def read_source_file(path_to_module):
@@ -109,12 +144,120 @@ def read_source_file(path_to_module):
         return None
 
 
-def join_processes(processes):
-    for process in processes:
-        if process is None:
-            continue
-        process.join()
-        process.close()
+def get_file_stat(filename):
+    """`(mtime, size, ctime)`, stored in FILENAMES to skip unchanged files without reading them."""
+    stat = os.stat(filename)
+    return stat.st_mtime, stat.st_size, stat.st_ctime
+
+
+def is_unchanged(state, file_stat):
+    """Whether a file with the FILENAMES `(content_hash, mtime, size, ctime)` state can be skipped.
+
+    Edits can keep the mtime, e.g. `touch -r` or several writes within the timestamp resolution, but they change the
+    ctime, which cannot be set, or the size. A changed stat only means the file is read and hashed again.
+    """
+    return state is not None and state[0] is not None and tuple(state[1:]) == file_stat
+
+
+def get_content_hash(source):
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class DefinitionAnalysis:
+    type: str
+    name: str
+    start_no: int
+    end_no: int
+    imports: List[int]  # positions in `FileAnalysis.imports` of the distinct imports it uses
+
+
+@dataclass
+class FileAnalysis:
+    """The static analysis of a file, small enough to be sent back from a parsing worker."""
+    filename: str
+    content_hash: str
+    imports: List[str]  # module level import statements, one per imported name
+    module_level_uses: List[int]  # how many times each import is used outside of any definition
+    definitions: List[DefinitionAnalysis]
+    parse_seconds: float = 0.  # spent in ast.parse by the worker
+    visit_seconds: float = 0.  # spent finding the definitions, imports and uses
+
+
+def analyze_source(filename: str, source: str):
+    start = time.perf_counter()
+    root = ast.parse(source)
+    parsed = time.perf_counter()
+    visitor = UsageVisitor()
+    visitor.visit(root)
+    code_strs = {key: import_key.code_str for key, import_key in visitor.import_keys.items()}
+    positions = {key: i for i, key in enumerate(code_strs)}
+    used = [{} for _ in visitor.definitions]
+    module_level_uses = [0] * len(code_strs)
+    for definition_idx, key, count in visitor.get_used_imports():
+        if definition_idx is None:
+            module_level_uses[positions[key]] += count
+        else:
+            used[definition_idx][positions[key]] = True
+    definitions = [DefinitionAnalysis(type=type(definition).__name__,
+                                      name=definition.name,
+                                      start_no=definition.lineno,
+                                      end_no=definition.end_lineno,
+                                      imports=list(used[i]))
+                   for i, definition in enumerate(visitor.definitions)]
+    return FileAnalysis(filename=filename, content_hash=get_content_hash(source), imports=list(code_strs.values()),
+                        module_level_uses=module_level_uses, definitions=definitions, parse_seconds=parsed - start,
+                        visit_seconds=time.perf_counter() - parsed)
+
+
+def analyze_file(filename: str):
+    with open(filename) as in_file:
+        return analyze_source(filename, in_file.read())
+
+
+class ParsingPool:
+    """Reads, parses and visits files on `processes` workers, yielding their analyses in the order given.
+
+    With a single process, or fewer files than a chunk, files are analyzed in the current process.
+    """
+
+    def __init__(self, processes: Optional[int] = None, chunksize: int = 8):
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.chunksize = chunksize
+        self.pool = None
+
+    def start(self):
+        if self.pool is None and self.processes > 1:
+            self.pool = Pool(processes=self.processes)
+
+    def analyze(self, filenames: Iterable[str], task=analyze_file):
+        """Applies `task` to every file, `filenames` can also be a lazy iterable."""
+        if self.processes <= 1 or (isinstance(filenames, list) and len(filenames) <= self.chunksize):
+            return map(task, filenames)
+        self.start()
+        return self.pool.imap(task, filenames, chunksize=self.chunksize)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self.pool is not None:
+            self.pool.terminate()
+        self.close()
+
+
+def is_relative_to(path: Path, directory: Path):
+    try:
+        path.relative_to(directory)
+        return True
+    except ValueError:
+        return False
 
 
 def get_std_list():
@@ -127,11 +270,47 @@ def get_std_list():
 class ImportTracker:
 
     def __init__(self, output_directory: Union[str, Path],
-                 blacklisting_function=None):
+                 blacklisting_function=None,
+                 probe_engine: str = 'pool',
+                 preload_modules: Optional[List[str]] = None,
+                 probe_cache: Optional[ProbeCache] = None,
+                 parsing_processes: Optional[int] = 1,
+                 probe_timeout: Optional[float] = 300.,
+                 probe_memory_limit: Optional[int] = None,
+                 probe_retries: int = 2,
+                 retry_backoff: float = 1.,
+                 verbose: bool = True):
         self.output_directory = Path(output_directory)
         self.output_directory.mkdir(exist_ok=True)
         self.stdlib_packages_set = set(get_std_list())
         self.blacklisting_function = blacklisting_function
+        self.probe_engine = probe_engine
+        self.preload_modules = preload_modules
+        self.preloaded = None
+        self.probe_cache = probe_cache
+        self.parsing_processes = parsing_processes
+        self.static_resolver = None
+        self.probe_timeout = probe_timeout
+        self.probe_memory_limit = probe_memory_limit
+        self.probe_retries = probe_retries
+        self.retry_backoff = retry_backoff
+        self.verbose = verbose
+        self._attempts = {}
+        self._retries = []
+        self._retry_count = 0
+        self._probe_started = {}
+        self._tracking_policy = None
+        self._writer = None
+
+    def __getstate__(self):
+        # Probe workers get a copy of the tracker, without its connections, which cannot be pickled under spawn.
+        state = self.__dict__.copy()
+        state.update(_writer=None, probe_cache=None, static_resolver=None)
+        return state
+
+    def _print(self, *args):
+        if self.verbose:
+            print(*args)
 
     def module_should_be_tracked(self, key):
         if key.startswith('_'):
@@ -144,6 +323,15 @@ class ImportTracker:
             return False
         return True
 
+    def get_tracking_policy(self):
+        """Fingerprint of what `should_be_tracked` keeps, so cached probe results are only reused with the same one."""
+        if self._tracking_policy is None:
+            policy = [type(self).__qualname__, sorted(self.stdlib_packages_set)] + [
+                get_callable_fingerprint(func) for func in (type(self).module_should_be_tracked,
+                                                            type(self).should_be_tracked, self.blacklisting_function)]
+            self._tracking_policy = hashlib.sha256(json.dumps(policy).encode()).hexdigest()
+        return self._tracking_policy
+
     def should_be_tracked(self, key, module, modules_before):
         if key in modules_before:
             return False
@@ -153,64 +341,132 @@ class ImportTracker:
             return False
         return True
 
-    def dump_for_directory(self, directory: Union[str, Path], max_concurrent_processes=8):
+    def dump_for_directory(self, directory: Union[str, Path], max_concurrent_processes=8, shard_index: int = 0,
+                           shard_count: int = 1):
+        """Scans the `.py` files of `directory`, or with `shard_count > 1` only those of shard `shard_index`.
+
+        Shards are meant to be scanned in parallel, each into its own output directory, and combined with
+        `sharding.merge_dumps`. Files of other shards are pruned from the output directory like deleted files.
+        """
         directory = Path(directory)
-        filenames = list(directory.glob('**/*.py'))
-        self.dump_for_filenames(filenames, max_concurrent_processes)
+        filenames = [filename for filename in directory.glob('**/*.py')
+                     if shard_count == 1 or get_shard(filename.relative_to(directory), shard_count) == shard_index]
+        with lock_dump(self._get_db_path()):
+            self.prune_deleted_files(directory, filenames)
+            self._get_writer().insert_scanned_directory(directory)
+            self._scan_filenames(filenames, max_concurrent_processes)
+
+    def prune_deleted_files(self, directory: Union[str, Path], filenames):
+        existing = set(str(filename) for filename in filenames)
+        writer = self._get_writer()
+        for filename in list(writer.filenames):
+            if filename not in existing and is_relative_to(Path(filename), Path(directory)):
+                self._print(f'Filename {filename} has been deleted, pruning.')
+                writer.delete_filename(filename)
 
     def dump_for_filenames(self, filenames, max_concurrent_processes):
-        already_traversed = set()
-        processes = []
-        for i, filename in enumerate(filenames):
-            with open(filename) as in_file:
-                print(f'[{i}/{len(filenames)}]: Dumping {filename}...')
-                processes += self._dump_for_filename(str(filename),
-                                                     in_file.read(),
-                                                     already_traversed)
-                if len(processes) > max_concurrent_processes:
-                    join_processes(processes)
-                    processes = []
-
-    def _dump_for_filenames(self, filenames, code_strs, already_traversed):
-        processes = []
-        for i, filename in enumerate(filenames):
-            print(f'[{i}/{len(filenames)}]: Dumping {filename}...')
-            processes += self._dump_for_filename(filename, code_strs[i], already_traversed)
-        join_processes(processes)
-
-    def _dump_for_filename(self, filename, code_str, already_traversed):
-        try:
-            self._insert_filename(filename)
-        except IntegrityError:
-            print(f'Filename {filename} has already been traversed, skipping.')
-            return []
-        visitor = ImportsAndDefinitionsVisitor()
-        visitor.visit(ast.parse(code_str))
-        processes = []
-        for key, wrapper in visitor.import_wrappers.items():
-            code_str = astunparse.unparse(wrapper.get_statement()).strip()
-            p = self._dump_external_dependencies_of_stmt(code_str, already_traversed)
-            processes.append(p)
-            self._store_arc('FILENAMES_TO_IMPORTS', 'filename_path', 'import_code_str', filename, code_str)
-        for definition in visitor.definitions:
+        with lock_dump(self._get_db_path()):
+            self._scan_filenames(filenames, max_concurrent_processes)
+
+    def _scan_filenames(self, filenames, max_concurrent_processes):
+        with profiling.timer('scan'):
+            self._scan_filenames_timed(filenames, max_concurrent_processes)
+
+    def _scan_filenames_timed(self, filenames, max_concurrent_processes):
+        # Executing probes also upgrade the statements that were only resolved statically so far.
+        static_only = set() if self.probe_engine == STATIC else self._get_writer().get_code_strs(STATIC)
+        already_traversed = self._get_writer().get_code_strs() - static_only
+        to_analyze, file_stats = [], {}
+        for filename in filenames:
+            filename = str(filename)
+            file_stats[filename] = get_file_stat(filename)
+            if is_unchanged(self._get_writer().get_file_state(filename), file_stats[filename]):
+                self._print(f'Filename {filename} has not been modified, skipping.')
+                continue
+            to_analyze.append(filename)
+        # The parsing workers are started before the probing ones, so they are not forked from a threaded process.
+        with ParsingPool(self.parsing_processes) as parsing_pool:
+            analyses = parsing_pool.analyze(to_analyze)
+            with make_prober(self, self.probe_engine, max_concurrent_processes) as prober:
+                for i, analysis in enumerate(analyses):
+                    self._print(f'[{i}/{len(to_analyze)}]: Dumping {analysis.filename}...')
+                    file_stat = file_stats[analysis.filename]
+                    for code_str in self._store_file_analysis(analysis, already_traversed, *file_stat):
+                        self._submit_probe(prober, code_str)
+                    self._store_probe_results(prober.completed())
+                    self._submit_due_retries(prober)
+                for code_str in sorted(static_only - set(already_traversed)):
+                    already_traversed.add(code_str)
+                    self._submit_probe(prober, code_str)
+                self._finish_probes(prober)
+        self.flush()
+
+    def _store_file_analysis(self, analysis: FileAnalysis, already_traversed, mtime=None, size=None, ctime=None):
+        """Writes the definitions and import arcs of an analyzed file, and returns the statements to probe."""
+        profiling.record('scan.parse', analysis.parse_seconds)
+        profiling.record('scan.visit', analysis.visit_seconds)
+        profiling.count('files_analyzed')
+        with profiling.timer('scan.write_file'):
+            return self._write_file_analysis(analysis, already_traversed, mtime, size, ctime)
+
+    def _write_file_analysis(self, analysis: FileAnalysis, already_traversed, mtime=None, size=None, ctime=None):
+        filename, content_hash = analysis.filename, analysis.content_hash
+        state = self._get_writer().get_file_state(filename)
+        if state is not None:
+            if state[0] == content_hash:
+                self._print(f'Filename {filename} has not changed, skipping.')
+                self._get_writer().update_file_state(filename, content_hash, mtime, size, ctime)
+                return []
+            self._print(f'Filename {filename} has changed, replacing its definitions.')
+            self._get_writer().delete_filename(filename)
+        self._insert_filename(filename, content_hash, mtime, size, ctime)
+        to_probe = []
+        for code_str, module_level_uses in zip(analysis.imports, analysis.module_level_uses):
+            if self._should_probe(code_str, already_traversed):
+                to_probe.append(code_str)
+            self._get_writer().insert_file_import(filename, code_str, module_level_uses)
+        for definition in analysis.definitions:
             definition_id = self._insert_definition(definition, filename)
-            rejecting_vistor = RejectingVisitor(visitor.import_wrappers)
-            rejecting_vistor.visit(definition)
-            for wrapper in rejecting_vistor.get_used_import_names():
-                code_str = astunparse.unparse(wrapper.get_statement()).strip()
-                self._store_arc('DEFINITIONS_TO_IMPORTS', 'definition_id', 'import_code_str', definition_id, code_str)
-        return processes
+            for position in definition.imports:
+                self._store_arc('DEFINITIONS_TO_IMPORTS', 'definition_id', 'import_code_str', definition_id,
+                                analysis.imports[position])
+        return to_probe
 
     def _get_packages_data_in_current_process(self, code_str, node_identifier):
+        return self._probe_in_current_process(code_str, node_identifier).records
+
+    def _probe_in_current_process(self, code_str, node_identifier=None):
+        node_identifier = code_str if node_identifier is None else node_identifier
         try:
-            print(f'Collecting {node_identifier} "{code_str}"')
+            self._print(f'Collecting {node_identifier} "{code_str}"')
             modules_before = sys.modules.copy()
-            a = exec(code_str)
+            with ImportTimer() as timer:
+                rss_before = get_rss_bytes()
+                start = time.perf_counter()
+                if self.preloaded is None:
+                    a = exec(code_str)
+                else:
+                    with ImportRecorder() as recorder:
+                        a = exec(code_str)
+                import_seconds = time.perf_counter() - start
+                rss_bytes = subtract(get_rss_bytes(), rss_before)
+            costs = timer.costs
+            if self.preloaded is not None:
+                modules_before = self._exclude_preloaded(modules_before, recorder.requested)
+                # Preloaded modules reused by the statement were paid for once in the worker, before the probe.
+                reused = {key: self.preloaded.costs[key] for key in self.preloaded.names
+                          if key not in modules_before and key in self.preloaded.costs}
+                reused_rss = [rss for _, rss in reused.values()]
+                import_seconds += sum(seconds for seconds, _ in reused.values())
+                rss_bytes = None if rss_bytes is None or None in reused_rss else rss_bytes + sum(reused_rss)
+                costs = {**reused, **costs}
             modules_after = sys.modules.copy()
-            print(f'Collecting after {node_identifier} "{code_str}"')
-        except Exception:
-            print(traceback.format_exc())
-            return
+            self._print(f'Collecting after {node_identifier} "{code_str}"')
+        except (Exception, SystemExit) as e:
+            error = traceback.format_exc()
+            self._print(error)
+            exit_code = get_system_exit_code(e) if isinstance(e, SystemExit) else None
+            return failure(code_str, 'memory' if isinstance(e, MemoryError) else 'error', exit_code, error)
         records = []
         for key, module in modules_after.items():
             if not self.should_be_tracked(key, module, modules_before):
@@ -226,86 +482,140 @@ class ImportTracker:
             except:
                 record.append(None)
             record.append(node_identifier)
+            record.extend(costs.get(key, (None, None)))
             records.append(record)
-        out_path = self.output_directory / f'transitive_imports'
-        out_path.mkdir(exist_ok=True)
-        with open(out_path / f'{code_str}.pkl', 'wb') as out_file:
-            pickle.dump(records, out_file)
-        print(f'Exiting {node_identifier} "{code_str}"')
-
-    def _insert_code_str(self, code_str):
-        return self._insert_unique('IMPORTS', 'code_str', code_str)
-
-    def _insert_filename(self, filename):
-        return self._insert_unique('FILENAMES', 'path', filename)
-
-    def _insert_unique(self, table_name, col_name, value):
-        with self._get_connection() as conn:
-            query = f"""INSERT INTO {table_name}({col_name}) VALUES (?)"""
-            c = conn.execute(query, [value])
-            conn.commit()
-            return c.lastrowid
-
-    def _get_file_for_module_name(self, module_str):
-        query = """
-SELECT path
-FROM IMPORT_DATA
-WHERE module = :module"""
-        with self._get_connection() as conn:
-            c = conn.cursor()
-            c.execute(query, {'module': module_str})
-            row = c.fetchone()
-            if row is None:
-                return None
-            return row[0]
-
-    def _dump_external_dependencies_of_stmt(self, code_str, already_traversed):
+        self._print(f'Exiting {node_identifier} "{code_str}"')
+        return ProbeResult(code_str, records, import_seconds=import_seconds, rss_bytes=rss_bytes)
+
+    def _probe_statically(self, code_str):
+        self._print(f'Resolving "{code_str}" statically')
+        try:
+            modules = self._get_static_resolver().resolve(code_str)
+        except (SyntaxError, ValueError):
+            modules = None
+        if modules is None:
+            self._print(f'Could not resolve "{code_str}" statically')
+            return ProbeResult(code_str, None, method=STATIC, status='error', error='Could not resolve statically')
+        records = []
+        for key, path in modules.items():
+            # There is no module object without executing it, so the blacklisting function gets None.
+            if not self.should_be_tracked(key, None, {}):
+                continue
+            records.append([get_root_module(key), key, path, None, code_str, None, None])
+        return ProbeResult(code_str, records, method=STATIC)
+
+    def _get_static_resolver(self):
+        if self.static_resolver is None:
+            self.static_resolver = StaticResolver(lambda name: name.split('.')[0] not in self.stdlib_packages_set)
+        return self.static_resolver
+
+    def _exclude_preloaded(self, modules_before, requested):
+        """Preloaded modules reachable from the probed statement count as imported by it."""
+        used_preloaded = self.preloaded.closure(requested)
+        return {key: module for key, module in modules_before.items() if key not in used_preloaded}
+
+    def _submit_probe(self, prober, code_str):
+        if self.probe_cache is not None:
+            with profiling.timer('probe_cache.get'):
+                result = self.probe_cache.get(code_str, self.get_tracking_policy())
+            if result is not None:
+                self._print(f'Code string "{code_str}" found in the probe cache.')
+                profiling.count('probe_cache_hits')
+                self._store_probe_results([result], cache=False)
+                return
+        if profiling.is_enabled():
+            self._probe_started[code_str] = time.perf_counter()
+        with profiling.timer('probe.submit'):
+            prober.submit(code_str)
+
+    def _finish_probes(self, prober):
+        """Waits for the pending probes, and for the retries of those that failed."""
+        self._store_probe_results(prober.finish())
+        while self._retries:
+            time.sleep(max(self._retries[0][0] - time.monotonic(), 0))
+            self._submit_due_retries(prober)
+            self._store_probe_results(prober.finish())
+
+    def _submit_due_retries(self, prober):
+        while self._retries and self._retries[0][0] <= time.monotonic():
+            _, _, code_str = heapq.heappop(self._retries)
+            prober.submit(code_str)
+
+    def _store_probe_failure(self, result: ProbeResult):
+        code_str = result.code_str
+        attempts = self._attempts[code_str] = self._attempts.get(code_str, 0) + 1
+        self._get_writer().insert_probe_failure(code_str, result.method, result.status, result.exit_code, result.error)
+        if result.status in RETRIED_STATUSES and attempts <= self.probe_retries:
+            delay = self.retry_backoff * 2 ** (attempts - 1)
+            self._print(f'Probing "{code_str}" failed ({result.status}), retrying in {delay:.1f}s.')
+            self._retry_count += 1
+            heapq.heappush(self._retries, (time.monotonic() + delay, self._retry_count, code_str))
+
+    def _store_probe_results(self, results, cache=True):
+        for result in results:
+            self._profile_probe_result(result)
+            if result.failed or result.records is None:
+                self._store_probe_failure(result)
+            else:
+                self._get_writer().delete_probe_failure(result.code_str)
+                self._store_transitive_imports(result.code_str, result.records, result.method)
+                self._get_writer().insert_import(result.code_str, result.import_seconds, result.rss_bytes,
+                                                 result.method)
+                if cache and self.probe_cache is not None and result.method == DYNAMIC:
+                    self.probe_cache.put(result, self.get_tracking_policy())
+
+    def _profile_probe_result(self, result: ProbeResult):
+        """`probe.latency` is from submission to result, `probe.import` only the execution of the statement."""
+        started = self._probe_started.pop(result.code_str, None)
+        if started is not None:
+            profiling.record('probe.latency', time.perf_counter() - started)
+        if result.import_seconds is not None:
+            profiling.record('probe.import', result.import_seconds)
+        profiling.count(f'probes_{result.status}')
+
+    def _store_transitive_imports(self, code_str, records, method=DYNAMIC):
+        self._get_writer().insert_import_data(code_str, records, method)
+
+    def _insert_filename(self, filename, content_hash=None, mtime=None, size=None, ctime=None):
+        self._get_writer().insert_filename(filename, content_hash, mtime, size, ctime)
+
+    def _should_probe(self, code_str, already_traversed):
         if code_str in already_traversed:
-            print(f'Code string "{code_str}" has already been traversed, skipping.')
-            return
-        p = self._dump_package_data(code_str, code_str)
+            self._print(f'Code string "{code_str}" has already been traversed, skipping.')
+            return False
         already_traversed.add(code_str)
-        return p
+        return True
 
     def _store_arc(self, table_name, col0, col1, val0, val1):
-        conn = self._get_connection()
         query = f"""INSERT INTO {table_name}({col0}, {col1}) VALUES (?,?)"""
-        c = conn.cursor()
-        c.execute(query, (val0, val1))
-        conn.commit()
-
-    def _insert_definition(self, definition, filename):
-        with self._get_connection() as conn:
-            query = f"""
-INSERT INTO DEFINITIONS(type, name, start_no, end_no, filename_path) 
-VALUES (?, ?, ?, ?, ?)
-"""
-            c = conn.cursor()
-            c.execute(query, [str(type(definition).__name__),
-                              definition.name,
-                              definition.lineno,
-                              definition.end_lineno,
-                              filename])
-            conn.commit()
-            return c.lastrowid
-
-    def _get_connection(self):
-        db_path = self._get_db_path()
-        should_init = not db_path.exists()
-        conn = sqlite3.connect(self._get_db_path())
-        if should_init:
-            schema_path = Path(__file__).parent / 'schema.sql'
-            with open(schema_path) as schema_file:
-                conn.executescript(schema_file.read())
-        return conn
+        self._get_writer().add(query, (val0, val1))
+
+    def _insert_definition(self, definition: DefinitionAnalysis, filename):
+        return self._get_writer().insert_definition(definition.type,
+                                                    definition.name,
+                                                    definition.start_no,
+                                                    definition.end_no,
+                                                    filename)
+
+    def _get_writer(self):
+        if self._writer is None:
+            self._writer = DumpWriter(self._get_db_path())
+        return self._writer
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def _get_db_path(self):
         return self.output_directory / 'modules.db'
-
-    def _dump_package_data(self, code_str, node_id):
-        args = (code_str, node_id)
-        p = Process(target=self._get_packages_data_in_current_process,
-                    args=args,
-                    )
-        p.start()
-        return p
@@ -0,0 +1,323 @@
+import ast
+import difflib
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import pandas as pd
+
+from py_import_tree.import_key import ImportKey
+
+
+def format_import(stmt: Union[ast.Import, ast.ImportFrom], aliases: List[ast.alias]):
+    """Formats an import statement with only `aliases`, in the same form as the statements stored in the dump."""
+    names = ', '.join(alias.name if alias.asname is None else f'{alias.name} as {alias.asname}' for alias in aliases)
+    if isinstance(stmt, ast.Import):
+        return f'import {names}'
+    return f"from {'.' * stmt.level}{stmt.module or ''} import {names}"
+
+
+def get_bound_name(stmt, alias: ast.alias):
+    return ImportKey.from_alias(stmt, alias).bound_name
+
+
+@dataclass
+class ImportedName:
+    """A name bound by a module level import statement, and where the module uses it."""
+    name: str
+    code_str: str
+    statement: Union[ast.Import, ast.ImportFrom]
+    alias: ast.alias
+    import_time: bool = False  # used while the module is being imported, e.g. at module level or in a class body
+    rebound: bool = False  # assigned, deleted, shadowed or imported again, so moving the import is not safe
+    hosts: List[ast.AST] = field(default_factory=list)  # outermost functions whose bodies use the name
+
+    @property
+    def strategy(self):
+        if self.import_time or self.rebound:
+            return None
+        return 'function' if len(self.hosts) > 0 else 'getattr'
+
+
+class ImportUseVisitor(ast.NodeVisitor):
+    """Classifies the uses of module level imported names as happening at import time or inside function bodies.
+
+    Decorators, default values, class bodies and, without `from __future__ import annotations`, annotations all run
+    while the module is imported. Lambdas at module level are treated as import time, since they cannot hold an
+    import statement.
+    """
+
+    def __init__(self, names: Dict[str, ImportedName], deferred_annotations: bool):
+        self.names = names
+        self.deferred_annotations = deferred_annotations
+        self.statements = set(id(imported.statement) for imported in names.values())
+        self.host = None
+
+    def use(self, name):
+        imported = self.names.get(name)
+        if imported is None:
+            return
+        if self.host is None:
+            imported.import_time = True
+        elif self.host not in imported.hosts:
+            imported.hosts.append(self.host)
+
+    def rebind(self, name):
+        if name in self.names:
+            self.names[name].rebound = True
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Load):
+            self.use(node.id)
+        else:
+            self.rebind(node.id)
+
+    def visit_Global(self, node):
+        for name in node.names:
+            self.rebind(name)
+
+    visit_Nonlocal = visit_Global
+
+    def visit_Import(self, node):
+        if id(node) in self.statements:
+            return
+        for alias in node.names:
+            self.rebind(get_bound_name(node, alias))
+
+    visit_ImportFrom = visit_Import
+
+    def visit_arg(self, node: ast.arg):
+        self.rebind(node.arg)
+        if node.annotation is not None:
+            self.visit_annotation(node.annotation)
+
+    def visit_annotation(self, node):
+        if not self.deferred_annotations:
+            self.visit(node)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign):
+        self.visit(node.target)
+        self.visit_annotation(node.annotation)
+        if node.value is not None:
+            self.visit(node.value)
+
+    def visit_FunctionDef(self, node):
+        self.rebind(node.name)
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self.visit(node.args)
+        if node.returns is not None:
+            self.visit_annotation(node.returns)
+        host = self.host
+        self.host = node if host is None else host
+        for stmt in node.body:
+            self.visit(stmt)
+        self.host = host
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self.rebind(node.name)
+        self.generic_visit(node)
+
+
+@dataclass
+class ModuleImports:
+    names: Dict[str, ImportedName]
+    has_getattr: bool
+
+
+def analyze_module_imports(source: str):
+    module = ast.parse(source)
+    deferred_annotations = False
+    names = {}
+    counts = defaultdict(int)
+    for stmt in module.body:
+        if isinstance(stmt, ast.ImportFrom) and stmt.module == '__future__':
+            deferred_annotations |= any(alias.name == 'annotations' for alias in stmt.names)
+            continue
+        if not isinstance(stmt, (ast.Import, ast.ImportFrom)) or any(alias.name == '*' for alias in stmt.names):
+            continue
+        for alias in stmt.names:
+            key = ImportKey.from_alias(stmt, alias)
+            counts[key.bound_name] += 1
+            names[key.bound_name] = ImportedName(name=key.bound_name, code_str=key.code_str, statement=stmt, alias=alias)
+    for name, count in counts.items():
+        names[name].rebound = count > 1
+    ImportUseVisitor(names, deferred_annotations).visit(module)
+    has_getattr = any(isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)) and stmt.name == '__getattr__'
+                      for stmt in module.body)
+    return ModuleImports(names=names, has_getattr=has_getattr)
+
+
+def read_source(filename):
+    try:
+        with open(filename) as in_file:
+            return in_file.read()
+    except (OSError, UnicodeError):
+        return None
+
+
+def find_lazy_import_candidates(tree, import_weights: pd.Series, max_definitions: Optional[int] = None,
+                                files: Optional[List[str]] = None):
+    """Module level imports that can be deferred, heaviest first.
+
+    `strategy` is `'function'` for names only used inside function bodies, which can be imported in those functions,
+    and `'getattr'` for names the module never uses itself, typically re-exports, which can be served by a PEP 562
+    module `__getattr__`. `definitions` lists the definitions using the import according to DEFINITIONS_TO_IMPORTS.
+    """
+    definitions = tree.definitions.merge(tree.definitions_to_imports, left_on='id', right_on='definition_id')
+    used_by = definitions.groupby(['filename_path', 'import_code_str'])['name'] \
+        .agg(lambda names: list(dict.fromkeys(names))).to_dict()
+    rows = []
+    for filename in (tree.filenames['path'].tolist() if files is None else files):
+        source = read_source(filename)
+        if source is None:
+            continue
+        try:
+            module_imports = analyze_module_imports(source)
+        except SyntaxError:
+            continue
+        for imported in module_imports.names.values():
+            strategy = imported.strategy
+            if strategy is None or (strategy == 'getattr' and module_imports.has_getattr):
+                continue
+            users = used_by.get((filename, imported.code_str), [])
+            if max_definitions is not None and len(users) > max_definitions:
+                continue
+            rows.append((filename, imported.code_str, imported.name, strategy,
+                         import_weights.get(imported.code_str, 0.), users,
+                         [host.name for host in imported.hosts]))
+    res = pd.DataFrame(rows, columns=['filename', 'import', 'name', 'strategy', 'weight', 'definitions', 'functions'])
+    return res.sort_values(by='weight', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def get_start_lineno(stmt: ast.stmt):
+    """First line of `stmt`, including the decorators of a definition."""
+    return min([stmt.lineno] + [decorator.lineno for decorator in getattr(stmt, 'decorator_list', [])])
+
+
+def get_body_insertion_point(function: ast.AST):
+    """Line index before which imports are inserted into `function`, and their indentation; None if not possible."""
+    body = function.body
+    first = body[0]
+    is_docstring = isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) \
+        and isinstance(first.value.value, str)
+    if first.lineno == function.lineno:
+        return None
+    if not is_docstring:
+        return get_start_lineno(first) - 1, first.col_offset
+    if len(body) > 1:
+        return get_start_lineno(body[1]) - 1, body[1].col_offset
+    return first.end_lineno, first.col_offset
+
+
+def parses(source: str):
+    try:
+        ast.parse(source)
+        return True
+    except SyntaxError:
+        return False
+
+
+def make_getattr_block(imported_names: List[ImportedName]):
+    lines = ['', '', 'def __getattr__(name):']
+    for imported in imported_names:
+        lines += [f'    if name == {imported.name!r}:',
+                  f'        {imported.code_str}',
+                  f'        globals()[name] = {imported.name}',
+                  f'        return {imported.name}']
+    lines.append("    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')")
+    return [line + '\n' for line in lines]
+
+
+def rewrite_lazy_imports(source: str, names: List[str], keep_attributes: bool = True):
+    """Defers the module level imports binding `names`.
+
+    Names used in functions are imported at the top of every outermost function using them. Names the module does
+    not use, and with `keep_attributes` also the moved ones, stay available as module attributes through a PEP 562
+    `__getattr__`. Returns the new source and the names that were not rewritten, including those whose rewrite would
+    not parse.
+    """
+    module_imports = analyze_module_imports(source)
+    new_source, skipped = _rewrite_lazy_imports(source, module_imports, names, keep_attributes)
+    if parses(new_source):
+        return new_source, skipped
+    invalid = set(name for name in names if name not in skipped and
+                  not parses(_rewrite_lazy_imports(source, module_imports, [name], keep_attributes)[0]))
+    new_source, skipped = _rewrite_lazy_imports(source, module_imports, [name for name in names if name not in invalid],
+                                                keep_attributes)
+    if not parses(new_source):
+        return source, list(names)
+    return new_source, [name for name in names if name in invalid or name in skipped]
+
+
+def _rewrite_lazy_imports(source: str, module_imports: ModuleImports, names: List[str], keep_attributes: bool):
+    lines = source.splitlines(keepends=True)
+    if lines and not lines[-1].endswith('\n'):
+        lines[-1] += '\n'
+    insertions = defaultdict(list)
+    lazy = []
+    skipped = []
+    for name in names:
+        imported = module_imports.names.get(name)
+        strategy = imported.strategy if imported is not None else None
+        points = [get_body_insertion_point(host) for host in imported.hosts] if strategy == 'function' else []
+        if strategy is None or None in points or (strategy == 'getattr' and module_imports.has_getattr):
+            skipped.append(name)
+            continue
+        for line_idx, indent in points:
+            insertions[line_idx].append(' ' * indent + imported.code_str + '\n')
+        lazy.append(imported)
+    replacements = {}
+    by_statement = defaultdict(list)
+    for imported in lazy:
+        by_statement[id(imported.statement)].append(imported)
+    for imported_names in by_statement.values():
+        stmt = imported_names[0].statement
+        moved = set(id(imported.alias) for imported in imported_names)
+        remaining = [alias for alias in stmt.names if id(alias) not in moved]
+        text = [' ' * stmt.col_offset + format_import(stmt, remaining) + '\n'] if remaining else []
+        replacements[stmt.lineno - 1] = stmt.end_lineno, text
+    res = []
+    line_idx = 0
+    while line_idx < len(lines):
+        res.extend(insertions.get(line_idx, []))
+        if line_idx in replacements:
+            end, text = replacements[line_idx]
+            res.extend(text)
+            line_idx = end
+            continue
+        res.append(lines[line_idx])
+        line_idx += 1
+    res.extend(insertions.get(len(lines), []))
+    attributes = [imported for imported in lazy if keep_attributes or imported.strategy == 'getattr']
+    if attributes and not module_imports.has_getattr:
+        res.extend(make_getattr_block(attributes))
+    return ''.join(res), skipped
+
+
+def make_lazy_import_patch(candidates: pd.DataFrame, root: Optional[Union[str, Path]] = None,
+                           keep_attributes: bool = True):
+    """Unified diff applying `candidates` (rows of `find_lazy_import_candidates`), to apply with `git apply`.
+
+    Paths in the diff are relative to `root`, by default the common directory of the files.
+    """
+    if len(candidates) == 0:
+        return ''
+    filenames = list(dict.fromkeys(candidates['filename']))
+    root = Path(root) if root is not None else Path(os.path.commonpath(
+        [os.path.dirname(os.path.abspath(filename)) for filename in filenames]))
+    chunks = []
+    for filename in filenames:
+        source = read_source(filename)
+        names = candidates.loc[candidates['filename'] == filename, 'name'].tolist()
+        new_source, skipped = rewrite_lazy_imports(source, names, keep_attributes)
+        if skipped:
+            print(f'Could not defer {skipped} in {filename}, skipping them.')
+        path = os.path.relpath(os.path.abspath(filename), root)
+        chunks.extend(difflib.unified_diff(source.splitlines(keepends=True), new_source.splitlines(keepends=True),
+                                           fromfile=f'a/{path}', tofile=f'b/{path}'))
+    return ''.join(chunks)
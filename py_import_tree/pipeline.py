@@ -0,0 +1,335 @@
+import json
+import math
+import queue
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Union
+
+from py_import_tree.import_tracker import ImportTracker, ParsingPool, analyze_file, get_file_stat, is_unchanged
+from py_import_tree.probing import make_prober
+from py_import_tree.sharding import get_shard
+from py_import_tree.static_resolver import STATIC
+from py_import_tree.storage import lock_dump
+
+# Marks the end of the items of a queue.
+DONE = object()
+
+
+def timed_analyze_file(filename: str):
+    start = time.perf_counter()
+    return analyze_file(filename), time.perf_counter() - start
+
+
+class LatencyHistogram:
+    """Latencies in power of two buckets, from `min_seconds` up."""
+
+    def __init__(self, min_seconds: float = 1e-4):
+        self.min_seconds = min_seconds
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, seconds: float):
+        bucket = 0 if seconds <= self.min_seconds else math.ceil(math.log2(seconds / self.min_seconds))
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def get_upper_bound(self, bucket: int):
+        return self.min_seconds * 2 ** bucket
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the `q` quantile."""
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= q * self.count:
+                return min(self.get_upper_bound(bucket), self.max)
+        return 0.
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_seconds': self.total,
+            'mean_seconds': self.total / self.count if self.count > 0 else 0.,
+            'p50_seconds': self.quantile(.5),
+            'p90_seconds': self.quantile(.9),
+            'p99_seconds': self.quantile(.99),
+            'max_seconds': self.max,
+            'buckets': {f'{self.get_upper_bound(bucket):.6g}': self.buckets[bucket] for bucket in sorted(self.buckets)},
+        }
+
+
+COUNTERS = ['files_discovered', 'files_skipped', 'files_parsed', 'files_written', 'probes_submitted',
+            'probes_completed', 'probes_failed']
+
+
+class ScanMetrics:
+    """Counters and per stage latencies of a `PipelineScanner` run, updated from several threads."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.latencies = defaultdict(LatencyHistogram)
+        self.lock = threading.Lock()
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            self.latencies[stage].add(seconds)
+
+    def snapshot(self, **gauges):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            res = {'elapsed_seconds': elapsed, **self.counters, **gauges}
+            res['files_per_second'] = self.counters['files_written'] / elapsed if elapsed > 0 else 0.
+            res['stages'] = {stage: histogram.to_dict() for stage, histogram in self.latencies.items()}
+        return res
+
+
+class MeteredProber:
+    """Wraps a prober to count probes in flight and measure the latency from submission to result."""
+
+    def __init__(self, prober, metrics: ScanMetrics):
+        self.prober = prober
+        self.metrics = metrics
+        self.submitted = {}
+
+    @property
+    def in_flight(self):
+        return len(self.submitted)
+
+    def submit(self, code_str):
+        self.submitted[code_str] = time.monotonic()
+        self.metrics.count('probes_submitted')
+        self.prober.submit(code_str)
+
+    def _collect(self, results):
+        for result in results:
+            self.metrics.observe('probe', time.monotonic() - self.submitted.pop(result.code_str))
+            self.metrics.count('probes_completed')
+            if result.failed or result.records is None:
+                self.metrics.count('probes_failed')
+            yield result
+
+    def completed(self):
+        return self._collect(self.prober.completed())
+
+    def finish(self):
+        return self._collect(self.prober.finish())
+
+
+class PipelineScanner:
+    """Scans files with discovery, parsing, writing and probing running at the same time.
+
+    Files are discovered lazily on a thread, read, parsed and visited on the tracker's parsing workers, and written
+    and probed on the calling thread, which owns the database connection. Every hand-off is bounded: at most
+    `queue_size` discovered files wait to be parsed, at most `queue_size` files are parsed or waiting to be written,
+    and writing pauses while `max_pending_probes` probes are running, so memory does not grow with the tree.
+
+    Instead of the per-file prints of `ImportTracker.dump_for_directory`, progress is reported every
+    `report_interval` seconds, and once at the end, as a `ScanMetrics.snapshot` dict passed to `progress` and/or
+    appended as a JSON line to `metrics_log`. Create the tracker with `verbose=False` to silence its other prints.
+    """
+
+    def __init__(self, tracker: ImportTracker, max_concurrent_processes: int = 8, queue_size: int = 64,
+                 max_pending_probes: Optional[int] = None, progress: Optional[Callable[[dict], None]] = None,
+                 metrics_log: Optional[Union[str, Path]] = None, report_interval: float = 1.,
+                 poll_interval: float = .01):
+        self.tracker = tracker
+        self.max_concurrent_processes = max_concurrent_processes
+        self.queue_size = queue_size
+        # The process prober only collects its batch once more than `max_concurrent_processes` probes are running.
+        self.max_pending_probes = max(max_pending_probes or 4 * max_concurrent_processes,
+                                      max_concurrent_processes + 1)
+        self.progress = progress
+        self.metrics_log = metrics_log
+        self.report_interval = report_interval
+        self.poll_interval = poll_interval
+        self.metrics = None
+        self.stopped = threading.Event()
+
+    def scan_directory(self, directory: Union[str, Path], shard_index: int = 0, shard_count: int = 1) -> dict:
+        """Like `ImportTracker.dump_for_directory`, returns the final metrics."""
+        directory = Path(directory)
+        filenames = (filename for filename in directory.glob('**/*.py')
+                     if shard_count == 1 or get_shard(filename.relative_to(directory), shard_count) == shard_index)
+        return self.scan_filenames(filenames, prune_directory=directory)
+
+    def scan_filenames(self, filenames: Iterable[Union[str, Path]],
+                       prune_directory: Optional[Union[str, Path]] = None) -> dict:
+        """Scans `filenames`, which may be a lazy iterable, and returns the final metrics.
+
+        With `prune_directory`, files of the dump inside it that were not scanned are pruned at the end.
+        """
+        tracker = self.tracker
+        with lock_dump(tracker._get_db_path()):
+            self.metrics = ScanMetrics()
+            self.stopped.clear()
+            writer = tracker._get_writer()
+            static_only = set() if tracker.probe_engine == STATIC else writer.get_code_strs(STATIC)
+            already_traversed = writer.get_code_strs() - static_only
+            files = queue.Queue(self.queue_size)
+            analyses = queue.Queue(self.queue_size)
+            parsing = threading.BoundedSemaphore(self.queue_size)
+            scanned = set()
+            # The workers are all started before the threads, so they are not forked from a threaded process.
+            with ParsingPool(tracker.parsing_processes, chunksize=1) as parsing_pool, \
+                    make_prober(tracker, tracker.probe_engine, self.max_concurrent_processes) as raw_prober:
+                parsing_pool.start()
+                prober = MeteredProber(raw_prober, self.metrics)
+                threads = [
+                    threading.Thread(target=self._discover, args=(filenames, dict(writer.filenames), files, scanned),
+                                     daemon=True),
+                    threading.Thread(target=self._parse, args=(parsing_pool, files, analyses, parsing), daemon=True),
+                ]
+                for thread in threads:
+                    thread.start()
+                try:
+                    self._write_until_parsed(analyses, parsing, already_traversed, prober, files)
+                finally:
+                    # Unblocks the threads, terminating the parsing pool on an error waits for the one feeding it.
+                    self.stopped.set()
+                for thread in threads:
+                    thread.join()
+                for code_str in sorted(static_only - set(already_traversed)):
+                    already_traversed.add(code_str)
+                    tracker._submit_probe(prober, code_str)
+                    self._wait_for_probes(prober)
+                self._store_probe_results(prober.finish())
+                while tracker._retries:
+                    time.sleep(max(tracker._retries[0][0] - time.monotonic(), 0))
+                    tracker._submit_due_retries(prober)
+                    self._store_probe_results(prober.finish())
+            if prune_directory is not None:
+                tracker.prune_deleted_files(prune_directory, scanned)
+                writer.insert_scanned_directory(prune_directory)
+            tracker.flush()
+            return self._report('done', prober, files, analyses)
+
+    def _put(self, items: queue.Queue, item):
+        """Blocks while `items` is full, unless the scan is stopped; returns whether the item was queued."""
+        while not self.stopped.is_set():
+            try:
+                items.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, items: queue.Queue):
+        while not self.stopped.is_set():
+            try:
+                return items.get(timeout=self.poll_interval)
+            except queue.Empty:
+                pass
+        return DONE
+
+    def _discover(self, filenames, file_states, files: queue.Queue, scanned: set):
+        try:
+            for filename in filenames:
+                start = time.perf_counter()
+                filename = str(filename)
+                scanned.add(filename)
+                file_stat = get_file_stat(filename)
+                unchanged = is_unchanged(file_states.get(filename), file_stat)
+                self.metrics.observe('discover', time.perf_counter() - start)
+                self.metrics.count('files_discovered')
+                if unchanged:
+                    self.metrics.count('files_skipped')
+                elif not self._put(files, (filename, file_stat)):
+                    return
+        except Exception as e:
+            self._put(files, e)
+        self._put(files, DONE)
+
+    def _parse(self, parsing_pool: ParsingPool, files: queue.Queue, analyses: queue.Queue,
+               parsing: threading.BoundedSemaphore):
+        file_stats = {}
+
+        def to_parse():
+            # Runs on the thread of the pool feeding its workers, which stops here while `queue_size` files are
+            # parsed or waiting to be written.
+            while True:
+                item = self._get(files)
+                if item is DONE:
+                    return
+                if isinstance(item, Exception):
+                    self._put(analyses, item)
+                    return
+                while not parsing.acquire(timeout=self.poll_interval):
+                    if self.stopped.is_set():
+                        return
+                filename, file_stats[filename] = item
+                yield filename
+
+        try:
+            for analysis, seconds in parsing_pool.analyze(to_parse(), task=timed_analyze_file):
+                self.metrics.observe('parse', seconds)
+                self.metrics.count('files_parsed')
+                if not self._put(analyses, (analysis, file_stats.pop(analysis.filename))):
+                    return
+        except Exception as e:
+            self._put(analyses, e)
+        self._put(analyses, DONE)
+
+    def _write_until_parsed(self, analyses: queue.Queue, parsing: threading.BoundedSemaphore, already_traversed,
+                            prober: MeteredProber, files: queue.Queue):
+        last_report = time.monotonic()
+        while True:
+            try:
+                item = analyses.get(timeout=self.poll_interval)
+            except queue.Empty:
+                item = None
+            if item is DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            if item is not None:
+                parsing.release()
+                self._write(*item, already_traversed, prober)
+            self._store_probe_results(prober.completed())
+            self.tracker._submit_due_retries(prober)
+            self._wait_for_probes(prober)
+            if time.monotonic() - last_report >= self.report_interval:
+                self._report('progress', prober, files, analyses)
+                last_report = time.monotonic()
+
+    def _write(self, analysis, file_stat, already_traversed, prober: MeteredProber):
+        start = time.perf_counter()
+        for code_str in self.tracker._store_file_analysis(analysis, already_traversed, *file_stat):
+            self.tracker._submit_probe(prober, code_str)
+        self.metrics.observe('write', time.perf_counter() - start)
+        self.metrics.count('files_written')
+
+    def _store_probe_results(self, results):
+        results = list(results)
+        if results:
+            start = time.perf_counter()
+            self.tracker._store_probe_results(results)
+            self.metrics.observe('store_probe_results', time.perf_counter() - start)
+
+    def _wait_for_probes(self, prober: MeteredProber):
+        while prober.in_flight >= self.max_pending_probes:
+            results = list(prober.completed())
+            if results:
+                self._store_probe_results(results)
+            else:
+                time.sleep(self.poll_interval)
+
+    def _report(self, event: str, prober: MeteredProber, files: queue.Queue, analyses: queue.Queue):
+        snapshot = self.metrics.snapshot(event=event, probes_in_flight=prober.in_flight,
+                                         queue_depths={'files': files.qsize(), 'analyses': analyses.qsize()})
+        if self.progress is not None:
+            self.progress(snapshot)
+        if self.metrics_log is not None:
+            with open(self.metrics_log, 'a') as out_file:
+                out_file.write(json.dumps(snapshot) + '\n')
+        return snapshot
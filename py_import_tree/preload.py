@@ -0,0 +1,122 @@
+import builtins
+import importlib.util
+import sys
+import warnings
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from py_import_tree.import_cost import ImportTimer
+
+# Importing these has visible side effects (opening a browser, printing, touching the terminal) or drags in large
+# optional parts of the standard library, so they are never preloaded.
+STDLIB_PRELOAD_EXCLUDE = {'antigravity', 'this', 'idlelib', 'tkinter', 'turtle', 'turtledemo', 'readline',
+                          'distutils', 'lib2to3', 'test', 'ensurepip', 'pydoc_data'}
+
+
+def resolve_import_name(name, globals_dict, level):
+    if level == 0:
+        return name
+    if not globals_dict:
+        return None
+    package = globals_dict.get('__package__')
+    if package is None:
+        package = globals_dict.get('__name__', '')
+        if '__path__' not in globals_dict:
+            package = package.rpartition('.')[0]
+    try:
+        return importlib.util.resolve_name('.' * level + name, package)
+    except (ImportError, ValueError):
+        return None
+
+
+def with_parents(module_name):
+    parts = module_name.split('.')
+    return ['.'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+class ImportRecorder:
+    """Wraps `builtins.__import__` and records every module requested while active.
+
+    Unlike diffing `sys.modules`, this also sees modules that are already imported. With `track_edges`, it also
+    records which modules were requested or newly loaded while each module was being imported.
+    """
+
+    def __init__(self, track_edges=False):
+        self.track_edges = track_edges
+        self.requested = set()
+        self.edges = defaultdict(set)
+        self.stack = []
+        self.original_import = None
+
+    def __enter__(self):
+        self.original_import = builtins.__import__
+        builtins.__import__ = self._import
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        builtins.__import__ = self.original_import
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        absolute_name = resolve_import_name(name, globals, level)
+        if absolute_name is None:
+            return self.original_import(name, globals, locals, fromlist, level)
+        modules_count = len(sys.modules)
+        if absolute_name in sys.modules and fromlist:
+            # `from package import submodule` on an already imported package only loads the submodules.
+            owners = [f'{absolute_name}.{attr}' for attr in fromlist]
+        else:
+            owners = [absolute_name]
+        self.stack.append(owners)
+        try:
+            module = self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            self.stack.pop()
+        requested = [absolute_name] + [f'{absolute_name}.{attr}' for attr in fromlist or ()
+                                       if f'{absolute_name}.{attr}' in sys.modules]
+        self.requested.update(requested)
+        if self.track_edges:
+            for parent in (self.stack[-1] if self.stack else ()):
+                self.edges[parent].update(requested)
+            if len(sys.modules) > modules_count:
+                new_modules = list(sys.modules)[modules_count:]
+                for owner in owners:
+                    self.edges[owner].update(new_modules)
+        return module
+
+
+@dataclass
+class PreloadedModules:
+    names: Set[str]
+    edges: Dict[str, Set[str]] = field(default_factory=dict)
+    # Self time and self RSS growth of the modules loaded while preloading.
+    costs: Dict[str, Tuple[float, Optional[int]]] = field(default_factory=dict)
+
+    def closure(self, requested: Iterable[str]):
+        res = set()
+        stack = [parent for name in requested for parent in with_parents(name)]
+        while stack:
+            name = stack.pop()
+            if name in res or name not in self.names:
+                continue
+            res.add(name)
+            stack.extend(self.edges.get(name, ()))
+            stack.extend(with_parents(name))
+        return res
+
+
+def get_stdlib_preload_list(stdlib_names):
+    return sorted(name for name in stdlib_names
+                  if name.split('.')[0] not in STDLIB_PRELOAD_EXCLUDE
+                  and not any(part.startswith('_') for part in name.split('.')))
+
+
+def preload_modules(module_names: List[str], extra_modules: Optional[List[str]] = None):
+    with ImportRecorder(track_edges=True) as recorder, ImportTimer() as timer, warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for module_name in list(module_names) + list(extra_modules or []):
+            try:
+                __import__(module_name)
+            except Exception:
+                continue
+    return PreloadedModules(names=set(sys.modules), edges=dict(recorder.edges), costs=timer.costs)
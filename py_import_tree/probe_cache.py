@@ -0,0 +1,249 @@
+import ast
+import functools
+import hashlib
+import importlib.util
+import json
+import os
+import pickle
+import platform
+import sqlite3
+import sys
+import time
+import types
+from importlib import metadata
+from pathlib import Path
+from typing import Optional, Union
+
+from py_import_tree.probing import ProbeResult
+
+DEFAULT_CACHE_PATH = Path.home() / '.cache' / 'py_import_tree' / 'probe_cache.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS PROBE_CACHE (
+    code_str TEXT NOT NULL,
+    interpreter TEXT NOT NULL,
+    policy TEXT NOT NULL, --see ImportTracker.get_tracking_policy, the modules kept in the records depend on it
+    dependencies TEXT NOT NULL, --json object of distribution name -> fingerprint at probing time
+    roots TEXT NOT NULL, --json list of top-level modules that the probe imported
+    origins TEXT NOT NULL, --json object of top-level module owned by no distribution -> file it was found in
+    files TEXT NOT NULL, --json object of file of a module owned by no distribution -> fingerprint at probing time
+    records BLOB NOT NULL,
+    import_seconds REAL,
+    rss_bytes INTEGER,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (code_str, interpreter, policy)
+);
+"""
+
+# Caches created before entries were keyed by policy are dropped, their entries cannot be told apart.
+REQUIRED_COLUMNS = ['policy', 'origins', 'files']
+
+# Columns added after the first release, so existing caches can be upgraded in place.
+ADDED_COLUMNS = [('import_seconds', 'REAL'), ('rss_bytes', 'INTEGER')]
+
+
+def get_interpreter_key():
+    return f'{platform.python_implementation()}-{platform.python_version()}:{sys.prefix}'
+
+
+def get_distribution_top_level_names(dist):
+    top_level = dist.read_text('top_level.txt')
+    if top_level is not None:
+        return set(line.strip() for line in top_level.splitlines() if line.strip())
+    res = set()
+    for file in dist.files or []:
+        parts = file.parts
+        if len(parts) == 0 or parts[0].endswith(('.dist-info', '.egg-info')) or parts[0] == '..':
+            continue
+        if len(parts) > 1:
+            res.add(parts[0])
+        elif parts[0].endswith('.py'):
+            res.add(parts[0][:-len('.py')])
+    return res
+
+
+def get_environment_fingerprint():
+    """Returns the fingerprint of every installed distribution and the distribution owning each top-level module."""
+    fingerprints = {}
+    owners = {}
+    for dist in metadata.distributions():
+        name = dist.metadata['Name']
+        if name is None or name in fingerprints:
+            continue
+        dist_path = getattr(dist, '_path', None)
+        mtime = os.path.getmtime(dist_path) if dist_path is not None and os.path.exists(dist_path) else None
+        fingerprints[name] = f'{dist.version}:{mtime}'
+        for top_level_name in get_distribution_top_level_names(dist):
+            owners.setdefault(top_level_name, name)
+    return fingerprints, owners
+
+
+def get_file_fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f'{stat.st_mtime_ns}:{stat.st_size}:{stat.st_ctime_ns}'
+
+
+def get_module_origin(name):
+    """File that importing the top-level module `name` would load, found without executing anything."""
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    return None if spec is None else spec.origin
+
+
+def update_code_digest(digest, code: types.CodeType):
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            update_code_digest(digest, const)
+        else:
+            # The order of a frozenset depends on the hash seed of the process.
+            digest.update(repr(sorted(map(repr, const)) if isinstance(const, frozenset) else const).encode())
+
+
+def get_callable_fingerprint(func):
+    """Name and code of a function, so that editing it changes the fingerprint. Closure variables are not included."""
+    if func is None:
+        return None
+    if isinstance(func, functools.partial):
+        return f'partial({get_callable_fingerprint(func.func)}, {func.args!r}, {func.keywords!r})'
+    name = f"{getattr(func, '__module__', None)}.{getattr(func, '__qualname__', type(func).__qualname__)}"
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return name
+    digest = hashlib.sha256()
+    update_code_digest(digest, code)
+    return f'{name}:{digest.hexdigest()}'
+
+
+def get_requested_root(code_str):
+    try:
+        stmt = ast.parse(code_str).body[0]
+    except (SyntaxError, IndexError):
+        return None
+    if isinstance(stmt, ast.Import):
+        return stmt.names[0].name.split('.')[0]
+    if isinstance(stmt, ast.ImportFrom) and stmt.level == 0 and stmt.module is not None:
+        return stmt.module.split('.')[0]
+    return None
+
+
+class ProbeCache:
+    """Persists probe results across runs and projects that share an interpreter.
+
+    Every entry remembers the fingerprints of the distributions its modules belong to. An entry stops being valid
+    when one of them is upgraded or removed, or when a distribution is added that provides one of its top-level
+    modules. Modules that no distribution owns, e.g. those of the project itself, are checked file by file instead:
+    the entry stops being valid when one of their files changes, or when their top-level module would now be loaded
+    from another file. Other entries are unaffected. The least recently used entries are evicted once the payloads
+    exceed `max_bytes`.
+
+    Entries are keyed by the `policy` of the tracker too, since it decides which modules are recorded.
+    """
+
+    def __init__(self, path: Union[str, Path] = DEFAULT_CACHE_PATH, max_bytes: int = 256 * 1024 * 1024):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.interpreter = get_interpreter_key()
+        self.conn = sqlite3.connect(self.path)
+        existing = set(row[1] for row in self.conn.execute('PRAGMA table_info(PROBE_CACHE)'))
+        if existing and not existing.issuperset(REQUIRED_COLUMNS):
+            self.conn.execute('DROP TABLE PROBE_CACHE')
+        self.conn.executescript(SCHEMA)
+        existing = set(row[1] for row in self.conn.execute('PRAGMA table_info(PROBE_CACHE)'))
+        for col_name, col_type in ADDED_COLUMNS:
+            if col_name not in existing:
+                self.conn.execute(f'ALTER TABLE PROBE_CACHE ADD COLUMN {col_name} {col_type}')
+        self.conn.commit()
+        self.fingerprints, self.owners = get_environment_fingerprint()
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM PROBE_CACHE').fetchone()[0]
+
+    def get(self, code_str, policy: str = '') -> Optional[ProbeResult]:
+        row = self.conn.execute('SELECT dependencies, roots, origins, files, records, import_seconds, rss_bytes '
+                                'FROM PROBE_CACHE WHERE code_str = ? AND interpreter = ? AND policy = ?',
+                                (code_str, self.interpreter, policy)).fetchone()
+        if row is None:
+            return None
+        dependencies, roots, origins, files = (json.loads(value) for value in row[:4])
+        records, import_seconds, rss_bytes = row[4:]
+        # Entries cached before import costs were measured are probed again, so the costs get recorded.
+        if not self._is_valid(dependencies, roots, origins, files) or import_seconds is None:
+            self.invalidate(code_str, policy)
+            return None
+        with self.conn:
+            self.conn.execute('UPDATE PROBE_CACHE SET last_used = ? WHERE code_str = ? AND interpreter = ? '
+                              'AND policy = ?', (time.time(), code_str, self.interpreter, policy))
+        return ProbeResult(code_str, pickle.loads(records), import_seconds=import_seconds, rss_bytes=rss_bytes)
+
+    def put(self, result: ProbeResult, policy: str = ''):
+        code_str, records = result.code_str, result.records
+        roots = set(record[1].split('.')[0] for record in records)
+        requested_root = get_requested_root(code_str)
+        if requested_root is not None:
+            roots.add(requested_root)
+        dependencies = {self.owners[root]: self.fingerprints[self.owners[root]]
+                        for root in roots if root in self.owners}
+        origins = {root: get_module_origin(root) for root in roots if root not in self.owners}
+        paths = [record[2] for record in records if record[1].split('.')[0] not in self.owners] + list(origins.values())
+        files = {path: get_file_fingerprint(path) for path in paths if path is not None and os.path.isabs(path)}
+        payload = pickle.dumps(records)
+        self.invalidate(code_str, policy)
+        with self.conn:
+            self.conn.execute('INSERT INTO PROBE_CACHE'
+                              '(code_str, interpreter, policy, dependencies, roots, origins, files, records, '
+                              'import_seconds, rss_bytes, size, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                              (code_str, self.interpreter, policy, json.dumps(dependencies), json.dumps(sorted(roots)),
+                               json.dumps(origins), json.dumps(files), payload, result.import_seconds,
+                               result.rss_bytes, len(payload), time.time()))
+        self.total_bytes += len(payload)
+        self.evict()
+
+    def invalidate(self, code_str, policy: str = ''):
+        row = self.conn.execute('SELECT size FROM PROBE_CACHE WHERE code_str = ? AND interpreter = ? AND policy = ?',
+                                (code_str, self.interpreter, policy)).fetchone()
+        if row is None:
+            return
+        with self.conn:
+            self.conn.execute('DELETE FROM PROBE_CACHE WHERE code_str = ? AND interpreter = ? AND policy = ?',
+                              (code_str, self.interpreter, policy))
+        self.total_bytes -= row[0]
+
+    def evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        to_delete = []
+        for *key, size in self.conn.execute('SELECT code_str, interpreter, policy, size FROM PROBE_CACHE '
+                                            'ORDER BY last_used'):
+            if self.total_bytes <= self.max_bytes:
+                break
+            to_delete.append(key)
+            self.total_bytes -= size
+        with self.conn:
+            self.conn.executemany('DELETE FROM PROBE_CACHE WHERE code_str = ? AND interpreter = ? AND policy = ?',
+                                  to_delete)
+
+    def close(self):
+        self.conn.close()
+
+    def _is_valid(self, dependencies, roots, origins, files):
+        for name, fingerprint in dependencies.items():
+            if self.fingerprints.get(name) != fingerprint:
+                return False
+        for root in roots:
+            owner = self.owners.get(root)
+            if owner is not None and owner not in dependencies:
+                return False
+        for root, origin in origins.items():
+            if get_module_origin(root) != origin:
+                return False
+        for path, fingerprint in files.items():
+            if get_file_fingerprint(path) != fingerprint:
+                return False
+        return True
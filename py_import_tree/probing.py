@@ -0,0 +1,305 @@
+import os
+import pickle
+import queue
+import select
+import signal
+import sys
+import time
+from dataclasses import dataclass
+from multiprocessing import Pipe, Pool, Process
+from typing import List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from py_import_tree.preload import get_stdlib_preload_list, preload_modules
+
+_worker_tracker = None
+
+
+@dataclass
+class ProbeResult:
+    code_str: str
+    records: Optional[List[list]]  # None when executing the import failed
+    import_seconds: Optional[float] = None  # wall clock time of executing the statement
+    rss_bytes: Optional[int] = None  # growth of the resident set size while executing it
+    method: str = 'dynamic'  # 'static' when the modules were found by StaticProber, without executing anything
+    status: str = 'ok'  # otherwise 'error', 'memory' (MemoryError), 'timeout' or 'crashed' (no result was sent back)
+    exit_code: Optional[int] = None  # of the probe process, negative for the signal that killed it
+    error: Optional[str] = None  # traceback of the exception raised by the import
+
+    @property
+    def failed(self):
+        return self.status != 'ok'
+
+
+def failure(code_str, status, exit_code=None, error=None):
+    return ProbeResult(code_str, None, status=status, exit_code=exit_code, error=error)
+
+
+def limit_memory(limit_bytes: Optional[int]):
+    """Caps the address space of the current process, so an import allocating more raises MemoryError."""
+    if limit_bytes is None or resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit_bytes = min(limit_bytes, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, hard))
+
+
+def get_system_exit_code(e: SystemExit):
+    """Exit code of a process ending with `e`, like the interpreter's: 0 for None and 1 for a message."""
+    if e.code is None:
+        return 0
+    return e.code if isinstance(e.code, int) else 1
+
+
+def get_exit_code(wait_status):
+    if os.WIFSIGNALED(wait_status):
+        return -os.WTERMSIG(wait_status)
+    return os.WEXITSTATUS(wait_status)
+
+
+def read_until(fd, deadline: Optional[float]):
+    """Reads `fd` until EOF, or returns None when `deadline` (a `time.monotonic()` value) passes first."""
+    chunks = []
+    while True:
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        ready, _, _ = select.select([fd], [], [], timeout)
+        if not ready:
+            return None
+        chunk = os.read(fd, 1 << 16)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+
+def join_processes(processes):
+    for process in processes:
+        if process is None:
+            continue
+        process.join()
+        process.close()
+
+
+def can_fork():
+    return hasattr(os, 'fork')
+
+
+def _init_worker(tracker, preload=False):
+    global _worker_tracker
+    _worker_tracker = tracker
+    if preload:
+        stdlib_modules = get_stdlib_preload_list(tracker.stdlib_packages_set)
+        tracker.preloaded = preload_modules(stdlib_modules, tracker.preload_modules)
+
+
+def _probe(code_str):
+    # Without fork, workers are recycled after every probe, so the limit only applies to this probe.
+    limit_memory(_worker_tracker.probe_memory_limit)
+    return _worker_tracker._probe_in_current_process(code_str)
+
+
+def get_probe_process_exit_code(result: ProbeResult):
+    # A statement calling sys.exit exits the probe process with its code.
+    return result.exit_code or 0
+
+
+def _probe_and_send(tracker, code_str, conn):
+    limit_memory(tracker.probe_memory_limit)
+    result = tracker._probe_in_current_process(code_str)
+    conn.send(result)
+    conn.close()
+    sys.exit(get_probe_process_exit_code(result))
+
+
+def _probe_in_forked_child(code_str):
+    # The worker itself never executes imports, so every probe starts from the same clean module state.
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        exit_code = 1
+        try:
+            limit_memory(_worker_tracker.probe_memory_limit)
+            result = _worker_tracker._probe_in_current_process(code_str)
+            payload = pickle.dumps(result)
+            exit_code = get_probe_process_exit_code(result)
+        except BaseException:
+            payload = None
+        if payload is not None:
+            with os.fdopen(write_fd, 'wb') as out_file:
+                out_file.write(payload)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+    os.close(write_fd)
+    timeout = _worker_tracker.probe_timeout
+    try:
+        payload = read_until(read_fd, None if timeout is None else time.monotonic() + timeout)
+    finally:
+        os.close(read_fd)
+    if payload is None:
+        os.kill(pid, signal.SIGKILL)
+    exit_code = get_exit_code(os.waitpid(pid, 0)[1])
+    if payload is None:
+        return failure(code_str, 'timeout', exit_code, f'Killed after {timeout} seconds')
+    if not payload:
+        return failure(code_str, 'crashed', exit_code)
+    result = pickle.loads(payload)
+    result.exit_code = exit_code
+    return result
+
+
+class ProcessProber:
+    """Starts one Process per import statement and joins them in batches of `max_concurrent_processes`.
+
+    Processes that do not send their result within the tracker's `probe_timeout` of being started are killed.
+    """
+
+    def __init__(self, tracker, max_concurrent_processes):
+        self.tracker = tracker
+        self.max_concurrent_processes = max_concurrent_processes
+        self.processes = []
+        self.receivers = []
+        self.deadlines = []
+
+    def submit(self, code_str):
+        receiver, sender = Pipe(duplex=False)
+        p = Process(target=_probe_and_send, args=(self.tracker, code_str, sender))
+        p.start()
+        sender.close()
+        timeout = self.tracker.probe_timeout
+        self.processes.append(p)
+        self.receivers.append((code_str, receiver))
+        self.deadlines.append(None if timeout is None else time.monotonic() + timeout)
+
+    def completed(self):
+        if len(self.processes) > self.max_concurrent_processes:
+            return self.finish()
+        return []
+
+    def finish(self):
+        results = []
+        timeout = self.tracker.probe_timeout
+        for process, (code_str, receiver), deadline in zip(self.processes, self.receivers, self.deadlines):
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                if receiver.poll(remaining):
+                    result = receiver.recv()
+                else:
+                    process.kill()
+                    result = failure(code_str, 'timeout', error=f'Killed after {timeout} seconds')
+            except EOFError:
+                result = failure(code_str, 'crashed')
+            receiver.close()
+            process.join()
+            result.exit_code = process.exitcode
+            results.append(result)
+        join_processes(self.processes)
+        self.processes = []
+        self.receivers = []
+        self.deadlines = []
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.finish()
+
+
+class PoolProber:
+    """Probes import statements on a bounded pool of long-lived workers.
+
+    Each worker forks a short-lived child per probe, so the worker's own `sys.modules` never changes, and kills it
+    if it runs longer than the tracker's `probe_timeout`. Where `fork` is not available, workers are recycled after
+    every probe instead, and there is no timeout. Results are collected as they complete.
+
+    With `preload`, every worker acts as a fork server: it first imports the standard library and the tracker's
+    `preload_modules`, so each probe only pays for the modules it adds on top of them.
+    """
+
+    def __init__(self, tracker, processes, preload=False):
+        self.results = queue.Queue()
+        self.pending = 0
+        if can_fork():
+            self.task, maxtasksperchild = _probe_in_forked_child, None
+        elif preload:
+            raise ValueError('Preloading workers requires os.fork')
+        else:
+            self.task, maxtasksperchild = _probe, 1
+        self.pool = Pool(processes=processes,
+                         initializer=_init_worker,
+                         initargs=(tracker, preload),
+                         maxtasksperchild=maxtasksperchild)
+
+    def submit(self, code_str):
+        self.pending += 1
+        self.pool.apply_async(self.task, (code_str,),
+                              callback=self.results.put,
+                              error_callback=lambda e: self.results.put(failure(code_str, 'crashed', error=repr(e))))
+
+    def completed(self):
+        while self.pending > 0:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                return
+            self.pending -= 1
+            yield result
+
+    def finish(self):
+        while self.pending > 0:
+            result = self.results.get()
+            self.pending -= 1
+            yield result
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.pool.terminate()
+        self.close()
+
+
+class StaticProber:
+    """Resolves import statements from sources in the current process, see `StaticResolver`."""
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.results = []
+
+    def submit(self, code_str):
+        self.results.append(self.tracker._probe_statically(code_str))
+
+    def completed(self):
+        results, self.results = self.results, []
+        return results
+
+    finish = completed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+def make_prober(tracker, engine, max_concurrent_processes):
+    if engine == 'process':
+        return ProcessProber(tracker, max_concurrent_processes)
+    if engine == 'pool':
+        return PoolProber(tracker, max_concurrent_processes)
+    if engine == 'forkserver':
+        return PoolProber(tracker, max_concurrent_processes, preload=True)
+    if engine == 'static':
+        return StaticProber(tracker)
+    raise ValueError(f'Unknown probe engine "{engine}"')
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+# Shared by every disabled timer, entering and exiting it does nothing.
+NULL_TIMER = nullcontext()
+
+
+class Profiler:
+    """Accumulated wall time and call count of named phases, and named counters.
+
+    Phases can nest and overlap, e.g. `scan` contains `scan.write_file`, so their times do not add up to the total.
+    Phases measured in worker processes, such as `scan.parse`, are the sum of the time spent by all workers.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float, calls: int = 1):
+        with self.lock:
+            self.seconds[name] += seconds
+            self.calls[name] += calls
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'wall_seconds': time.perf_counter() - self.started,
+                'phases': {name: {'seconds': self.seconds[name], 'calls': self.calls[name]} for name in self.seconds},
+                'counters': dict(self.counters),
+            }
+
+    def report(self) -> str:
+        """A table of the phases, slowest first, followed by the counters."""
+        summary = self.to_dict()
+        wall = summary['wall_seconds']
+        lines = [f"{'phase':<32} {'calls':>9} {'seconds':>10} {'mean ms':>10} {'% wall':>7}"]
+        for name, phase in sorted(summary['phases'].items(), key=lambda item: -item[1]['seconds']):
+            mean = 1000 * phase['seconds'] / phase['calls'] if phase['calls'] else 0.
+            share = 100 * phase['seconds'] / wall if wall > 0 else 0.
+            lines.append(f"{name:<32} {phase['calls']:>9} {phase['seconds']:>10.3f} {mean:>10.3f} {share:>7.1f}")
+        lines += [f'{name:<32} {value:>9}' for name, value in sorted(summary['counters'].items())]
+        lines.append(f'wall time: {wall:.3f}s')
+        return '\n'.join(lines)
+
+
+_active: Optional[Profiler] = None
+
+
+@contextmanager
+def profile(profiler: Optional[Profiler] = None):
+    """Enables the timers and counters of the tracker and the tree while active, e.g.
+
+    with profile() as profiler:
+        tracker.dump_for_directory('.')
+    print(profiler.report())
+    """
+    global _active
+    previous, _active = _active, profiler if profiler is not None else Profiler()
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+def is_enabled():
+    return _active is not None
+
+
+def timer(name: str):
+    return _active.timer(name) if _active is not None else NULL_TIMER
+
+
+def record(name: str, seconds: float, calls: int = 1):
+    if _active is not None:
+        _active.record(name, seconds, calls)
+
+
+def count(name: str, value: int = 1):
+    if _active is not None:
+        _active.count(name, value)
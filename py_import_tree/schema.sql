@@ -1,5 +1,8 @@
 CREATE TABLE IMPORTS (
-    code_str TEXT PRIMARY KEY
+    code_str TEXT PRIMARY KEY,
+    import_seconds REAL, --wall clock time of executing the statement in a fresh probe
+    rss_bytes INTEGER, --growth of the resident set size while executing it
+    method TEXT --'dynamic' (or NULL) when the statement was executed, 'static' when its modules were found from sources
 );
 
 CREATE TABLE IMPORT_DATA (
@@ -9,11 +12,18 @@ CREATE TABLE IMPORT_DATA (
     path TEXT,
     version TEXT,
     code_str TEXT NOT NULL,
+    self_seconds REAL, --time spent loading this module, excluding the modules it imported
+    self_rss_bytes INTEGER, --resident set size growth while loading it, excluding the modules it imported
+    method TEXT, --see IMPORTS.method, a statement resolved statically and then executed has rows of both methods
     FOREIGN KEY(code_str) REFERENCES IMPORTS(code_str)
 );
 
 CREATE TABLE FILENAMES (
-    path TEXT PRIMARY KEY
+    path TEXT PRIMARY KEY,
+    content_hash TEXT, --sha256 of the source, used to skip unchanged files on re-scan
+    mtime REAL,
+    size INTEGER, --in bytes
+    ctime REAL --inode change time, a file is only skipped without reading it when mtime, size and ctime match
 );
 
 CREATE TABLE DEFINITIONS (
@@ -34,10 +44,13 @@ CREATE TABLE DEFINITIONS_TO_IMPORTS (
     FOREIGN KEY (import_code_str) REFERENCES IMPORTS(code_str)
 );
 
+-- PROBE_FAILURES is created by storage.migrate, see storage.ADDED_TABLES.
+
 CREATE TABLE FILENAMES_TO_IMPORTS (
     id INTEGER PRIMARY KEY,
     filename_path TEXT NOT NULL ,
     import_code_str TEXT NOT NULL ,
+    module_level_uses INTEGER , --uses of the imported name outside of any function or class, i.e. at import time
     FOREIGN KEY (filename_path) REFERENCES FILENAMES(path),
     FOREIGN KEY (import_code_str) REFERENCES IMPORTS(code_str)
 );
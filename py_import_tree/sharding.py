@@ -0,0 +1,141 @@
+import zlib
+from pathlib import Path
+from typing import List, Optional, Union
+
+from py_import_tree.storage import IMPORTS_UPSERT, connect, lock_dump
+
+
+def get_shard(relative_path: Union[str, Path], shard_count: int) -> int:
+    """Shard of a file, from its path relative to the scanned directory so that every machine agrees on it."""
+    return zlib.crc32(Path(relative_path).as_posix().encode()) % shard_count
+
+
+# Files of the shard replace those of the merged dump, so merging the same shard again changes nothing. The path of
+# every file of the shard in the merged dump is in temp.SHARD_PATHS.
+DELETE_REPLACED_FILES = [
+    """
+DELETE FROM main.DEFINITIONS_TO_IMPORTS WHERE definition_id IN (
+    SELECT id FROM main.DEFINITIONS WHERE filename_path IN (SELECT merged_path FROM temp.SHARD_PATHS))""",
+    'DELETE FROM main.DEFINITIONS WHERE filename_path IN (SELECT merged_path FROM temp.SHARD_PATHS)',
+    'DELETE FROM main.FILENAMES_TO_IMPORTS WHERE filename_path IN (SELECT merged_path FROM temp.SHARD_PATHS)',
+    'DELETE FROM main.FILENAMES WHERE path IN (SELECT merged_path FROM temp.SHARD_PATHS)',
+]
+
+# Definition ids are shifted past those of the merged dump, the other ids are assigned by SQLite.
+COPY_FILES = [
+    """
+INSERT INTO main.FILENAMES(path, content_hash, mtime, size, ctime)
+SELECT p.merged_path, f.content_hash, f.mtime, f.size, f.ctime
+FROM shard.FILENAMES f JOIN temp.SHARD_PATHS p ON p.path = f.path""",
+    """
+INSERT INTO main.DEFINITIONS(id, type, name, start_no, end_no, filename_path)
+SELECT d.id + :offset, d.type, d.name, d.start_no, d.end_no, p.merged_path
+FROM shard.DEFINITIONS d JOIN temp.SHARD_PATHS p ON p.path = d.filename_path ORDER BY d.id""",
+    """
+INSERT INTO main.DEFINITIONS_TO_IMPORTS(definition_id, import_code_str)
+SELECT definition_id + :offset, import_code_str FROM shard.DEFINITIONS_TO_IMPORTS ORDER BY id""",
+    """
+INSERT INTO main.FILENAMES_TO_IMPORTS(filename_path, import_code_str, module_level_uses)
+SELECT p.merged_path, fti.import_code_str, fti.module_level_uses
+FROM shard.FILENAMES_TO_IMPORTS fti JOIN temp.SHARD_PATHS p ON p.path = fti.filename_path ORDER BY fti.id""",
+]
+
+# A statement probed by several shards keeps the records of the first shard for every method. As in a single dump,
+# an executed result replaces a static one in IMPORTS. Failures keep the last shard's reason and add up attempts.
+COPY_IMPORTS = [
+    """
+INSERT INTO main.IMPORT_DATA(root, module, path, version, code_str, self_seconds, self_rss_bytes, method)
+SELECT d.root, d.module, d.path, d.version, d.code_str, d.self_seconds, d.self_rss_bytes, d.method
+FROM shard.IMPORT_DATA d
+WHERE NOT EXISTS (SELECT 1 FROM main.IMPORT_DATA m WHERE m.code_str = d.code_str
+                  AND COALESCE(m.method, 'dynamic') = COALESCE(d.method, 'dynamic'))
+ORDER BY d.id""",
+    f"""
+INSERT INTO main.IMPORTS(code_str, import_seconds, rss_bytes, method)
+SELECT code_str, import_seconds, rss_bytes, COALESCE(method, 'dynamic') FROM shard.IMPORTS WHERE true
+{IMPORTS_UPSERT}""",
+    """
+INSERT INTO main.PROBE_FAILURES(code_str, method, status, exit_code, error, attempts, last_attempt)
+SELECT code_str, method, status, exit_code, error, attempts, last_attempt FROM shard.PROBE_FAILURES WHERE true
+ON CONFLICT(code_str) DO UPDATE SET method = excluded.method, status = excluded.status,
+    exit_code = excluded.exit_code, error = excluded.error, attempts = PROBE_FAILURES.attempts + excluded.attempts,
+    last_attempt = MAX(PROBE_FAILURES.last_attempt, excluded.last_attempt)""",
+]
+
+
+def get_merged_path(path: str, shard_root: Optional[str], root: Optional[Union[str, Path]]):
+    if root is None:
+        return path
+    try:
+        return str(Path(root) / Path(path).relative_to(shard_root))
+    except ValueError:
+        return path
+
+
+def get_shard_root(conn, shard_directory):
+    roots = [row[0] for row in conn.execute('SELECT path FROM shard.SCANNED_DIRECTORIES')]
+    if len(roots) != 1:
+        raise ValueError(f'Cannot move the files of {shard_directory} under a new root: it scanned {len(roots)} '
+                         f'directories instead of one')
+    return roots[0]
+
+
+def merge_dumps(output_directory: Union[str, Path], shard_directories: List[Union[str, Path]],
+                root: Optional[Union[str, Path]] = None):
+    """Merges the dumps written by `dump_for_directory(..., shard_index=i, shard_count=n)` into one dump.
+
+    Shards can be merged into a dump that already has results, e.g. to add the shards of another scan: the files of
+    every shard replace the same files of the dump, so a file scanned by several shards keeps its last version.
+
+    Paths are kept as the shards stored them, which depend on where each one was scanned from. With `root`, the files
+    of every shard are moved from the directory it scanned to `root` instead, so that shards scanned from checkouts
+    at different paths, e.g. on different machines, line up.
+    """
+    output_directory = Path(output_directory)
+    output_directory.mkdir(exist_ok=True)
+    db_path = output_directory / 'modules.db'
+    with lock_dump(db_path):
+        conn = connect(db_path)
+        try:
+            for shard_directory in shard_directories:
+                shard_path = Path(shard_directory) / 'modules.db'
+                if not shard_path.is_file():
+                    raise FileNotFoundError(f'No dump found in {shard_directory}')
+                print(f'Merging {shard_path} ...')
+                # Upgrades shards written by older versions, so that they have every merged column.
+                connect(shard_path).close()
+                conn.execute('ATTACH DATABASE ? AS shard', (str(shard_path),))
+                try:
+                    shard_root = get_shard_root(conn, shard_directory) if root is not None else None
+                    merge_shard(conn, shard_root, root)
+                finally:
+                    conn.execute('DETACH DATABASE shard')
+            with conn:
+                # A statement that failed in a shard and was probed by another one did not fail for good.
+                conn.execute('DELETE FROM PROBE_FAILURES WHERE code_str IN (SELECT code_str FROM IMPORTS)')
+        finally:
+            conn.close()
+
+
+def merge_shard(conn, shard_root: Optional[str] = None, root: Optional[Union[str, Path]] = None):
+    with conn:
+        conn.execute('DROP TABLE IF EXISTS temp.SHARD_PATHS')
+        conn.execute('CREATE TEMP TABLE SHARD_PATHS (path TEXT PRIMARY KEY, merged_path TEXT NOT NULL)')
+        conn.executemany('INSERT INTO temp.SHARD_PATHS VALUES (?, ?)',
+                         [(path, get_merged_path(path, shard_root, root))
+                          for path, in conn.execute('SELECT path FROM shard.FILENAMES')])
+        if root is None:
+            conn.execute('INSERT INTO main.SCANNED_DIRECTORIES(path, last_scan) '
+                         'SELECT path, last_scan FROM shard.SCANNED_DIRECTORIES WHERE true '
+                         'ON CONFLICT(path) DO UPDATE SET last_scan = MAX(last_scan, excluded.last_scan)')
+        else:
+            conn.execute('INSERT INTO main.SCANNED_DIRECTORIES(path, last_scan) '
+                         'SELECT ?, MAX(last_scan) FROM shard.SCANNED_DIRECTORIES WHERE true '
+                         'ON CONFLICT(path) DO UPDATE SET last_scan = MAX(last_scan, excluded.last_scan)', (str(root),))
+        for query in DELETE_REPLACED_FILES:
+            conn.execute(query)
+        offset = conn.execute('SELECT COALESCE(MAX(id), 0) FROM main.DEFINITIONS').fetchone()[0]
+        for query in COPY_FILES:
+            conn.execute(query, {'offset': offset})
+        for query in COPY_IMPORTS:
+            conn.execute(query)
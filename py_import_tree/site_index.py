@@ -0,0 +1,250 @@
+import csv
+import hashlib
+import os
+import pickle
+import site
+import stat
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Union
+
+import pandas as pd
+
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'py_import_tree' / 'site_index'
+
+# site-packages path -> {dist-info directory name: (mtime_ns, path to package dict, package weight)}
+_memo = {}
+# tuple of site-packages paths -> (state of every distribution, package_name_resolver, plain dict of package weights)
+_merged_memo = {}
+
+
+def read_child_files_of_package(child, package_name, version):
+    return {str(module_path.resolve()): (package_name, version) for module_path in
+            (child.parent / package_name).glob('**/*')}
+
+
+def read_installed_files(child, package_name, version):
+    res = {}
+    path = child / 'installed-files.txt'
+    if not path.exists():
+        return res
+    with open(path) as installed_file:
+        for file in installed_file:
+            file_path = str((child / file).resolve())
+            res[file_path] = package_name, version
+    return res
+
+
+def get_dict_for_package_dist_info(child):
+    res = {}
+    site_packages_path = child.parent
+    package_name, version = child.stem.split('-', 1)
+    records = pd.read_csv(child / 'RECORD', names=['filename', 'meta0', 'meta1'], header=None)
+    for filename in records['filename']:
+        file_path = str((site_packages_path / filename).resolve())
+        res[file_path] = package_name, version
+    res.update(read_child_files_of_package(child, package_name, version))
+    return res
+
+
+def get_dict_for_package_egg_info(child):
+    package_name, version = child.stem.split('-', 1)
+    res = read_installed_files(child, package_name, version)
+    res.update(read_child_files_of_package(child, package_name, version))
+    return res
+
+
+def get_package_weight(dct):
+    total = 0
+    for file in dct:
+        if os.path.exists(file):
+            total += os.path.getsize(file)
+    return total
+
+
+def scan_package_files(package_dir):
+    """Walks `package_dir` like `Path.glob('**/*')` and returns the resolved paths of its entries.
+
+    Returns `(sizes, plain_paths)`: the size of every resolved path (None if it does not exist) and the resolved paths
+    that are not symbolic links. Every entry is stat'ed once.
+    """
+    sizes = {}
+    plain_paths = set()
+    if not os.path.isdir(package_dir):
+        return sizes, plain_paths
+    stack = [(str(package_dir), os.path.realpath(package_dir))]
+    while stack:
+        dir_path, resolved_dir = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            is_symlink = entry.is_symlink()
+            if is_symlink:
+                resolved = os.path.realpath(entry.path)
+            else:
+                resolved = os.path.join(resolved_dir, entry.name)
+                plain_paths.add(resolved)
+            try:
+                sizes[resolved] = entry.stat().st_size
+            except OSError:
+                sizes[resolved] = None
+            if not is_symlink and entry.is_dir():
+                stack.append((entry.path, resolved))
+    return sizes, plain_paths
+
+
+def resolve_and_stat(path, resolved_dirs, sizes, plain_paths):
+    dir_name, base_name = os.path.split(path)
+    resolved_dir = resolved_dirs.get(dir_name)
+    if resolved_dir is None:
+        resolved_dir = resolved_dirs[dir_name] = os.path.realpath(dir_name)
+    resolved = os.path.join(resolved_dir, base_name)
+    if resolved in plain_paths:
+        return resolved
+    try:
+        st = os.lstat(resolved)
+    except OSError:
+        sizes.setdefault(resolved, None)
+        return resolved
+    if stat.S_ISLNK(st.st_mode):
+        resolved = os.path.realpath(resolved)
+        if resolved not in sizes:
+            sizes[resolved] = os.path.getsize(resolved) if os.path.exists(resolved) else None
+    else:
+        sizes[resolved] = st.st_size
+    return resolved
+
+
+def read_record_paths(child):
+    with open(child / 'RECORD', newline='') as record_file:
+        for row in csv.reader(record_file):
+            if len(row) > 0 and row[0]:
+                yield str(child.parent / row[0])
+
+
+def index_distribution(child):
+    """Single pass equivalent of `get_dict_for_package_*` followed by `get_package_weight`."""
+    package_name, version = child.stem.split('-', 1)
+    sizes, plain_paths = scan_package_files(child.parent / package_name)
+    scanned = list(sizes)
+    dct = {}
+    if child.suffix == '.dist-info':
+        resolved_dirs = {}
+        for path in read_record_paths(child):
+            dct[resolve_and_stat(path, resolved_dirs, sizes, plain_paths)] = package_name, version
+    elif child.suffix == '.egg-info':
+        dct = read_installed_files(child, package_name, version)
+        for file in dct:
+            if file not in sizes:
+                sizes[file] = os.path.getsize(file) if os.path.exists(file) else None
+    for resolved in scanned:
+        dct[resolved] = package_name, version
+    weight = sum(sizes[file] for file in dct if sizes.get(file) is not None)
+    return dct, weight
+
+
+def get_distribution_dirs(site_packages_path: Path):
+    return [child for child in site_packages_path.iterdir() if child.suffix in {'.dist-info', '.egg-info'}]
+
+
+def get_cache_path(cache_dir: Path, site_packages_path: Path):
+    key = hashlib.sha1(str(site_packages_path.resolve()).encode('utf-8')).hexdigest()
+    return cache_dir / f'{key}.pkl'
+
+
+def load_cached_index(site_packages_path: Path, cache_dir: Optional[Path]):
+    key = str(site_packages_path)
+    if key in _memo:
+        return _memo[key]
+    entries = {}
+    if cache_dir is not None:
+        cache_path = get_cache_path(cache_dir, site_packages_path)
+        if cache_path.exists():
+            try:
+                with open(cache_path, 'rb') as in_file:
+                    entries = pickle.load(in_file)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                entries = {}
+    _memo[key] = entries
+    return entries
+
+
+def save_cached_index(site_packages_path: Path, cache_dir: Optional[Path], entries):
+    if cache_dir is None:
+        return
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache_path = get_cache_path(cache_dir, site_packages_path)
+    tmp_path = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as out_file:
+        pickle.dump(entries, out_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+
+
+def refresh_index(site_packages_path: Path, children, cache_dir: Optional[Path], workers: int = 1):
+    """Re-indexes only the distributions whose directory mtime changed since they were last indexed."""
+    entries = load_cached_index(site_packages_path, cache_dir)
+    state = {child.name: child.stat().st_mtime_ns for child in children}
+    changed = False
+    for name in list(entries):
+        if name not in state:
+            del entries[name]
+            changed = True
+    to_index = [child for child in children
+                if child.name not in entries or entries[child.name][0] != state[child.name]]
+    if workers > 1 and len(to_index) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(index_distribution, to_index))
+    else:
+        results = [index_distribution(child) for child in to_index]
+    for child, (dct, weight) in zip(to_index, results):
+        entries[child.name] = (state[child.name], dct, weight)
+        changed = True
+    if changed:
+        save_cached_index(site_packages_path, cache_dir, entries)
+    return entries, state
+
+
+def get_absolute_path_to_package_and_version_dict(site_packages: Optional[List[Union[str, Path]]] = None,
+                                                   cache_dir: Optional[Union[str, Path]] = DEFAULT_CACHE_DIR,
+                                                   workers: Optional[int] = None):
+    """Returns the distribution and version of every installed file, and the weight of every distribution.
+
+    Both are memoized per process. The file dict is shared by every caller and must not be modified, the weight
+    dict is a new defaultdict on every call, since looking up a missing key inserts it.
+    """
+    if site_packages is None:
+        site_packages = site.getsitepackages() + [site.getusersitepackages()]
+    cache_dir = Path(cache_dir) if cache_dir is not None else None
+    workers = workers if workers is not None else min(32, (os.cpu_count() or 1) * 2)
+    print(f'Indexing site-packages files ...')
+    all_entries = []
+    all_states = []
+    for site_packages_path in site_packages:
+        site_packages_path = Path(site_packages_path)
+        if not site_packages_path.exists():
+            print(site_packages_path, 'does not exist')
+            continue
+        children = get_distribution_dirs(site_packages_path)
+        entries, state = refresh_index(site_packages_path, children, cache_dir, workers)
+        all_entries.append((children, entries))
+        all_states.append((str(site_packages_path), tuple(state.items())))
+    memo_key = tuple(str(path) for path in site_packages)
+    memoized = _merged_memo.get(memo_key)
+    if memoized is not None and memoized[0] == all_states:
+        print(f'Done indexing site-packages files.')
+        return memoized[1], defaultdict(int, memoized[2])
+    package_name_resolver = {}
+    package_weight_dict = {}
+    for children, entries in all_entries:
+        for child in children:
+            _, dct, weight = entries[child.name]
+            package_name_resolver.update(dct)
+            package_name, version = child.stem.split('-', 1)
+            package_weight_dict[f'{package_name}=={version}'] = weight
+    _merged_memo[memo_key] = (all_states, package_name_resolver, package_weight_dict)
+    print(f'Done indexing site-packages files.')
+    return package_name_resolver, defaultdict(int, package_weight_dict)
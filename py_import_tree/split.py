@@ -0,0 +1,120 @@
+import heapq
+import itertools
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import PurePath
+from typing import Dict, List, Optional, Tuple
+
+from py_import_tree.what_if import WhatIfEngine
+
+OBJECTIVES = {'score', 'weight'}
+
+
+@dataclass
+class ProposedMove:
+    definition_ids: Tuple[int, ...]
+    definitions: Tuple[str, ...]
+    from_file: str
+    to_file: str
+    gain: float
+
+
+def get_split_file_name(from_file: str, index: int, taken):
+    path = PurePath(from_file)
+    while True:
+        name = str(path.with_name(f'{path.stem}_split_{index}{path.suffix}'))
+        if name not in taken:
+            return name
+        index += 1
+
+
+class SplitRecommender:
+    """Greedily splits files into new files, moving definitions with the same dependencies together.
+
+    Definitions of a file that use exactly the same dependencies form a group, and groups are the unit of a move. A
+    group can move to one of the files already split off its file, or to a new file while `new_files` lasts.
+    Candidate gains are kept in a heap. A popped candidate is re-evaluated and only applied if it is still at least
+    as good as the next best one, since moves in other files can change its gain through shared labels.
+    """
+
+    def __init__(self, engine: WhatIfEngine, new_files: int = 1, objective: str = 'score', min_gain: float = 1e-12):
+        if objective not in OBJECTIVES:
+            raise ValueError(f'Unknown objective {objective}, expected one of {sorted(OBJECTIVES)}')
+        self.engine = engine
+        self.new_files = new_files
+        self.objective = objective
+        self.min_gain = min_gain
+        self.splits: Dict[str, List[str]] = defaultdict(list)
+        self.heap = []
+        self.versions: Dict[str, int] = defaultdict(int)
+        self.counter = itertools.count()
+
+    def recommend(self, files: Optional[List[str]] = None, max_moves: Optional[int] = None) -> List[ProposedMove]:
+        """Proposed moves in the order they should be applied. Every gain assumes the previous moves were applied.
+
+        The moves are applied to the engine; call `engine.undo()` once per moved definition to revert them.
+        """
+        engine = self.engine
+        files = set(engine.files if files is None else files)
+        groups = defaultdict(list)
+        for definition, file in enumerate(engine.definition_files.tolist()):
+            if engine.files[file] in files:
+                groups[engine.files[file], engine.definition_dependencies[definition].tobytes()].append(definition)
+        groups_by_file = defaultdict(list)
+        for (file, _), definitions in groups.items():
+            groups_by_file[file].append(tuple(int(engine.definition_ids[d]) for d in definitions))
+        for file in groups_by_file:
+            self._push_candidates(file, groups_by_file[file])
+
+        res = []
+        while self.heap and (max_moves is None or len(res) < max_moves):
+            neg_gain, _, from_file, version, definition_ids, to_file = heapq.heappop(self.heap)
+            if version != self.versions[from_file]:
+                continue
+            if to_file is None and self.new_files <= 0:
+                continue
+            gain = self._get_gain(definition_ids, from_file, to_file)
+            if gain < self.min_gain:
+                continue
+            if self.heap and gain < -self.heap[0][0]:
+                self._push(gain, from_file, version, definition_ids, to_file)
+                continue
+            if to_file is None:
+                to_file = get_split_file_name(from_file, len(self.splits[from_file]) + 1, engine.file_positions)
+                self.splits[from_file].append(to_file)
+                self.new_files -= 1
+            for definition_id in definition_ids:
+                engine.apply(definition_id, to_file)
+            res.append(ProposedMove(definition_ids=definition_ids,
+                                    definitions=tuple(engine.labels[engine.definition_labels[
+                                        engine.definition_positions.get_loc(i)]] for i in definition_ids),
+                                    from_file=from_file, to_file=to_file, gain=float(gain)))
+            groups_by_file[from_file].remove(definition_ids)
+            self._push_candidates(from_file, groups_by_file[from_file])
+        return res
+
+    def _push(self, gain, from_file, version, definition_ids, to_file):
+        heapq.heappush(self.heap, (-gain, next(self.counter), from_file, version, definition_ids, to_file))
+
+    def _get_gain(self, definition_ids, from_file, to_file):
+        if to_file is None:
+            to_file = get_split_file_name(from_file, 1, self.engine.file_positions)
+        score_delta, weight_delta = self.engine.evaluate_group(definition_ids, to_file,
+                                                               with_score=self.objective == 'score')
+        return score_delta if self.objective == 'score' else -weight_delta
+
+    def _push_candidates(self, from_file, groups):
+        self.versions[from_file] += 1
+        version = self.versions[from_file]
+        # Every new file is empty, so trying one of them is enough.
+        new_file = [None] if self.new_files > 0 else []
+        for definition_ids in groups:
+            for to_file in self.splits[from_file] + new_file:
+                gain = self._get_gain(definition_ids, from_file, to_file)
+                if gain >= self.min_gain:
+                    self._push(gain, from_file, version, definition_ids, to_file)
+
+
+def recommend_splits(engine: WhatIfEngine, files: Optional[List[str]] = None, new_files: int = 1,
+                     objective: str = 'score', max_moves: Optional[int] = None) -> List[ProposedMove]:
+    return SplitRecommender(engine, new_files=new_files, objective=objective).recommend(files, max_moves)
@@ -0,0 +1,136 @@
+import ast
+import sys
+from importlib.machinery import PathFinder
+from typing import Callable, Dict, List, Optional
+
+from py_import_tree.import_key import ImportKey
+
+# How the modules of a statement were found: by executing it in a probe, or by reading sources with StaticResolver.
+DYNAMIC = 'dynamic'
+STATIC = 'static'
+
+
+def is_type_checking(test: ast.expr):
+    if isinstance(test, ast.Name):
+        return test.id == 'TYPE_CHECKING'
+    return isinstance(test, ast.Attribute) and test.attr == 'TYPE_CHECKING'
+
+
+def get_import_time_imports(source: str) -> List[ImportKey]:
+    """Imports that run when a module is imported: those at module level, in class bodies and in `if`/`try` blocks.
+
+    Function bodies and `if TYPE_CHECKING:` blocks are skipped. Both branches of `try`/`except ImportError` are kept,
+    the resolver ignores the one that cannot be found.
+    """
+    res = []
+    stack = list(reversed(ast.parse(source).body))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if getattr(node, 'module', None) != '__future__':
+                res.extend(ImportKey.from_alias(node, alias) for alias in node.names)
+            continue
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        children = node.orelse if isinstance(node, ast.If) and is_type_checking(node.test) else \
+            list(ast.iter_child_nodes(node))
+        stack.extend(child for child in reversed(children)
+                     if isinstance(child, (ast.stmt, ast.excepthandler, getattr(ast, 'match_case', ast.stmt))))
+    return res
+
+
+def get_parents(name: str):
+    """`a.b.c` -> `a`, `a.b`, `a.b.c`: importing a submodule first imports its packages."""
+    parts = name.split('.')
+    return ['.'.join(parts[:end]) for end in range(1, len(parts) + 1)]
+
+
+class StaticResolver:
+    """Finds the modules an import statement loads by reading sources, without executing anything.
+
+    Modules are located with the `PathFinder` of `sys.path`, so modules only provided by other finders on
+    `sys.meta_path`, such as some editable installs, are not found. The import time imports of every module are
+    parsed once and memoized. `should_recurse` tells whether the imports of a module are followed at all; there is
+    no need to follow the standard library, for example.
+
+    Imports made by calling `importlib.import_module` or `__import__`, or by a module `__getattr__`, are not seen.
+    """
+
+    def __init__(self, should_recurse: Callable[[str], bool] = lambda name: True):
+        self.should_recurse = should_recurse
+        self.specs = {}
+        self.imports: Dict[str, List[str]] = {}
+
+    def find_spec(self, name: str):
+        if name not in self.specs:
+            parent = name.rpartition('.')[0]
+            if not parent:
+                spec = None if name in sys.builtin_module_names else PathFinder.find_spec(name)
+            else:
+                parent_spec = self.find_spec(parent)
+                locations = parent_spec.submodule_search_locations if parent_spec is not None else None
+                spec = PathFinder.find_spec(name, list(locations)) if locations else None
+            self.specs[name] = spec
+        return self.specs[name]
+
+    def get_path(self, name: str):
+        spec = self.find_spec(name)
+        return spec.origin if spec is not None and spec.has_location else None
+
+    def get_loaded_modules(self, key: ImportKey, package: Optional[str]):
+        """Modules executing `key` in `package` loads directly, or None if a relative import cannot be resolved."""
+        if not key.is_from_import:
+            return get_parents(key.name)
+        module = key.module or ''
+        if key.level > 0:
+            if package is None:
+                return None
+            parts = package.split('.') if package else []
+            if key.level - 1 > len(parts) or (key.level - 1 == len(parts) and not module):
+                return None
+            base = parts[:len(parts) - (key.level - 1)]
+            module = '.'.join(base + ([module] if module else []))
+        res = get_parents(module)
+        if key.name != '*' and self.find_spec(f'{module}.{key.name}') is not None:
+            res.append(f'{module}.{key.name}')
+        return res
+
+    def get_direct_imports(self, name: str):
+        """Modules loaded by the import time imports of `name` itself."""
+        if name not in self.imports:
+            res = []
+            spec = self.find_spec(name)
+            path = self.get_path(name)
+            if path is not None and path.endswith('.py'):
+                package = name if spec.submodule_search_locations is not None else name.rpartition('.')[0]
+                try:
+                    with open(path, 'rb') as in_file:
+                        keys = get_import_time_imports(in_file.read())
+                except (OSError, SyntaxError, ValueError):
+                    keys = []
+                for key in keys:
+                    res.extend(self.get_loaded_modules(key, package) or [])
+            self.imports[name] = list(dict.fromkeys(res))
+        return self.imports[name]
+
+    def resolve(self, code_str: str) -> Optional[Dict[str, Optional[str]]]:
+        """Maps every module executing `code_str` would load to its file, or None if it would fail.
+
+        Like executing it outside of a package, relative imports fail, and so do imports of modules that are not
+        found. Imports within the modules that are not found are assumed to be optional.
+        """
+        key = ImportKey.from_code_str(code_str)
+        requested = self.get_loaded_modules(key, None)
+        if requested is None or any(self.find_spec(name) is None for name in get_parents(key.module or key.name)):
+            return None
+        res = {}
+        stack = requested[::-1]
+        while stack:
+            name = stack.pop()
+            if name in res or self.find_spec(name) is None:
+                continue
+            res[name] = self.get_path(name)
+            if self.should_recurse(name):
+                stack.extend(reversed(self.get_direct_imports(name)))
+        return res
+
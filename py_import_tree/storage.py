@@ -0,0 +1,290 @@
+import pickle
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Union
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+from py_import_tree import profiling
+
+SCHEMA_PATH = Path(__file__).parent / 'schema.sql'
+
+
+# Columns added after the first release, so dumps created by older versions can be upgraded in place.
+ADDED_COLUMNS = {
+    'FILENAMES': [('content_hash', 'TEXT'), ('mtime', 'REAL'), ('size', 'INTEGER'),
+                  ('ctime', 'REAL')],
+    'IMPORTS': [('import_seconds', 'REAL'), ('rss_bytes', 'INTEGER'), ('method', 'TEXT')],
+    'IMPORT_DATA': [('self_seconds', 'REAL'), ('self_rss_bytes', 'INTEGER'), ('method', 'TEXT')],
+    'FILENAMES_TO_IMPORTS': [('module_level_uses', 'INTEGER')],
+}
+
+# Tables added after the first release, created in new and existing dumps alike.
+ADDED_TABLES = {
+    'PROBE_FAILURES': """
+CREATE TABLE IF NOT EXISTS PROBE_FAILURES (
+    code_str TEXT PRIMARY KEY,
+    method TEXT NOT NULL, --see IMPORTS.method
+    status TEXT NOT NULL, --'error', 'memory', 'timeout' or 'crashed', see ProbeResult.status
+    exit_code INTEGER, --of the probe process, negative for the signal that killed it
+    error TEXT, --traceback of the exception raised by the import
+    attempts INTEGER NOT NULL, --failed probes, over all runs; the row is removed once a probe succeeds
+    last_attempt REAL NOT NULL
+)""",
+    'SCANNED_DIRECTORIES': """
+CREATE TABLE IF NOT EXISTS SCANNED_DIRECTORIES (
+    path TEXT PRIMARY KEY, --as given to dump_for_directory, the paths of its files start with it
+    last_scan REAL NOT NULL
+)""",
+}
+
+# Added tables that only writers use, dumps without them can still be read.
+WRITER_TABLES = {'SCANNED_DIRECTORIES'}
+
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS DEFINITIONS_FILENAME_PATH ON DEFINITIONS(filename_path)',
+    'CREATE INDEX IF NOT EXISTS FILENAMES_TO_IMPORTS_FILENAME_PATH ON FILENAMES_TO_IMPORTS(filename_path)',
+    # Covering indexes for the joins of DumpQuery, they replace the indexes on definition_id and code_str alone.
+    'CREATE INDEX IF NOT EXISTS DEFINITIONS_TO_IMPORTS_DEFINITION_ID_IMPORT '
+    'ON DEFINITIONS_TO_IMPORTS(definition_id, import_code_str)',
+    'CREATE INDEX IF NOT EXISTS IMPORT_DATA_CODE_STR_METHOD_PATH ON IMPORT_DATA(code_str, method, path)',
+    'DROP INDEX IF EXISTS DEFINITIONS_TO_IMPORTS_DEFINITION_ID',
+    'DROP INDEX IF EXISTS IMPORT_DATA_CODE_STR',
+]
+
+
+# Executing a statement that was resolved statically replaces the static result.
+IMPORTS_UPSERT = ("ON CONFLICT(code_str) DO UPDATE SET import_seconds = excluded.import_seconds, "
+                  "rss_bytes = excluded.rss_bytes, method = excluded.method "
+                  "WHERE excluded.method = 'dynamic' AND IMPORTS.method = 'static'")
+
+
+def try_lock(lock_file):
+    """Locks `lock_file` without waiting, returns False if another process holds the lock."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+@contextmanager
+def lock_dump(db_path: Union[str, Path]):
+    """Fails fast when another process is already writing the dump, instead of interleaving their writes."""
+    db_path = Path(db_path)
+    with open(db_path.with_name(f'{db_path.name}.lock'), 'w') as lock_file:
+        if not try_lock(lock_file):
+            raise RuntimeError(f'{db_path} is being written by another process. To scan in parallel, give every '
+                               f'shard its own output directory and merge them with sharding.merge_dumps')
+        yield
+
+
+def connect(db_path: Union[str, Path]):
+    """Opens a dump for writing, creating it, or upgrading it if it was written by an older version."""
+    db_path = Path(db_path)
+    should_init = not db_path.exists()
+    conn = sqlite3.connect(db_path)
+    if should_init:
+        with open(SCHEMA_PATH) as schema_file:
+            conn.executescript(schema_file.read())
+    migrate(conn)
+    migrate_transitive_imports(conn, db_path.parent / 'transitive_imports')
+    return conn
+
+
+def connect_read_only(db_path: Union[str, Path]):
+    """Opens a dump for reading. Only a dump written by an older version is changed, it is upgraded once first."""
+    db_path = Path(db_path)
+    if not db_path.is_file():
+        raise FileNotFoundError(f'No dump found at {db_path}')
+    uri = f'{db_path.resolve().as_uri()}?mode=ro'
+    conn = sqlite3.connect(uri, uri=True)
+    if needs_migration(conn, db_path.parent):
+        conn.close()
+        connect(db_path).close()
+        conn = sqlite3.connect(uri, uri=True)
+    return conn
+
+
+def needs_migration(conn, directory: Path):
+    tables = set(row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+    if not tables.issuperset(set(ADDED_TABLES) - WRITER_TABLES):
+        return True
+    for table_name, columns in ADDED_COLUMNS.items():
+        existing = set(row[1] for row in conn.execute(f'PRAGMA table_info({table_name})'))
+        if any(col_name not in existing for col_name, _ in columns):
+            return True
+    return (directory / 'transitive_imports').is_dir()
+
+
+def migrate(conn):
+    for query in ADDED_TABLES.values():
+        conn.execute(query)
+    for table_name, columns in ADDED_COLUMNS.items():
+        existing = set(row[1] for row in conn.execute(f'PRAGMA table_info({table_name})'))
+        for col_name, col_type in columns:
+            if col_name not in existing:
+                conn.execute(f'ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type}')
+    for query in INDEXES:
+        conn.execute(query)
+    conn.commit()
+
+
+def iter_transitive_import_pickles(directory: Path):
+    """Yields `(code_str, records)` for every file of the legacy `transitive_imports/{code_str}.pkl` layout."""
+    for child in directory.iterdir():
+        if child.suffix != '.pkl':
+            continue
+        with open(child, 'rb') as in_file:
+            records = pickle.load(in_file)
+        # The file name is not reliable for long statements, so prefer the statement stored in the records.
+        code_str = records[0][4] if len(records) > 0 else child.stem
+        yield code_str, records
+
+
+def migrate_transitive_imports(conn, directory: Path):
+    if not directory.is_dir():
+        return
+    print(f'Migrating {directory} into IMPORT_DATA ...')
+    known = set(row[0] for row in conn.execute('SELECT code_str FROM IMPORTS'))
+    with conn:
+        for code_str, records in iter_transitive_import_pickles(directory):
+            if code_str in known:
+                continue
+            known.add(code_str)
+            conn.execute('INSERT INTO IMPORTS(code_str) VALUES (?)', (code_str,))
+            conn.executemany('INSERT INTO IMPORT_DATA(root, module, path, version, code_str) VALUES (?, ?, ?, ?, ?)',
+                             [tuple(record[:4]) + (code_str,) for record in records])
+    directory.rename(directory.with_name(f'{directory.name}.migrated'))
+
+
+class DumpWriter:
+    """Buffers rows for `modules.db` and writes them with `executemany` on a single connection.
+
+    Rows are committed every `batch_size` rows and on `flush()`. Definition ids are assigned here rather than by
+    SQLite, so definitions can be batched like every other row.
+    """
+
+    def __init__(self, db_path: Union[str, Path], batch_size: int = 10000):
+        self.conn = connect(db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.batch_size = batch_size
+        self.pending = defaultdict(list)
+        self.pending_count = 0
+        self.filenames = {row[0]: row[1:] for row in
+                          self.conn.execute('SELECT path, content_hash, mtime, size, ctime FROM FILENAMES')}
+        self.next_definition_id = self.conn.execute('SELECT COALESCE(MAX(id), 0) FROM DEFINITIONS').fetchone()[0] + 1
+        self.failures = set(row[0] for row in self.conn.execute('SELECT code_str FROM PROBE_FAILURES'))
+
+    def get_file_state(self, filename):
+        return self.filenames.get(filename)
+
+    def insert_filename(self, filename, content_hash=None, mtime=None, size=None, ctime=None):
+        if filename in self.filenames:
+            raise sqlite3.IntegrityError(f'UNIQUE constraint failed: FILENAMES.path ({filename})')
+        self.filenames[filename] = content_hash, mtime, size, ctime
+        self.add('INSERT INTO FILENAMES(path, content_hash, mtime, size, ctime) VALUES (?, ?, ?, ?, ?)',
+                 (filename, content_hash, mtime, size, ctime))
+
+    def update_file_state(self, filename, content_hash, mtime, size=None, ctime=None):
+        self.filenames[filename] = content_hash, mtime, size, ctime
+        self.add('UPDATE FILENAMES SET content_hash = ?, mtime = ?, size = ?, ctime = ? WHERE path = ?',
+                 (content_hash, mtime, size, ctime, filename))
+
+    def delete_filename(self, filename):
+        """Removes a file together with its definitions and import arcs."""
+        self.flush()
+        with self.conn:
+            self.conn.execute("""
+DELETE FROM DEFINITIONS_TO_IMPORTS
+WHERE definition_id IN (SELECT id FROM DEFINITIONS WHERE filename_path = ?)""", (filename,))
+            self.conn.execute('DELETE FROM DEFINITIONS WHERE filename_path = ?', (filename,))
+            self.conn.execute('DELETE FROM FILENAMES_TO_IMPORTS WHERE filename_path = ?', (filename,))
+            self.conn.execute('DELETE FROM FILENAMES WHERE path = ?', (filename,))
+        del self.filenames[filename]
+
+    def insert_scanned_directory(self, directory):
+        self.add('INSERT INTO SCANNED_DIRECTORIES(path, last_scan) VALUES (?, ?) '
+                 'ON CONFLICT(path) DO UPDATE SET last_scan = excluded.last_scan', (str(directory), time.time()))
+
+    def insert_import(self, code_str, import_seconds=None, rss_bytes=None, method='dynamic'):
+        self.add(f'INSERT INTO IMPORTS(code_str, import_seconds, rss_bytes, method) VALUES (?, ?, ?, ?) '
+                 f'{IMPORTS_UPSERT}', (code_str, import_seconds, rss_bytes, method))
+
+    def insert_probe_failure(self, code_str, method, status, exit_code=None, error=None):
+        self.failures.add(code_str)
+        self.add('INSERT INTO PROBE_FAILURES(code_str, method, status, exit_code, error, attempts, last_attempt) '
+                 'VALUES (?, ?, ?, ?, ?, 1, ?) ON CONFLICT(code_str) DO UPDATE SET method = excluded.method, '
+                 'status = excluded.status, exit_code = excluded.exit_code, error = excluded.error, '
+                 'attempts = PROBE_FAILURES.attempts + 1, last_attempt = excluded.last_attempt',
+                 (code_str, method, status, exit_code, error, time.time()))
+
+    def delete_probe_failure(self, code_str):
+        if code_str not in self.failures:
+            return
+        # Flushing first keeps the pending failures of this statement from being inserted after the delete.
+        self.flush()
+        with self.conn:
+            self.conn.execute('DELETE FROM PROBE_FAILURES WHERE code_str = ?', (code_str,))
+        self.failures.discard(code_str)
+
+    def insert_file_import(self, filename, code_str, module_level_uses=None):
+        self.add('INSERT INTO FILENAMES_TO_IMPORTS(filename_path, import_code_str, module_level_uses) VALUES (?, ?, ?)',
+                 (filename, code_str, module_level_uses))
+
+    def insert_import_data(self, code_str, records, method='dynamic'):
+        for record in records:
+            # Records probed before import costs were measured have no self time and self RSS.
+            self_seconds, self_rss_bytes = record[5:7] if len(record) >= 7 else (None, None)
+            self.add('INSERT INTO IMPORT_DATA(root, module, path, version, code_str, self_seconds, self_rss_bytes, '
+                     'method) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     tuple(record[:4]) + (code_str, self_seconds, self_rss_bytes, method))
+
+    def get_code_strs(self, method=None):
+        """Statements already probed, or only those whose current result was found with `method`."""
+        self.flush()
+        if method is None:
+            return set(row[0] for row in self.conn.execute('SELECT code_str FROM IMPORTS'))
+        return set(row[0] for row in self.conn.execute("SELECT code_str FROM IMPORTS "
+                                                       "WHERE COALESCE(method, 'dynamic') = ?", (method,)))
+
+    def insert_definition(self, def_type, name, start_no, end_no, filename):
+        definition_id = self.next_definition_id
+        self.next_definition_id += 1
+        self.add('INSERT INTO DEFINITIONS(id, type, name, start_no, end_no, filename_path) VALUES (?, ?, ?, ?, ?, ?)',
+                 (definition_id, def_type, name, start_no, end_no, filename))
+        return definition_id
+
+    def add(self, query, row):
+        self.pending[query].append(row)
+        self.pending_count += 1
+        if self.pending_count >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending_count == 0:
+            return
+        profiling.count('sqlite.rows', self.pending_count)
+        with profiling.timer('sqlite.flush'), self.conn:
+            for query, rows in self.pending.items():
+                self.conn.executemany(query, rows)
+        self.pending = defaultdict(list)
+        self.pending_count = 0
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,210 @@
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from py_import_tree.cohesion_engine import CohesionEngine
+
+
+@dataclass
+class Move:
+    definition_id: int
+    from_file: str
+    to_file: str
+    delta: float
+
+
+def get_scores(ideal_weights, actual_weights):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.asarray(ideal_weights, dtype=np.float64) / actual_weights
+    return np.where(np.asarray(actual_weights) < 1e-4, 1., scores)
+
+
+def split_by_first(first: np.ndarray, second: np.ndarray, count: int):
+    """Groups `second` by `first` (sorted), returning one array per value of `first` in `range(count)`."""
+    bounds = np.searchsorted(first, np.arange(count + 1))
+    return [second[bounds[i]:bounds[i + 1]] for i in range(count)]
+
+
+class WhatIfEngine:
+    """Evaluates definition moves without rebuilding the `ImportTree`.
+
+    Every file keeps a counter of how many of its definitions use each dependency, so the actual weight of a file
+    changes only by the dependencies whose count drops to zero or rises from zero. A move then touches only the
+    source and destination files and the labels of the definitions inside them.
+
+    Import moves (`ImportTree.what_if_import_moves`) are not modelled: the score depends only on the imports used by
+    the definitions, so moving a module level import does not change it.
+    """
+
+    def __init__(self, engine: CohesionEngine):
+        self.definition_ids = engine.definition_ids
+        self.definition_positions = pd.Index(engine.definition_ids)
+        definitions, dependencies = engine.get_definition_dependencies()
+        n_definitions = len(engine.definition_ids)
+        self.definition_dependencies = split_by_first(definitions, dependencies, n_definitions)
+        self.dependency_weights = engine.dependency_weights
+        self.ideal_weights = np.bincount(definitions, weights=self.dependency_weights[dependencies],
+                                         minlength=n_definitions)
+
+        self.files = list(engine.files)
+        self.file_positions = {file: i for i, file in enumerate(self.files)}
+        self.definition_files = engine.definition_files.copy()
+        self.file_definitions = [set() for _ in self.files]
+        for definition, file in enumerate(self.definition_files):
+            self.file_definitions[file].add(definition)
+        self.file_counters = [{} for _ in self.files]
+        keys, counts = np.unique(self.definition_files[definitions].astype(np.int64) * max(len(engine.dependencies), 1)
+                                 + dependencies, return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            file, dependency = divmod(key, max(len(engine.dependencies), 1))
+            self.file_counters[file][dependency] = count
+        self.file_weights = np.array([self.dependency_weights[list(counter)].sum() for counter in self.file_counters],
+                                     dtype=np.float64)
+
+        self.labels = engine.labels
+        self.definition_labels = engine.definition_labels
+        # Definitions sorted by label: label `i` owns `label_order[label_starts[i]:label_starts[i] + label_sizes[i]]`.
+        self.label_order = np.argsort(self.definition_labels, kind='stable')
+        self.label_sizes = np.bincount(self.definition_labels, minlength=len(self.labels))
+        self.label_starts = np.cumsum(self.label_sizes) - self.label_sizes
+        self.definition_scores = get_scores(self.ideal_weights, self.file_weights[self.definition_files])
+        self.label_scores = self._get_label_scores(np.arange(len(self.labels)))
+        self.history: List[Move] = []
+
+    @property
+    def score(self):
+        return self.label_scores.mean() if len(self.label_scores) > 0 else np.nan
+
+    @property
+    def weight(self):
+        """Total actual weight, i.e. the sum over definitions of the weight of importing their file."""
+        return self.file_weights[self.definition_files].sum()
+
+    def get_file(self, definition_id: int):
+        return self.files[self.definition_files[self._get_position(definition_id)]]
+
+    def delta(self, definition_id: int, to_file: str):
+        """Change of the score if `definition_id` moved to `to_file`, without applying the move."""
+        return self._evaluate([self._get_position(definition_id)], to_file)[0]
+
+    def evaluate_group(self, definition_ids: Iterable[int], to_file: str, with_score: bool = True):
+        """Score and weight deltas if all `definition_ids`, which must share a file, moved to `to_file` together.
+
+        The score delta is the expensive part; with `with_score=False` it is skipped and returned as NaN.
+        """
+        score_delta, weight_delta, _ = self._evaluate([self._get_position(i) for i in definition_ids], to_file,
+                                                      with_score)
+        return score_delta, weight_delta
+
+    def score_moves(self, moves: Iterable[Tuple[int, str]]):
+        """Deltas of many independent candidate moves, each evaluated against the current state."""
+        return np.array([self.delta(definition_id, to_file) for definition_id, to_file in moves], dtype=np.float64)
+
+    def apply(self, definition_id: int, to_file: str):
+        definition = self._get_position(definition_id)
+        from_file = self.files[self.definition_files[definition]]
+        delta, _, label_scores = self._evaluate([definition], to_file)
+        self._move(definition, self._get_file_position(to_file))
+        self.label_scores[list(label_scores)] = list(label_scores.values())
+        move = Move(definition_id=definition_id, from_file=from_file, to_file=to_file, delta=delta)
+        self.history.append(move)
+        return move
+
+    def undo(self):
+        move = self.history.pop()
+        definition = self._get_position(move.definition_id)
+        _, _, label_scores = self._evaluate([definition], move.from_file)
+        self._move(definition, self.file_positions[move.from_file])
+        self.label_scores[list(label_scores)] = list(label_scores.values())
+        return move
+
+    def _get_position(self, definition_id):
+        position = self.definition_positions.get_loc(definition_id)
+        if not isinstance(position, (int, np.integer)):
+            raise KeyError(f'Definition id {definition_id} is not unique')
+        return position
+
+    def _get_file_position(self, file):
+        if file not in self.file_positions:
+            self.file_positions[file] = len(self.files)
+            self.files.append(file)
+            self.file_definitions.append(set())
+            self.file_counters.append({})
+            self.file_weights = np.append(self.file_weights, 0.)
+        return self.file_positions[file]
+
+    def _get_weights_after_move(self, definitions, from_file, to_file):
+        counts = Counter(dependency for definition in definitions
+                         for dependency in self.definition_dependencies[definition].tolist())
+        from_counter = self.file_counters[from_file]
+        to_counter = self.file_counters[to_file] if to_file is not None else {}
+        to_weight = self.file_weights[to_file] if to_file is not None else 0.
+        lost = [dependency for dependency, count in counts.items() if from_counter[dependency] == count]
+        gained = [dependency for dependency in counts if dependency not in to_counter]
+        return (self.file_weights[from_file] - self.dependency_weights[lost].sum(),
+                to_weight + self.dependency_weights[gained].sum())
+
+    def _evaluate(self, definitions, to_file, with_score=True):
+        """Returns the score delta and the weight delta of the move, and the new score of every affected label."""
+        from_file = self.definition_files[definitions[0]]
+        if any(self.definition_files[definition] != from_file for definition in definitions):
+            raise ValueError('Definitions moved together must be in the same file')
+        to_file = self.file_positions.get(to_file)
+        if to_file == from_file:
+            return 0., 0., {}
+        to_definitions = list(self.file_definitions[to_file]) if to_file is not None else []
+        from_weight, to_weight = self._get_weights_after_move(definitions, from_file, to_file)
+        previous_to_weight = self.file_weights[to_file] if to_file is not None else 0.
+        stay_count = len(self.file_definitions[from_file]) - len(definitions)
+        weight_delta = (stay_count * (from_weight - self.file_weights[from_file])
+                        + len(to_definitions) * (to_weight - previous_to_weight)
+                        + len(definitions) * (to_weight - self.file_weights[from_file]))
+        if not with_score:
+            return np.nan, weight_delta, {}
+        moved = set(definitions)
+        stay = np.fromiter((d for d in self.file_definitions[from_file] if d not in moved), dtype=np.int64)
+        arrive = np.fromiter(to_definitions + list(definitions), dtype=np.int64)
+        affected = np.concatenate([stay, arrive])
+        previous_scores = self.definition_scores[affected]
+        self.definition_scores[stay] = get_scores(self.ideal_weights[stay], from_weight)
+        self.definition_scores[arrive] = get_scores(self.ideal_weights[arrive], to_weight)
+        labels = np.unique(self.definition_labels[affected])
+        try:
+            label_scores = self._get_label_scores(labels)
+        finally:
+            self.definition_scores[affected] = previous_scores
+        score_delta = (label_scores - self.label_scores[labels]).sum() / len(self.labels)
+        return score_delta, weight_delta, dict(zip(labels.tolist(), label_scores.tolist()))
+
+    def _get_label_scores(self, labels):
+        """Lowest score of the definitions of each label in `labels`."""
+        sizes = self.label_sizes[labels]
+        if len(labels) == 0:
+            return np.zeros(0)
+        offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        members = self.label_order[np.repeat(self.label_starts[labels], sizes) + offsets]
+        return np.minimum.reduceat(self.definition_scores[members], np.cumsum(sizes) - sizes)
+
+    def _move(self, definition, to_file):
+        from_file = self.definition_files[definition]
+        if to_file == from_file:
+            return
+        from_counter, to_counter = self.file_counters[from_file], self.file_counters[to_file]
+        for dependency in self.definition_dependencies[definition].tolist():
+            from_counter[dependency] -= 1
+            if from_counter[dependency] == 0:
+                del from_counter[dependency]
+                self.file_weights[from_file] -= self.dependency_weights[dependency]
+            if dependency not in to_counter:
+                to_counter[dependency] = 0
+                self.file_weights[to_file] += self.dependency_weights[dependency]
+            to_counter[dependency] += 1
+        self.file_definitions[from_file].discard(definition)
+        self.file_definitions[to_file].add(definition)
+        self.definition_files[definition] = to_file
+        affected = list(self.file_definitions[from_file]) + list(self.file_definitions[to_file])
+        self.definition_scores[affected] = get_scores(self.ideal_weights[affected],
+                                                      self.file_weights[self.definition_files[affected]])
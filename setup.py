@@ -21,8 +21,6 @@ setup(
     classifiers=[
         "License :: OSI Approved :: MIT License",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
         "Programming Language :: Python :: 3.10",
@@ -30,11 +28,11 @@ setup(
         "Operating System :: OS Independent"
     ],
     packages=find_packages(exclude=("tests",)),
+    python_requires=">=3.8",
     include_package_data=True,
     install_requires=["pandas",
                       "numpy",
-                      "stdlib_list",
-                      "astunparse"],
+                      "stdlib_list"],
     extras_require={},
     data_files=[
         ('py_import_tree_schema', ['py_import_tree/schema.sql'])
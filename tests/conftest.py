@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from py_import_tree.cohesion import ImportTree
+
+# code_str -> paths of the modules it brings in; `pandas` also brings in `numpy`, `missing` is not installed.
+IMPORT_PATHS = {
+    'import numpy': ['/site-packages/numpy/__init__.py', '/site-packages/numpy/core.py'],
+    'import pandas': ['/site-packages/pandas/__init__.py', '/site-packages/numpy/__init__.py'],
+    'from requests import get': ['/site-packages/requests/api.py'],
+    'import empty': ['/site-packages/empty/__init__.py'],
+    'import missing': [None, '/elsewhere/missing.py'],
+}
+RESOLVER = {
+    '/site-packages/numpy/__init__.py': ('numpy', '1.0'),
+    '/site-packages/numpy/core.py': ('numpy', '1.0'),
+    '/site-packages/pandas/__init__.py': ('pandas', '2.0'),
+    '/site-packages/requests/api.py': ('requests', '2.31'),
+    '/site-packages/empty/__init__.py': ('empty', '0.1'),
+}
+WEIGHTS = {'numpy==1.0': 1000, 'pandas==2.0': 3000, 'requests==2.31': 500, 'empty==0.1': 0}
+# (type, name, file, imports used); `helper` is defined in two files, `noop` uses nothing, `c.py` only weighs 0.
+DEFINITIONS = [
+    ('FunctionDef', 'helper', 'a.py', ['import numpy']),
+    ('FunctionDef', 'frame', 'a.py', ['import pandas', 'import numpy']),
+    ('ClassDef', 'Client', 'a.py', ['from requests import get', 'import missing']),
+    ('FunctionDef', 'noop', 'a.py', []),
+    ('FunctionDef', 'helper', 'b.py', ['from requests import get']),
+    ('AsyncFunctionDef', 'fetch', 'b.py', ['from requests import get', 'import pandas']),
+    ('FunctionDef', 'nothing', 'c.py', ['import empty', 'import missing']),
+]
+
+
+def make_tree():
+    import_data = pd.DataFrame([(code_str.split()[1], path, code_str) for code_str, paths in IMPORT_PATHS.items()
+                                for path in paths], columns=['root', 'path', 'code_str'])
+    import_data['module'] = import_data['root']
+    import_data['version'] = None
+    import_data['id'] = range(1, len(import_data) + 1)
+    definitions = pd.DataFrame([(i + 1, def_type, name, 1, 2, file) for i, (def_type, name, file, _)
+                                in enumerate(DEFINITIONS)],
+                               columns=['id', 'type', 'name', 'start_no', 'end_no', 'filename_path'])
+    definitions_to_imports = pd.DataFrame([(i + 1, code_str) for i, (_, _, _, code_strs) in enumerate(DEFINITIONS)
+                                           for code_str in code_strs], columns=['definition_id', 'import_code_str'])
+    definitions_to_imports.insert(0, 'id', range(1, len(definitions_to_imports) + 1))
+    filenames_to_imports = pd.DataFrame([(file, code_str) for _, _, file, code_strs in DEFINITIONS
+                                         for code_str in code_strs],
+                                        columns=['filename_path', 'import_code_str']).drop_duplicates()
+    filenames_to_imports.insert(0, 'id', range(1, len(filenames_to_imports) + 1))
+    return ImportTree(
+        imports=pd.DataFrame({'code_str': list(IMPORT_PATHS)}),
+        import_data=import_data,
+        filenames=pd.DataFrame({'path': sorted(set(file for _, _, file, _ in DEFINITIONS))}),
+        definitions=definitions,
+        definitions_to_imports=definitions_to_imports,
+        filenames_to_imports=filenames_to_imports,
+    )
+
+
+@pytest.fixture
+def tree():
+    return make_tree()
+
+
+@pytest.fixture
+def resolver_func():
+    return lambda: (RESOLVER, WEIGHTS)
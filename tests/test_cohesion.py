@@ -0,0 +1,69 @@
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from py_import_tree.cohesion import IMPORT_DATA_CATEGORICAL_COLUMNS, compute_weight, get_dependency
+
+
+def reference_packages_df(tree, resolver_func):
+    """`ImportTree.get_packages_df` before it was vectorized, with one `groupby().apply()` per weight."""
+    full = tree.get_full_df()
+    dct, package_weight = resolver_func()
+    full['dependency'] = full['path'].astype(object).map(partial(get_dependency,
+                                                                 absolute_path_to_package_and_version_dict=dct))
+    res = pd.DataFrame({
+        'path': full['filename_path'],
+        'dependency': full['dependency'],
+        'full_definition': full['filename_path'] + ':' + full['type'] + ':' + full['name'],
+        'definition': full['type'] + ':' + full['name'],
+    })
+    res['dependency_weight'] = res['dependency'].map(package_weight)
+    ideal_weight_dict = res.groupby('full_definition').apply(compute_weight)
+    res['definition_ideal_weight'] = res['full_definition'].map(ideal_weight_dict)
+    actual_weight_dict = res.groupby('path').apply(compute_weight).to_dict()
+    res['definition_actual_weight'] = res['path'].map(actual_weight_dict)
+    res['cohesion_score'] = res['definition_ideal_weight'] / res['definition_actual_weight']
+    res.loc[res['definition_actual_weight'] < 1e-4, 'cohesion_score'] = 1.
+    res['neg_definition_actual_weight'] = -res['definition_actual_weight']
+    return res.sort_values(by=['cohesion_score', 'neg_definition_actual_weight'])
+
+
+@pytest.fixture(params=[False, True], ids=['object', 'categorical'])
+def any_tree(request, tree):
+    if request.param:
+        for col in IMPORT_DATA_CATEGORICAL_COLUMNS:
+            tree.import_data[col] = tree.import_data[col].astype('category')
+    return tree
+
+
+def test_packages_df_matches_reference(any_tree, resolver_func):
+    reference = reference_packages_df(any_tree, resolver_func)
+    packages_df = any_tree.get_packages_df(resolver_func)
+    columns = ['path', 'full_definition', 'definition', 'dependency', 'dependency_weight', 'definition_ideal_weight',
+               'definition_actual_weight', 'cohesion_score']
+    pd.testing.assert_frame_equal(packages_df[columns].reset_index(drop=True),
+                                  reference[columns].reset_index(drop=True), check_dtype=False)
+
+
+def test_score_matches_reference(any_tree, resolver_func):
+    reference = reference_packages_df(any_tree, resolver_func)
+    reference_score = reference.drop_duplicates(subset='definition')['cohesion_score'].mean()
+    assert any_tree.cohesion(resolver_func).score == pytest.approx(reference_score, rel=0, abs=1e-12)
+    assert any_tree.get_cohesion_engine(resolver_func).get_score() == pytest.approx(reference_score, rel=0, abs=1e-12)
+
+
+def test_engine_definitions_match_reference(any_tree, resolver_func):
+    reference = reference_packages_df(any_tree, resolver_func).drop_duplicates(subset='full_definition')
+    definitions_df = any_tree.get_cohesion_engine(resolver_func).get_definitions_df()
+    expected = reference.set_index('full_definition').loc[definitions_df['path'] + ':' + definitions_df['definition']]
+    for col in ['definition_ideal_weight', 'definition_actual_weight', 'cohesion_score']:
+        np.testing.assert_allclose(definitions_df[col].to_numpy(), expected[col].to_numpy(dtype=np.float64))
+
+
+def test_definitions_are_built_lazily(tree, resolver_func):
+    cohesion = tree.cohesion(resolver_func)
+    assert 'definitions' not in vars(cohesion)
+    assert cohesion.definitions is cohesion.definitions
+    assert 'definitions' not in repr(cohesion)
@@ -0,0 +1,39 @@
+import ast
+from copy import copy
+
+import pytest
+
+from py_import_tree.import_key import ImportKey
+
+astunparse = pytest.importorskip('astunparse')
+
+STATEMENTS = [
+    'import os',
+    'import os.path',
+    'import numpy as np, pandas',
+    'import a.b.c as d',
+    'from os import path',
+    'from os.path import join as path_join, sep',
+    'from . import sibling',
+    'from .. import parent as p',
+    'from ..package.module import name',
+    'from .module import (first,\n    second as other)',
+    'from __future__ import annotations',
+    'from module import *',
+]
+
+
+def iter_single_name_statements(source):
+    for stmt in ast.parse(source).body:
+        for alias in stmt.names:
+            single = copy(stmt)
+            single.names = [alias]
+            yield stmt, alias, single
+
+
+@pytest.mark.parametrize('source', STATEMENTS)
+def test_code_str_matches_astunparse(source):
+    for stmt, alias, single in iter_single_name_statements(source):
+        key = ImportKey.from_alias(stmt, alias)
+        assert key.code_str == astunparse.unparse(single).strip()
+        assert ImportKey.from_code_str(key.code_str) == key
@@ -0,0 +1,107 @@
+import ast
+import textwrap
+
+from py_import_tree.import_tracker import UsageVisitor, get_eff_name
+
+SOURCE = textwrap.dedent('''
+    import json
+    import numpy as np
+    from os import path as p, sep
+    from . import sibling
+    from collections import OrderedDict
+
+
+    def uses_alias(x):
+        return np.linalg.norm(x) + len(p.join('a', sep))
+
+
+    def uses_late():
+        return late.value, json
+
+
+    import late
+
+
+    @sibling.register
+    def decorated(x: OrderedDict = None):
+        def inner():
+            return json.dumps(x)
+        return inner
+
+
+    class Container(OrderedDict):
+        attribute = np.zeros(3)
+
+        def method(self):
+            return late, unknown_name
+
+        class Nested:
+            value = sep
+
+
+    def uses_nothing():
+        return 1
+''')
+
+
+class ReferenceDefinitionsVisitor(ast.NodeVisitor):
+    """The previous module level visitor, which collected definitions without entering them."""
+
+    def __init__(self):
+        self.imports = {}
+        self.definitions = []
+
+    def store_import(self, node):
+        for alias in node.names:
+            self.imports[get_eff_name(alias)] = node.lineno
+        self.generic_visit(node)
+
+    visit_Import = visit_ImportFrom = store_import
+
+    def visit_FunctionDef(self, node):
+        self.definitions.append(node)
+
+    visit_ClassDef = visit_FunctionDef
+
+
+class ReferenceRejectingVisitor(ast.NodeVisitor):
+    """The previous per definition visitor, which re-visited a definition to find the imported names it used."""
+
+    def __init__(self, imports):
+        self.imports = imports
+        self.used = set()
+
+    def visit_Name(self, name):
+        if name.id in self.imports and name.lineno >= self.imports[name.id]:
+            self.used.add(name.id)
+
+
+def reference_uses(root):
+    visitor = ReferenceDefinitionsVisitor()
+    visitor.visit(root)
+    res = {}
+    for definition in visitor.definitions:
+        rejecting_visitor = ReferenceRejectingVisitor(visitor.imports)
+        rejecting_visitor.visit(definition)
+        res[definition.name] = rejecting_visitor.used
+    return res
+
+
+def single_pass_uses(root):
+    visitor = UsageVisitor()
+    visitor.visit(root)
+    res = {definition.name: set() for definition in visitor.definitions}
+    for definition_idx, key, _ in visitor.get_used_imports():
+        if definition_idx is not None:
+            definition = visitor.definitions[definition_idx]
+            res[definition.name].add(key)
+    return res
+
+
+def test_single_pass_matches_per_definition_visitors():
+    root = ast.parse(SOURCE)
+    expected = reference_uses(root)
+    assert single_pass_uses(root) == expected
+    assert expected['uses_late'] == {'json'}
+    assert expected['decorated'] == {'sibling', 'OrderedDict', 'json'}
+    assert expected['Container'] == {'OrderedDict', 'np', 'late', 'sep'}
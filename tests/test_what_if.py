@@ -0,0 +1,42 @@
+import itertools
+
+import pytest
+
+from py_import_tree.what_if import WhatIfEngine
+
+
+def recompute_delta(tree, resolver_func, definition_ids, to_file):
+    moved = tree
+    for definition_id in definition_ids:
+        moved = moved.what_if_definition_id_moves(definition_id, to_file)
+    return moved.cohesion(resolver_func).score - tree.cohesion(resolver_func).score
+
+
+def test_deltas_match_recompute(tree, resolver_func):
+    engine = tree.get_what_if_engine(resolver_func)
+    moves = list(itertools.product(tree.definitions['id'], ['a.py', 'b.py', 'c.py', 'new.py']))
+    for (definition_id, to_file), delta in zip(moves, engine.score_moves(moves)):
+        assert delta == pytest.approx(recompute_delta(tree, resolver_func, [definition_id], to_file), abs=1e-12)
+
+
+def test_group_delta_matches_recompute(tree, resolver_func):
+    engine = tree.get_what_if_engine(resolver_func)
+    definition_ids = tree.definitions.loc[tree.definitions['filename_path'] == 'a.py', 'id'].tolist()[:3]
+    score_delta, weight_delta = engine.evaluate_group(definition_ids, 'new.py')
+    assert score_delta == pytest.approx(recompute_delta(tree, resolver_func, definition_ids, 'new.py'), abs=1e-12)
+    moved = tree
+    for definition_id in definition_ids:
+        moved = moved.what_if_definition_id_moves(definition_id, 'new.py')
+    assert weight_delta == pytest.approx(WhatIfEngine(moved.get_cohesion_engine(resolver_func)).weight - engine.weight)
+
+
+def test_applied_moves_match_recompute(tree, resolver_func):
+    engine = tree.get_what_if_engine(resolver_func)
+    moved = tree
+    for definition_id, to_file in [(2, 'b.py'), (5, 'new.py'), (2, 'c.py'), (7, 'a.py')]:
+        engine.apply(definition_id, to_file)
+        moved = moved.what_if_definition_id_moves(definition_id, to_file)
+        assert engine.score == pytest.approx(moved.cohesion(resolver_func).score, abs=1e-12)
+    for _ in range(4):
+        engine.undo()
+    assert engine.score == pytest.approx(tree.cohesion(resolver_func).score, abs=1e-12)